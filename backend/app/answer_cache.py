@@ -0,0 +1,240 @@
+"""
+Answer cache for repeated questions
+Support deployments see the same questions about the same PDFs over and over;
+each one otherwise costs a full retrieval plus an LLM round trip. Answers are
+keyed by sha256(canonical document id + document version + normalized
+question), so duplicate uploads share entries and re-ingesting a document
+changes its version, which retires every answer computed from the old index.
+
+Two tiers:
+  - an in-memory LRU of ANSWER_CACHE_ENTRIES answers, each living
+    ANSWER_CACHE_TTL_SECONDS
+  - an optional SQLite file (ANSWER_CACHE_PATH) that survives restarts and is
+    shared by workers on the same host; memory misses fall through to it
+Documents still being indexed lazily are not cached - their answers improve
+as page ranges are embedded.
+"""
+import os
+import re
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+import unicodedata
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from .chunk_store import chunk_store_path, legacy_chunk_store_path
+from .vector_index import vector_index_path, vector_ranges_path
+from .content_registry import content_registry
+
+logger = logging.getLogger(__name__)
+
+# Answers kept in memory (0 disables the cache)
+ANSWER_CACHE_ENTRIES = int(os.getenv("ANSWER_CACHE_ENTRIES", "2000"))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "86400"))
+# SQLite file of the persistent tier; empty keeps answers in memory only
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", "")
+# Expired rows are deleted from the persistent tier every this many writes
+PURGE_EVERY_PUTS = 200
+
+_WHITESPACE = re.compile(r"\s+")
+
+def normalize_question(question: str) -> str:
+    """Fold case, unicode forms, whitespace and trailing punctuation so trivially different phrasings match"""
+    question = unicodedata.normalize("NFKC", question).casefold()
+    return _WHITESPACE.sub(" ", question).strip().rstrip("?!. ")
+
+def document_version(document_id: str) -> Optional[str]:
+    """
+    Version of a (canonical) document's index: modification times of its chunk store and vector index
+    Returns None when the document has no index yet or is still being indexed lazily
+    """
+    if os.path.exists(vector_ranges_path(document_id)):
+        return None
+    stamps = []
+    for path in (chunk_store_path(document_id), legacy_chunk_store_path(document_id), vector_index_path(document_id)):
+        try:
+            stamps.append(os.stat(path).st_mtime_ns)
+        except FileNotFoundError:
+            continue
+    if not stamps:
+        return None
+    return "-".join(str(stamp) for stamp in stamps)
+
+def answer_key(document_id: str, version: str, question: str) -> str:
+    return hashlib.sha256(f"{document_id}\0{version}\0{normalize_question(question)}".encode("utf-8")).hexdigest()
+
+class CachedAnswer:
+    """A cached response with the sources and search mode it was generated from"""
+    def __init__(self, response: str, sources: List, search_mode: str):
+        self.response = response
+        self.sources = sources
+        self.search_mode = search_mode
+
+    def to_json(self) -> str:
+        return json.dumps({"response": self.response, "sources": self.sources, "search_mode": self.search_mode})
+
+    @classmethod
+    def from_json(cls, data: str) -> 'CachedAnswer':
+        value = json.loads(data)
+        return cls(value["response"], value["sources"], value["search_mode"])
+
+class AnswerCache:
+    """In-memory LRU with TTL, optionally backed by a SQLite file"""
+    def __init__(self, max_entries: int = ANSWER_CACHE_ENTRIES, ttl: float = ANSWER_CACHE_TTL_SECONDS,
+                 path: str = ANSWER_CACHE_PATH):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        # key -> (canonical document id, answer, expiry time)
+        self._entries: "OrderedDict[str, Tuple[str, CachedAnswer, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._puts = 0
+        self.hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @property
+    def conn(self) -> Optional[sqlite3.Connection]:
+        """Connection to the persistent tier, or None when it is not configured"""
+        if self._conn is None and self.path:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                "key TEXT PRIMARY KEY, document_id TEXT NOT NULL, answer TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_answers_document_id ON answers (document_id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_answers_expires_at ON answers (expires_at)")
+            self._conn = conn
+        return self._conn
+
+    def _key(self, document_id: str, question: str) -> Optional[Tuple[str, str]]:
+        """(canonical document id, cache key), or None if the document's answers can't be cached"""
+        canonical = content_registry.resolve(document_id)
+        version = document_version(canonical)
+        if version is None:
+            return None
+        return canonical, answer_key(canonical, version, question)
+
+    def record_bypass(self):
+        with self._lock:
+            self.bypassed += 1
+
+    def get(self, document_id: str, question: str) -> Optional[CachedAnswer]:
+        """Cached answer to a question about a document, or None (blocking)"""
+        if not self.enabled:
+            return None
+        keyed = self._key(document_id, question)
+        now = time.time()
+        with self._lock:
+            if keyed is None:
+                self.misses += 1
+                return None
+            canonical, key = keyed
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[2] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[key]
+                self.expirations += 1
+
+            conn = self.conn
+            row = conn.execute("SELECT answer, expires_at FROM answers WHERE key = ? AND expires_at > ?",
+                               (key, now)).fetchone() if conn is not None else None
+            if row is None:
+                self.misses += 1
+                return None
+            answer = CachedAnswer.from_json(row[0])
+            self._store(key, canonical, answer, row[1])
+            self.hits += 1
+            self.persistent_hits += 1
+            return answer
+
+    def put(self, document_id: str, question: str, answer: CachedAnswer):
+        """Cache an answer (blocking); ignored when the document's answers can't be cached"""
+        if not self.enabled:
+            return
+        keyed = self._key(document_id, question)
+        if keyed is None:
+            return
+        canonical, key = keyed
+        now = time.time()
+        expires_at = now + self.ttl
+        with self._lock:
+            self._store(key, canonical, answer, expires_at)
+            conn = self.conn
+            if conn is not None:
+                conn.execute("INSERT OR REPLACE INTO answers (key, document_id, answer, expires_at) VALUES (?, ?, ?, ?)",
+                             (key, canonical, answer.to_json(), expires_at))
+                self._puts += 1
+                if self._puts % PURGE_EVERY_PUTS == 0:
+                    self.expirations += conn.execute("DELETE FROM answers WHERE expires_at <= ?", (now,)).rowcount
+                conn.commit()
+
+    def _store(self, key: str, document_id: str, answer: CachedAnswer, expires_at: float):
+        self._entries[key] = (document_id, answer, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, document_id: str):
+        """Drop every answer about a document's content (after re-ingestion or deletion)"""
+        canonical = content_registry.resolve(document_id)
+        with self._lock:
+            stale = [key for key, entry in self._entries.items() if entry[0] == canonical]
+            for key in stale:
+                del self._entries[key]
+            dropped = len(stale)
+            conn = self.conn
+            if conn is not None:
+                dropped = max(dropped, conn.execute("DELETE FROM answers WHERE document_id = ?", (canonical,)).rowcount)
+                conn.commit()
+            if dropped:
+                self.invalidations += dropped
+                logger.info(f"Dropped {dropped} cached answers for document {canonical}")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "persistent": bool(self.path),
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "persistent_hits": self.persistent_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "bypassed": self.bypassed,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations
+            }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+# Global answer cache instance
+answer_cache = AnswerCache()
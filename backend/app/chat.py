@@ -1,11 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect
 from pydantic import BaseModel
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Callable, Awaitable
 import json
 import logging
 from datetime import datetime
 import asyncio
 import os
+import uuid
 
 # Optional imports for production use
 try:
@@ -30,6 +31,18 @@ except ImportError:
 
 from .auth import verify_token, UserInfo
 from .chat_history_db import chat_history_manager, ChatMessage as HistoryChatMessage, ChatSession as HistoryChatSession
+from .chunk_store import Chunk, chunk_store_path
+from .index_cache import index_cache
+from .lazy_index import lazy_indexer, lazily_indexed, index_ranges_within_budget
+from .hybrid_retrieval import (
+    HYBRID_CANDIDATES, HYBRID_KEYWORD_WEIGHT, HYBRID_VECTOR_WEIGHT,
+    HYBRID_KEYWORD_BUDGET_MS, HYBRID_VECTOR_BUDGET_MS, reciprocal_rank_fusion, run_with_budget
+)
+from .content_registry import content_registry
+from .embedders import get_embedder
+from .context_packer import pack_context, CONTEXT_CANDIDATES
+from .answer_cache import answer_cache, CachedAnswer
+from .semantic_cache import semantic_cache
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -52,12 +65,25 @@ class ChatRequest(BaseModel):
     text: str
     document_id: str
     session_id: Optional[str] = None
+    bypass_cache: bool = False  # Always ask the LLM (the fresh answer replaces any cached one)
 
 class ChatResponse(BaseModel):
     response: str
     session_id: str
     message_id: str
-    sources: List[str] = []
+    sources: List[Any] = []
+
+class LibraryQueryRequest(BaseModel):
+    text: str
+    document_ids: Optional[List[str]] = None  # None searches all of the user's documents
+    k: int = 5
+
+class LibraryQueryResponse(BaseModel):
+    response: str
+    message_id: str
+    sources: List[Any] = []
+    document_ids: List[str] = []
+    search_mode: str
 
 class ChatHistoryResponse(BaseModel):
     session_id: str
@@ -69,7 +95,7 @@ class ChatHistoryResponse(BaseModel):
 class SessionListResponse(BaseModel):
     sessions: List[Dict[str, Any]]
 
-from .openrouter_client import get_openrouter_client, is_openrouter_enabled, generate_response
+from .openrouter_client import get_openrouter_client, is_openrouter_enabled, generate_response, generate_response_stream
 
 # Initialize LLM using custom OpenRouter client
 try:
@@ -91,24 +117,12 @@ if CHROMADB_AVAILABLE:
         load_dotenv()  # Ensure environment variables are loaded
         
         chroma_client = chromadb.PersistentClient(path="./data/chromadb")
-        # Check if we can actually create embeddings (need OpenAI/OpenRouter for embeddings)
-        EMBEDDINGS_AVAILABLE = False
-        try:
-            from langchain_openai import OpenAIEmbeddings
-            import os
-            openrouter_api_key = os.getenv("OPENROUTER_API_KEY")
-            openai_api_key = os.getenv("OPENAI_API_KEY")
-            logger.info(f"Checking embeddings availability: OpenRouter key = {'Yes' if openrouter_api_key else 'No'}, OpenAI key = {'Yes' if openai_api_key else 'No'}")
-            if openrouter_api_key and openrouter_api_key != "your-openrouter-api-key":
-                EMBEDDINGS_AVAILABLE = True
-            elif openai_api_key and openai_api_key != "your-openai-api-key":
-                EMBEDDINGS_AVAILABLE = True
-        except Exception as e:
-            logger.warning(f"Error checking embeddings availability: {e}")
+        # Semantic search needs an embedder to vectorize questions the same way as the chunks
+        EMBEDDINGS_AVAILABLE = get_embedder() is not None
         
         CHROMADB_ENABLED = EMBEDDINGS_AVAILABLE
         if not EMBEDDINGS_AVAILABLE:
-            logger.info("ChromaDB available but embeddings not configured - using mock embeddings")
+            logger.info("ChromaDB available but no embedding backend configured - using mock embeddings")
     except Exception as e:
         chroma_client = None
         CHROMADB_ENABLED = False
@@ -164,6 +178,212 @@ def create_qa_chain_with_chromadb(collection):
         logger.error(f"Error creating QA chain: {e}")
         raise HTTPException(status_code=500, detail="Failed to initialize chat system")
 
+def chroma_chunks(results: Dict[str, Any]) -> List[Chunk]:
+    """
+    Build chunks from a ChromaDB query result using the page metadata stored at ingestion
+    """
+    documents = results['documents'][0]
+    metadatas = (results.get('metadatas') or [[]])[0] or [{}] * len(documents)
+    ids = (results.get('ids') or [[]])[0] or [None] * len(documents)
+    return [
+        Chunk(chunk_id, doc, (meta or {}).get("page"), (meta or {}).get("start"), (meta or {}).get("end"))
+        for chunk_id, doc, meta in zip(ids, documents, metadatas)
+    ]
+
+def chroma_sources(results: Dict[str, Any]) -> List[dict]:
+    """
+    Build source entries from a ChromaDB query result
+    """
+    return [chunk.to_source() for chunk in chroma_chunks(results)]
+
+# Library (multi-document) search: default and maximum number of merged results
+LIBRARY_TOP_K = 5
+LIBRARY_MAX_K = int(os.getenv("LIBRARY_MAX_K", "20"))
+
+class RetrievedChunk:
+    """A chunk ranked for a question, and the document it came from"""
+    def __init__(self, chunk: Chunk, score: float, document_id: str, search_mode: str):
+        self.chunk = chunk
+        self.score = score
+        self.document_id = document_id
+        self.search_mode = search_mode
+
+    def to_source(self) -> dict:
+        """Source entry labelled with its document, for answers spanning several documents"""
+        source = self.chunk.to_source()
+        source["document_id"] = self.document_id
+        source["score"] = round(self.score, 4)
+        return source
+
+def semantic_document_hits(
+    question: str,
+    document_id: str,
+    doc_index,
+    query_embedding,
+    k: int
+) -> List[RetrievedChunk]:
+    """
+    Semantic search of one document: its vector index, else its ChromaDB collection
+    Blocking - call through asyncio.to_thread from async code
+    """
+    # Semantic search over the document's memory-mapped vector index
+    if doc_index is not None and doc_index.vector_index is not None:
+        try:
+            hits = doc_index.vector_index.search(query_embedding, k=k)
+            if hits:
+                logger.info(f"Found {len(hits)} relevant chunks from the vector index")
+                return [RetrievedChunk(doc_index.store.get(i), score, document_id, "semantic") for i, score in hits]
+        except Exception as vector_e:
+            logger.info(f"Vector index search failed: {vector_e} - trying other search modes")
+    
+    # Only use ChromaDB if embeddings are configured (checked at startup) AND the collection exists
+    if CHROMADB_ENABLED and chroma_client:
+        try:
+            collection = doc_index.collection(chroma_client) if doc_index else chroma_client.get_collection(name=f"doc_{content_registry.resolve(document_id)}")
+            results = collection.query(query_embeddings=[query_embedding.tolist()], n_results=k, include=["documents", "metadatas", "distances"])
+            if results['documents'] and results['documents'][0]:
+                distances = (results.get('distances') or [[]])[0] or [0.0] * len(results['documents'][0])
+                logger.info(f"Found {len(results['documents'][0])} relevant chunks from ChromaDB")
+                # Squared L2 distance between unit vectors is 2 - 2 * cosine similarity
+                return [
+                    RetrievedChunk(chunk, 1.0 - distance / 2, document_id, "semantic")
+                    for chunk, distance in zip(chroma_chunks(results), distances)
+                ]
+        except Exception as chroma_e:
+            logger.info(f"ChromaDB collection not found or error: {chroma_e} - using mock embeddings")
+    return []
+
+def keyword_document_hits(question: str, document_id: str, doc_index, k: int) -> List[RetrievedChunk]:
+    """
+    BM25 keyword search of one document over its inverted index
+    Scores are normalized by the query's maximum score, so they compare across documents
+    Blocking - call through asyncio.to_thread from async code
+    """
+    keyword_index = doc_index.keyword_index
+    hits = keyword_index.search(question, k=k) if keyword_index else []
+    logger.info(f"Keyword index returned {len(hits)} matching chunks for document {document_id}")
+    if not hits:
+        return []
+    max_score = keyword_index.max_score(question) or 1.0
+    return [RetrievedChunk(doc_index.store.get(i), score / max_score, document_id, "keyword") for i, score in hits]
+
+def fusion_key(hit: RetrievedChunk):
+    """Identity of a chunk across the keyword and semantic rankings"""
+    return hit.document_id, hit.chunk.chunk_id or (hit.chunk.page, hit.chunk.start, hit.chunk.text)
+
+def fuse_stage_hits(
+    keyword_hits: Optional[List[RetrievedChunk]],
+    semantic_hits: Optional[List[RetrievedChunk]],
+    k: int
+) -> tuple[List[RetrievedChunk], str]:
+    """
+    Merge keyword and semantic hits into one top k with reciprocal-rank fusion
+    Each list is ranked by its own score (normalized BM25, cosine similarity), which
+    compare across documents, so hits of several documents can be fused at once
+    Returns: (hits best first, search_mode)
+    """
+    keyword_ranking = sorted(keyword_hits or [], key=lambda hit: -hit.score)
+    semantic_ranking = sorted(semantic_hits or [], key=lambda hit: -hit.score)
+    if not semantic_ranking:
+        return keyword_ranking[:k], "keyword"
+    if not keyword_ranking:
+        return semantic_ranking[:k], "semantic"
+    
+    fused = reciprocal_rank_fusion(
+        [keyword_ranking, semantic_ranking], key=fusion_key, weights=[HYBRID_KEYWORD_WEIGHT, HYBRID_VECTOR_WEIGHT]
+    )
+    return [RetrievedChunk(hit.chunk, score, hit.document_id, "hybrid") for hit, score in fused[:k]], "hybrid"
+
+async def document_stage_hits(
+    question: str,
+    document_id: str,
+    candidates: int,
+    embedding: Awaitable
+) -> tuple[Optional[List[RetrievedChunk]], Optional[List[RetrievedChunk]], bool]:
+    """
+    Run one document's keyword and semantic searches concurrently, each within its latency budget
+    Returns: (keyword_hits, semantic_hits, indexed); a stage that overran or failed is None,
+    and indexed is False when the document has no index at all
+    """
+    # Questions being answered hold back background indexing of large documents
+    lazy_indexer.touch()
+    
+    # Cached per-document retrieval structures - repeat questions never touch disk
+    doc_index = await asyncio.to_thread(index_cache.get, document_id)
+    
+    # Lazily indexed documents first embed the page ranges the question points at, under their
+    # own budget and alongside the question's embedding - on-demand embedding through a remote
+    # embedder would otherwise use up the semantic budget and leave the question keyword-only
+    ranges = asyncio.ensure_future(index_ranges_within_budget(doc_index, question)) if lazily_indexed(doc_index) else None
+    
+    async def semantic() -> List[RetrievedChunk]:
+        # Shielded: a budget overrun here must not cancel an embedding other documents share
+        vector = await asyncio.shield(embedding)
+        if vector is None:
+            return []
+        return await asyncio.to_thread(semantic_document_hits, question, document_id, doc_index, vector, candidates)
+    
+    async def keyword() -> List[RetrievedChunk]:
+        if doc_index is None:
+            return []
+        return await asyncio.to_thread(keyword_document_hits, question, document_id, doc_index, candidates)
+    
+    async def semantic_stage() -> Optional[List[RetrievedChunk]]:
+        if ranges is not None:
+            await ranges
+        return await run_with_budget("Semantic", semantic(), HYBRID_VECTOR_BUDGET_MS)
+    
+    keyword_hits, semantic_hits = await asyncio.gather(
+        run_with_budget("Keyword", keyword(), HYBRID_KEYWORD_BUDGET_MS),
+        semantic_stage()
+    )
+    return keyword_hits, semantic_hits, doc_index is not None or bool(semantic_hits)
+
+async def rank_document_chunks(
+    question: str,
+    document_id: str,
+    k: int = 3,
+    query_embedding: Optional[Awaitable] = None
+) -> tuple[Optional[List[RetrievedChunk]], str]:
+    """
+    Rank one document's chunks for a question with hybrid retrieval
+    BM25 keyword search and semantic search run concurrently, each within its latency
+    budget, and their rankings are merged with reciprocal-rank fusion. query_embedding
+    is a future of the question's embedding (shared by library search across documents);
+    the question is embedded here when it is omitted.
+    Returns: (hits best first, search_mode); search_mode is "hybrid" when both searches
+    contributed; hits is None when the document has no index at all
+    """
+    embedding = query_embedding if query_embedding is not None else asyncio.ensure_future(embed_question(question))
+    keyword_hits, semantic_hits, indexed = await document_stage_hits(
+        question, document_id, max(k, HYBRID_CANDIDATES), embedding
+    )
+    if not indexed:
+        return None, "keyword"
+    return fuse_stage_hits(keyword_hits, semantic_hits, k)
+
+def leading_document_hits(document_id: str, search_mode: str, count: int = 2) -> List[RetrievedChunk]:
+    """
+    A document's first chunks, as context for questions nothing in it matched
+    Blocking (a cache miss loads the index) - call through asyncio.to_thread from async code
+    """
+    doc_index = index_cache.get(document_id)
+    if doc_index is None:
+        return []
+    store = doc_index.store
+    return [RetrievedChunk(store.get(i), 0.0, document_id, search_mode) for i in range(min(count, len(store)))]
+
+async def embed_question(question: str):
+    """Embed a question with the configured embedder off the event loop, or None without one"""
+    embedder = get_embedder()
+    if embedder is None:
+        return None
+    try:
+        return await asyncio.to_thread(embedder.embed_query, question)
+    except Exception as e:
+        logger.warning(f"Could not embed question - using keyword search: {e}")
+        return None
+
 async def query_collection(collection, question: str, k: int = 3) -> tuple[str, List[str]]:
     """
     Query ChromaDB collection and generate response
@@ -172,7 +392,8 @@ async def query_collection(collection, question: str, k: int = 3) -> tuple[str,
         # Query the collection for relevant documents
         results = collection.query(
             query_texts=[question],
-            n_results=k
+            n_results=k,
+            include=["documents", "metadatas"]
         )
         
         if not results['documents'] or not results['documents'][0]:
@@ -201,174 +422,320 @@ Answer:"""
                 {"role": "system", "content": "You are a helpful assistant that answers questions based on document context."},
                 {"role": "user", "content": prompt}
             ]
-            answer = generate_response(messages)
+            answer = await generate_response(messages)
         else:
             answer = f"Mock response: Based on the document context, here's what I found about '{question}'. (This is a development response since OpenRouter is not configured.)"
         
         # Return answer and sources with page numbers
-        sources = [{"page": i+1, "text": doc[:100] + "..."} for i, doc in enumerate(relevant_docs)]
+        sources = chroma_sources(results)
         return answer, sources
         
     except Exception as e:
         logger.error(f"Error querying collection: {e}")
         return "I'm sorry, I encountered an error while processing your question.", []
 
-async def generate_ai_response(question: str, document_id: str) -> tuple[str, List[dict], str]:
+async def prepare_ai_request(
+    question: str,
+    document_id: str,
+    query_embedding: Optional[Awaitable] = None
+) -> tuple[Optional[List[Dict[str, str]]], Optional[str], List[dict], str]:
+    """
+    Retrieve document context and build the LLM prompt for a question
+    query_embedding is passed on to rank_document_chunks
+    Returns: (messages, immediate_response, sources, search_mode)
+    When immediate_response is set it is sent as-is and the LLM is not called
+    """
+    if not LLM_ENABLED:
+        # Fallback to mock response only if OpenRouter is not available
+        logger.info(f"Using mock response for question: {question[:50]}...")
+        return None, f"Mock response: I would analyze the document to answer '{question}' but OpenRouter is not configured. This is a development response.", ["Mock source: Please configure OpenRouter API key for AI responses"], "mock"
+
+    logger.info(f"Generating OpenRouter response for document {document_id}, question: {question[:50]}...")
+    
+    # Try to get document context (from mock or real embeddings)
+    context = ""
+    sources = []
+    search_mode = "keyword"  # Default to keyword search
+    
+    try:
+        hits, search_mode = await rank_document_chunks(question, document_id, CONTEXT_CANDIDATES, query_embedding)
+        
+        if hits is not None:
+            if not hits:
+                logger.warning(f"No relevant chunks found for question: {question}")
+                # Fallback: use first few chunks if no keyword matches
+                hits = await asyncio.to_thread(leading_document_hits, document_id, search_mode)
+                if hits:
+                    logger.info(f"Using fallback chunks from document")
+            
+            if hits:
+                # Deduplicated, diversified and merged into contiguous spans within the token budget
+                packed = pack_context(hits)
+                context = packed.text
+                # Build sources with the page each chunk came from
+                sources = [hit.chunk.to_source() for hit in packed.hits]
+                logger.info(f"Using {len(packed.hits)} of {packed.candidates} relevant chunks in {len(packed.spans)} spans "
+                            f"(~{packed.tokens} tokens) for context ({search_mode} search)")
+        else:
+            logger.error(f"Chunk store not found: {chunk_store_path(document_id)}")
+            
+            # Return helpful error message
+            error_msg = "I apologize, but I couldn't find the document data for this PDF. This could happen if:\n\n"
+            error_msg += "1. The PDF was just uploaded and hasn't been processed yet\n"
+            error_msg += "2. The document ID is invalid\n"
+            error_msg += "3. The document processing failed\n\n"
+            error_msg += "Please try uploading the PDF again or select a different document from the sidebar."
+            return None, error_msg, [], search_mode
+        
+    except Exception as context_e:
+        logger.warning(f"Error loading document context: {context_e}")
+        context = "No specific document context available."
+    
+    
+    if context and context.strip():
+        # We have document context - create a context-aware prompt
+        messages = [
+            {"role": "system", "content": "You are a helpful assistant that answers questions based on document content. Always base your answer on the provided context. If the context doesn't contain enough information to answer the question, say so clearly."},
+            {"role": "user", "content": f"Based on the following document content, please answer the question.\n\nDocument content:\n{context}\n\nQuestion: {question}\n\nPlease provide a detailed answer based on the document content above:"}
+        ]
+        logger.info(f"Sending context-aware prompt to OpenRouter (context length: {len(context)} chars)")
+    else:
+        # No document context available - general response
+        messages = [
+            {"role": "system", "content": "You are a helpful assistant. The user is asking about a document, but no document context is available."},
+            {"role": "user", "content": f"I'd like to ask about a document, but it seems the document content isn't available right now. My question is: {question}\n\nCan you provide a general helpful response and suggest how I might get a better answer?"}
+        ]
+        logger.info(f"Sending general prompt to OpenRouter (no document context)")
+    
+    return messages, None, sources, search_mode
+
+async def cached_answer(question: str, document_id: str, bypass_cache: bool) -> tuple[Optional[CachedAnswer], Optional[asyncio.Future]]:
+    """
+    Previously generated answer to the same question, or to one similar enough, about the same document version
+    Returns: (cached answer or None, future of the question's embedding for retrieval and caching to reuse)
+    """
+    if bypass_cache:
+        answer_cache.record_bypass()
+    else:
+        try:
+            cached = await asyncio.to_thread(answer_cache.get, document_id, question)
+            if cached is not None:
+                return cached, None
+        except Exception as e:
+            logger.warning(f"Answer cache lookup failed: {e}")
+    
+    if not semantic_cache.supports(get_embedder()):
+        return None, None
+    # Retrieval needs the embedding anyway, so a paraphrase lookup costs one matrix-vector product
+    query_embedding = asyncio.ensure_future(embed_question(question))
+    if bypass_cache:
+        return None, query_embedding
+    vector = await run_with_budget("Question embedding", asyncio.shield(query_embedding), HYBRID_VECTOR_BUDGET_MS)
+    if vector is None:
+        return None, query_embedding
+    try:
+        return await asyncio.to_thread(semantic_cache.get, document_id, question, vector), query_embedding
+    except Exception as e:
+        logger.warning(f"Semantic cache lookup failed: {e}")
+        return None, query_embedding
+
+async def cache_answer(question: str, document_id: str, response: str, sources: List[dict], search_mode: str,
+                       query_embedding: Optional[asyncio.Future] = None):
+    """Remember an LLM answer for the question and its paraphrases; fallback mock responses are never cached"""
+    if response.startswith("Mock response:"):
+        return
+    answer = CachedAnswer(response, sources, search_mode)
+    try:
+        await asyncio.to_thread(answer_cache.put, document_id, question, answer)
+        if query_embedding is not None and query_embedding.done() and not query_embedding.cancelled():
+            vector = query_embedding.result()
+            if vector is not None:
+                await asyncio.to_thread(semantic_cache.put, document_id, question, vector, answer)
+    except Exception as e:
+        logger.warning(f"Could not cache answer: {e}")
+
+async def generate_ai_response(question: str, document_id: str, bypass_cache: bool = False) -> tuple[str, List[dict], str]:
     """
     Generate AI response for a question about a specific document
     Uses OpenRouter when available, falls back to mock responses only when needed
+    Repeated questions are answered from the answer cache unless bypass_cache is set
     Returns: (response_text, sources_list, search_mode)
     """
     try:
-        # If we have OpenRouter available, use it even with mock embeddings
-        if LLM_ENABLED:
-            logger.info(f"Generating OpenRouter response for document {document_id}, question: {question[:50]}...")
-            
-            # Try to get document context (from mock or real embeddings)
-            context = ""
-            sources = []
-            search_mode = "keyword"  # Default to keyword search
-            
-            try:
-                # Always try mock embeddings first when real embeddings aren't available
-                use_mock_embeddings = True
-                
-                # Check if we have real embeddings configured
-                try:
-                    from dotenv import load_dotenv
-                    load_dotenv()
-                    openrouter_api_key = os.getenv("OPENROUTER_API_KEY")
-                    openai_api_key = os.getenv("OPENAI_API_KEY")
-                    
-                    # Only use ChromaDB if we have a valid embedding API key AND the collection exists
-                    if (openrouter_api_key and openrouter_api_key != "your-openrouter-api-key") or \
-                       (openai_api_key and openai_api_key != "your-openai-api-key"):
-                        try:
-                            if CHROMADB_ENABLED and chroma_client:
-                                collection = chroma_client.get_collection(name=f"doc_{document_id}")
-                                results = collection.query(query_texts=[question], n_results=3)
-                                if results['documents'] and results['documents'][0]:
-                                    context = "\n\n".join(results['documents'][0])
-                                    sources = [{"page": i+1, "text": doc[:100] + "..."} for i, doc in enumerate(results['documents'][0])]
-                                    search_mode = "semantic"  # Using semantic search via ChromaDB
-                                    logger.info(f"Found {len(results['documents'][0])} relevant chunks from ChromaDB")
-                                    use_mock_embeddings = False
-                        except Exception as chroma_e:
-                            logger.info(f"ChromaDB collection not found or error: {chroma_e} - using mock embeddings")
-                except Exception as env_e:
-                    logger.info(f"Environment check failed: {env_e} - using mock embeddings")
-                
-                # Use mock embeddings if ChromaDB didn't work
-                if use_mock_embeddings:
-                    logger.info("Using mock embeddings for document context")
-                    import json
-                    import os
-                    
-                    # Get the absolute path to the mock embeddings file
-                    current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-                    mock_file = os.path.join(current_dir, "data", "mock_embeddings", f"doc_{document_id}.json")
-                    logger.info(f"Looking for mock embeddings file: {mock_file}")
-                    
-                    if os.path.exists(mock_file):
-                        logger.info(f"Found mock embeddings file for document {document_id}")
-                        with open(mock_file, 'r', encoding='utf-8') as f:
-                            mock_data = json.load(f)
-                        
-                        total_chunks = len(mock_data.get('chunks', []))
-                        logger.info(f"Loaded {total_chunks} chunks from mock embeddings")
-                        
-                        # Simple keyword matching for mock retrieval
-                        search_mode = "keyword"  # Using keyword-based search
-                        relevant_chunks = []
-                        question_words = question.lower().split()
-                        logger.info(f"Question keywords: {question_words}")
-                        
-                        for i, chunk in enumerate(mock_data.get('chunks', [])):
-                            chunk_words = chunk.lower().split()
-                            matches = sum(1 for word in question_words if word in chunk_words)
-                            if matches > 0:
-                                relevant_chunks.append((chunk, matches))
-                                logger.info(f"Chunk {i} has {matches} matches")
-                        
-                        # Sort by relevance and take top 3
-                        relevant_chunks.sort(key=lambda x: x[1], reverse=True)
-                        top_chunks = [chunk[0] for chunk in relevant_chunks[:3]]
-                        
-                        if top_chunks:
-                            context = "\n\n".join(top_chunks)
-                            # Build sources from top chunks with page numbers
-                            sources = [{"page": i+1, "text": chunk[:100] + "..."} for i, chunk in enumerate(top_chunks)]
-                            logger.info(f"Using {len(top_chunks)} relevant chunks for context")
-                        else:
-                            logger.warning(f"No relevant chunks found for question: {question}")
-                            # Fallback: use first few chunks if no keyword matches
-                            fallback_chunks = mock_data.get('chunks', [])[:2]
-                            if fallback_chunks:
-                                context = "\n\n".join(fallback_chunks)
-                                sources = [{"page": i+1, "text": chunk[:100] + "..."} for i, chunk in enumerate(fallback_chunks)]
-                                logger.info(f"Using fallback chunks from document")
-                    else:
-                        logger.error(f"Mock embeddings file not found: {mock_file}")
-                        # List available files for debugging
-                        mock_dir = os.path.join(current_dir, "data", "mock_embeddings")
-                        if os.path.exists(mock_dir):
-                            available_files = os.listdir(mock_dir)
-                            logger.info(f"Available mock embedding files: {available_files}")
-                        else:
-                            logger.error(f"Mock embeddings directory not found: {mock_dir}")
-                            logger.info(f"Current working directory: {os.getcwd()}")
-                            logger.info(f"Script directory: {current_dir}")
-                        
-                        # Return helpful error message
-                        error_msg = "I apologize, but I couldn't find the document data for this PDF. This could happen if:\n\n"
-                        error_msg += "1. The PDF was just uploaded and hasn't been processed yet\n"
-                        error_msg += "2. The document ID is invalid\n"
-                        error_msg += "3. The document processing failed\n\n"
-                        error_msg += "Please try uploading the PDF again or select a different document from the sidebar."
-                        return error_msg, [], search_mode
-                
-            except Exception as context_e:
-                logger.warning(f"Error loading document context: {context_e}")
-                context = "No specific document context available."
+        cached, query_embedding = await cached_answer(question, document_id, bypass_cache)
+        if cached is not None:
+            logger.info(f"Answered from cache for document {document_id}")
+            return cached.response, cached.sources, cached.search_mode
+        
+        messages, immediate_response, sources, search_mode = await prepare_ai_request(question, document_id, query_embedding)
+        if immediate_response is not None:
+            return immediate_response, sources, search_mode
+        
+        # Generate response using OpenRouter
+        try:
+            response = await generate_response(messages)
             
-            # Generate response using OpenRouter
-            try:
-                if context and context.strip():
-                    # We have document context - create a context-aware prompt
-                    messages = [
-                        {"role": "system", "content": "You are a helpful assistant that answers questions based on document content. Always base your answer on the provided context. If the context doesn't contain enough information to answer the question, say so clearly."},
-                        {"role": "user", "content": f"Based on the following document content, please answer the question.\n\nDocument content:\n{context}\n\nQuestion: {question}\n\nPlease provide a detailed answer based on the document content above:"}
-                    ]
-                    logger.info(f"Sending context-aware prompt to OpenRouter (context length: {len(context)} chars)")
-                else:
-                    # No document context available - general response
-                    messages = [
-                        {"role": "system", "content": "You are a helpful assistant. The user is asking about a document, but no document context is available."},
-                        {"role": "user", "content": f"I'd like to ask about a document, but it seems the document content isn't available right now. My question is: {question}\n\nCan you provide a general helpful response and suggest how I might get a better answer?"}
-                    ]
-                    logger.info(f"Sending general prompt to OpenRouter (no document context)")
-                
-                response = generate_response(messages)
+            if response:
+                logger.info(f"OpenRouter response generated successfully (length: {len(response)} chars)")
+                await cache_answer(question, document_id, response, sources, search_mode, query_embedding)
+                return response, sources, search_mode
+            else:
+                logger.error("OpenRouter returned empty response")
+                return "I apologize, but I couldn't generate a response at the moment. Please try again.", sources, search_mode
                 
-                if response:
-                    logger.info(f"OpenRouter response generated successfully (length: {len(response)} chars)")
-                    return response, sources, search_mode
-                else:
-                    logger.error("OpenRouter returned empty response")
-                    return "I apologize, but I couldn't generate a response at the moment. Please try again.", sources, search_mode
-                    
-            except Exception as openrouter_e:
-                logger.error(f"OpenRouter error: {openrouter_e}")
-                return f"I encountered an error while generating a response: {str(openrouter_e)}", sources, search_mode
-        
-        # Fallback to mock response only if OpenRouter is not available
-        logger.info(f"Using mock response for question: {question[:50]}...")
-        return f"Mock response: I would analyze the document to answer '{question}' but OpenRouter is not configured. This is a development response.", ["Mock source: Please configure OpenRouter API key for AI responses"]
+        except Exception as openrouter_e:
+            logger.error(f"OpenRouter error: {openrouter_e}")
+            return f"I encountered an error while generating a response: {str(openrouter_e)}", sources, search_mode
         
     except Exception as e:
         logger.error(f"Error generating AI response: {e}")
-        return f"I encountered an error: {str(e)}", []
-        return "I'm sorry, I encountered an error while processing your question.", []
+        return f"I encountered an error: {str(e)}", [], "error"
+
+async def stream_ai_response(
+    question: str,
+    document_id: str,
+    on_chunk: Callable[[str], Awaitable[None]],
+    bypass_cache: bool = False
+) -> tuple[str, List[dict], str]:
+    """
+    Streaming variant of generate_ai_response
+    Awaits on_chunk for every incremental piece of text as it arrives from OpenRouter;
+    a cached answer is sent as a single chunk
+    Returns: (full_response_text, sources_list, search_mode)
+    """
+    try:
+        cached, query_embedding = await cached_answer(question, document_id, bypass_cache)
+        if cached is not None:
+            logger.info(f"Answered from cache for document {document_id}")
+            await on_chunk(cached.response)
+            return cached.response, cached.sources, cached.search_mode
+        
+        messages, immediate_response, sources, search_mode = await prepare_ai_request(question, document_id, query_embedding)
+        if immediate_response is not None:
+            await on_chunk(immediate_response)
+            return immediate_response, sources, search_mode
+        
+        parts = []
+        try:
+            async for chunk in generate_response_stream(messages):
+                parts.append(chunk)
+                await on_chunk(chunk)
+        except Exception as openrouter_e:
+            logger.error(f"OpenRouter streaming error: {openrouter_e}")
+            if not parts:
+                error_text = f"I encountered an error while generating a response: {str(openrouter_e)}"
+                await on_chunk(error_text)
+                return error_text, sources, search_mode
+        
+        response = "".join(parts)
+        if not response:
+            logger.error("OpenRouter returned empty response")
+            response = "I apologize, but I couldn't generate a response at the moment. Please try again."
+            await on_chunk(response)
+        else:
+            logger.info(f"OpenRouter response streamed successfully (length: {len(response)} chars)")
+            await cache_answer(question, document_id, response, sources, search_mode, query_embedding)
+        return response, sources, search_mode
+        
+    except Exception as e:
+        logger.error(f"Error streaming AI response: {e}")
+        error_text = f"I encountered an error: {str(e)}"
+        await on_chunk(error_text)
+        return error_text, [], "error"
+
+async def search_library(question: str, document_ids: List[str], k: int = LIBRARY_TOP_K) -> List[RetrievedChunk]:
+    """
+    Search several documents concurrently and merge their hits into one global top k
+    The question is embedded once, concurrently with the documents' keyword searches.
+    Keyword and semantic hits of all documents are pooled and fused once: per-document
+    fusion would give every document's best hit the same rank-only score
+    """
+    query_embedding = asyncio.ensure_future(embed_question(question))
+    candidates = max(k, HYBRID_CANDIDATES)
+    results = await asyncio.gather(
+        *(document_stage_hits(question, document_id, candidates, query_embedding) for document_id in document_ids),
+        return_exceptions=True
+    )
+    
+    keyword_hits: List[RetrievedChunk] = []
+    semantic_hits: List[RetrievedChunk] = []
+    for document_id, result in zip(document_ids, results):
+        if isinstance(result, Exception):
+            logger.warning(f"Library search failed for document {document_id}: {result}")
+            continue
+        document_keyword_hits, document_semantic_hits, indexed = result
+        if not indexed:
+            logger.info(f"Document {document_id} has no index - skipped in library search")
+            continue
+        keyword_hits.extend(document_keyword_hits or [])
+        semantic_hits.extend(document_semantic_hits or [])
+    hits, _ = fuse_stage_hits(keyword_hits, semantic_hits, k)
+    return hits
+
+def library_search_mode(hits: List[RetrievedChunk]) -> str:
+    modes = {hit.search_mode for hit in hits}
+    if not modes:
+        return "keyword"
+    return modes.pop() if len(modes) == 1 else "mixed"
+
+@router.post("/library/query", response_model=LibraryQueryResponse)
+async def library_query(
+    request: LibraryQueryRequest,
+    current_user: UserInfo = Depends(verify_token)
+):
+    """
+    Ask one question across several documents (or all of the user's documents)
+    Sources carry the document_id they came from
+    """
+    from .pdf_processing import list_user_document_ids
+    
+    user_document_ids = list_user_document_ids(current_user.user_id)
+    if request.document_ids:
+        document_ids = list(dict.fromkeys(request.document_ids))
+        # Other users' documents are reported exactly like missing ones
+        owned = set(user_document_ids)
+        missing = [document_id for document_id in document_ids if document_id not in owned]
+        if missing:
+            raise HTTPException(status_code=404, detail=f"Document not found: {missing[0]}")
+    else:
+        document_ids = user_document_ids
+    if not document_ids:
+        raise HTTPException(status_code=404, detail="No documents to search")
+    k = max(1, min(request.k, LIBRARY_MAX_K))
+    
+    try:
+        hits = await search_library(request.text, document_ids, k)
+        packed = pack_context(hits)
+        hits = packed.hits
+        sources = [hit.to_source() for hit in hits]
+        search_mode = library_search_mode(hits)
+        
+        if not LLM_ENABLED:
+            response = f"Mock response: I would answer '{request.text}' from {len(hits)} passages across {len(document_ids)} documents but OpenRouter is not configured. This is a development response."
+        elif not hits:
+            response = "I couldn't find relevant information in these documents to answer your question."
+        else:
+            context = "\n\n".join(
+                f"[Document {span.document_id}, page {span.page}]\n{span.text}" for span in packed.spans
+            )
+            messages = [
+                {"role": "system", "content": "You are a helpful assistant that answers questions across a library of documents. Base your answer on the provided excerpts and say which document each fact comes from. If the excerpts don't contain enough information to answer the question, say so clearly."},
+                {"role": "user", "content": f"Based on the following excerpts, please answer the question.\n\nExcerpts:\n{context}\n\nQuestion: {request.text}"}
+            ]
+            response = await generate_response(messages) or "I apologize, but I couldn't generate a response at the moment. Please try again."
+        
+        logger.info(f"Library query for user {current_user.user_id} over {len(document_ids)} documents returned {len(hits)} sources")
+        return LibraryQueryResponse(
+            response=response,
+            message_id=str(uuid.uuid4()),
+            sources=sources,
+            document_ids=document_ids,
+            search_mode=search_mode
+        )
+        
+    except Exception as e:
+        logger.error(f"Error processing library query: {e}")
+        raise HTTPException(status_code=500, detail="Failed to process library query")
 
 @router.post("/query", response_model=ChatResponse)
 async def chat_query(
@@ -380,10 +747,9 @@ async def chat_query(
     """
     try:
         # Generate AI response
-        ai_response, sources = await generate_ai_response(request.text, request.document_id)
+        ai_response, sources, search_mode = await generate_ai_response(request.text, request.document_id, request.bypass_cache)
         
         # Generate unique IDs
-        import uuid
         message_id = str(uuid.uuid4())
         
         # Get or create chat session
@@ -577,6 +943,27 @@ Export Date: {datetime.now().isoformat()}
         logger.error(f"Error exporting chat session {session_id}: {e}")
         raise HTTPException(status_code=500, detail="Failed to export chat session")
 
+@router.get("/index-cache/stats")
+async def get_index_cache_stats(current_user: UserInfo = Depends(verify_token)):
+    """
+    Hit/miss statistics for the per-document retrieval index cache
+    """
+    return index_cache.stats()
+
+@router.get("/answer-cache/stats")
+async def get_answer_cache_stats(current_user: UserInfo = Depends(verify_token)):
+    """
+    Hit-rate statistics for the cache of answers to repeated questions
+    """
+    return answer_cache.stats()
+
+@router.get("/semantic-cache/stats")
+async def get_semantic_cache_stats(current_user: UserInfo = Depends(verify_token)):
+    """
+    Hit-rate statistics for answers reused across paraphrased questions
+    """
+    return semantic_cache.stats()
+
 # WebSocket connection manager
 class ConnectionManager:
     def __init__(self):
@@ -617,6 +1004,8 @@ async def websocket_endpoint(
             
             # Extract question
             question = message_data.get("text", "")
+            stream = bool(message_data.get("stream", False))
+            bypass_cache = bool(message_data.get("bypass_cache", False))
             
             if question:
                 # Send typing indicator
@@ -625,16 +1014,54 @@ async def websocket_endpoint(
                     "status": "ai_typing"
                 }))
                 
+                # Get or create chat session so the reply has a persisted message id
+                session = None
+                if message_data.get("session_id"):
+                    session = chat_history_manager.get_session(message_data["session_id"])
+                if not session:
+                    session = chat_history_manager.create_session(document_id, user_id)
+                
+                chat_history_manager.add_message_to_session(session.session_id, HistoryChatMessage(
+                    message_id=str(uuid.uuid4()),
+                    text=question,
+                    sender='user',
+                    timestamp=datetime.now()
+                ))
+                
                 # Generate AI response
-                ai_response, sources = await generate_ai_response(question, document_id)
+                if stream:
+                    async def send_chunk(chunk: str):
+                        # Same payload as the Socket.IO response_chunk event
+                        await websocket.send_text(json.dumps({
+                            "type": "response_chunk",
+                            "chunk": chunk,
+                            "document_id": document_id,
+                            "session_id": session.session_id
+                        }))
+                    
+                    ai_response, sources, search_mode = await stream_ai_response(question, document_id, send_chunk, bypass_cache)
+                else:
+                    ai_response, sources, search_mode = await generate_ai_response(question, document_id, bypass_cache)
+                
+                ai_message = HistoryChatMessage(
+                    message_id=str(uuid.uuid4()),
+                    text=ai_response,
+                    sender='ai',
+                    timestamp=datetime.now(),
+                    sources=sources
+                )
+                chat_history_manager.add_message_to_session(session.session_id, ai_message)
                 
-                # Send response
+                # Send response (the final event when streaming)
                 response_data = {
                     "type": "message",
                     "text": ai_response,
                     "sender": "ai",
-                    "timestamp": datetime.now().isoformat(),
-                    "sources": sources
+                    "timestamp": ai_message.timestamp.isoformat(),
+                    "session_id": session.session_id,
+                    "message_id": ai_message.message_id,
+                    "sources": sources,
+                    "searchMode": search_mode
                 }
                 
                 await websocket.send_text(json.dumps(response_data))
@@ -317,5 +317,28 @@ class ChatHistoryManager:
         finally:
             db.close()
 
+    def delete_document_sessions(self, document_id: str) -> int:
+        """Delete every chat session (and its messages) about a document; returns the number deleted"""
+        db = get_db_session()
+        try:
+            db_sessions = db.query(ChatSessionDB).filter(
+                ChatSessionDB.document_id == document_id
+            ).all()
+            
+            for db_session in db_sessions:
+                # Cascade deletes the messages
+                db.delete(db_session)
+            db.commit()
+            
+            if db_sessions:
+                logger.info(f"Deleted {len(db_sessions)} chat sessions for document {document_id}")
+            return len(db_sessions)
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error deleting sessions for document {document_id}: {e}")
+            raise
+        finally:
+            db.close()
+
 # Global chat history manager instance
 chat_history_manager = ChatHistoryManager()
@@ -0,0 +1,509 @@
+"""
+Per-document chunk store
+Records every chunk produced at ingestion with its page number, character
+offsets within the page and a stable chunk id, so retrieval can return real
+page references instead of result ranks
+
+Stores are written in a compact binary format (doc_{id}.chunks) that is
+memory-mapped on load: chunk texts live in one string table addressed by an
+offset array, so a single chunk can be read without decoding the rest.
+An optional postings section carries the document's BM25 keyword index.
+Postings are delta-coded varints - a posting takes about two bytes instead of
+six - and each queried term's list is decoded once per loaded store. With them
+a store is roughly its texts plus ~35 bytes per chunk and ~2 bytes per
+(term, chunk) pair; stores of format 3 held fixed-width postings, which are
+ignored so the keyword index is rebuilt and rewritten in the current format.
+
+Layout (little-endian):
+    header      magic "PXCS", u16 version, u16 flags, u32 chunk_count, u32 section_count
+    sections    section_count x (u64 offset, u64 length), in SECTIONS order
+    data        each section padded to 8 bytes
+
+Documents ingested before this format have a doc_{id}.json file instead;
+they are still readable, and scripts/migrate_mock_embeddings.py converts them.
+"""
+import json
+import itertools
+import mmap
+import os
+import shutil
+import struct
+import sys
+import logging
+from array import array
+from typing import Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Absolute path so lookups work regardless of the server's working directory
+CHUNK_STORE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "mock_embeddings")
+
+CHUNK_STORE_MAGIC = b"PXCS"
+CHUNK_STORE_FORMAT_VERSION = 4
+# Oldest format whose postings section is still read
+POSTINGS_FORMAT_VERSION = 4
+FLAG_HAS_POSTINGS = 0x1
+
+_HEADER = struct.Struct("<4sHHII")
+_SECTION = struct.Struct("<QQ")
+
+# Section name -> array typecode of its elements ("s" for raw UTF-8 bytes)
+SECTIONS = (
+    ("text_offsets", "Q"),     # chunk_count + 1 byte offsets into texts
+    ("texts", "s"),
+    ("id_offsets", "I"),       # chunk_count + 1 byte offsets into ids
+    ("ids", "s"),
+    ("pages", "i"),            # -1 when unknown
+    ("starts", "i"),
+    ("ends", "i"),
+    ("doc_lengths", "I"),      # token count per chunk (postings section)
+    ("term_offsets", "I"),     # term_count + 1 byte offsets into terms, terms sorted by UTF-8 bytes
+    ("terms", "s"),
+    ("posting_offsets", "I"),  # term_count + 1 byte offsets into postings
+    ("postings", "s"),         # per term, varint (chunk index gap, term frequency) pairs in chunk order
+)
+# Sections of a store without postings
+CHUNK_SECTIONS = 7
+
+_LITTLE_ENDIAN = sys.byteorder == "little"
+SPILL_COPY_BUFFER = 1024 * 1024
+
+def make_chunk_id(document_id: str, page: int, start: int, end: int) -> str:
+    """Stable id derived from the chunk's position - re-ingesting the same file yields the same ids"""
+    return f"{document_id}:p{page}:{start}-{end}"
+
+class Chunk:
+    """A chunk of document text and where it came from"""
+    def __init__(self, chunk_id: str, text: str, page: Optional[int], start: Optional[int], end: Optional[int]):
+        self.chunk_id = chunk_id
+        self.text = text
+        self.page = page  # 1-based page number, None for stores written before page tracking
+        self.start = start  # character offsets within the page text
+        self.end = end
+
+    def to_source(self) -> Dict:
+        """Source entry returned to clients alongside an answer"""
+        return {
+            "page": self.page,
+            "text": self.text[:100] + "...",
+            "chunk_id": self.chunk_id,
+            "start": self.start,
+            "end": self.end
+        }
+
+class ChunkStore:
+    """Column-oriented chunk table for one document, held in memory"""
+    def __init__(self, document_id: str, texts: List[str], chunk_ids: List[str],
+                 pages: List[Optional[int]], starts: List[Optional[int]], ends: List[Optional[int]]):
+        self.document_id = document_id
+        self.texts = texts
+        self.chunk_ids = chunk_ids
+        self.pages = pages
+        self.starts = starts
+        self.ends = ends
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def __iter__(self) -> Iterator[Chunk]:
+        for i in range(len(self)):
+            yield self.get(i)
+
+    def text(self, index: int) -> str:
+        return self.texts[index]
+
+    def get(self, index: int) -> Chunk:
+        return Chunk(self.chunk_ids[index], self.texts[index], self.pages[index], self.starts[index], self.ends[index])
+
+    def page_numbers(self) -> List[Optional[int]]:
+        return self.pages
+
+    def postings(self) -> None:
+        """In-memory stores carry no keyword index"""
+        return None
+
+    @classmethod
+    def from_chunks(cls, document_id: str, chunks: List[Chunk]) -> 'ChunkStore':
+        return cls(
+            document_id=document_id,
+            texts=[chunk.text for chunk in chunks],
+            chunk_ids=[chunk.chunk_id for chunk in chunks],
+            pages=[chunk.page for chunk in chunks],
+            starts=[chunk.start for chunk in chunks],
+            ends=[chunk.end for chunk in chunks]
+        )
+
+def _typed(view: memoryview, typecode: str):
+    """Reinterpret a section as an array of typecode without copying (on little-endian hosts)"""
+    if _LITTLE_ENDIAN:
+        return view.cast(typecode)
+    values = array(typecode, view.tobytes())
+    values.byteswap()
+    return values
+
+class MappedPostings:
+    """
+    Read-only term -> (chunk indexes, term frequencies) mapping over a store's postings section
+    Terms are found by binary search over the sorted term table; a term's postings are
+    decoded on first lookup and kept
+    """
+    def __init__(self, term_offsets, terms: memoryview, posting_offsets, postings: memoryview):
+        self._term_offsets = term_offsets
+        self._terms = terms
+        self._posting_offsets = posting_offsets
+        self._postings = postings
+        self._decoded: Dict[int, Tuple[array, array]] = {}
+
+    def __len__(self) -> int:
+        return len(self._term_offsets) - 1
+
+    def _term_bytes(self, index: int) -> bytes:
+        return self._terms[self._term_offsets[index]:self._term_offsets[index + 1]].tobytes()
+
+    def _find(self, term: str) -> int:
+        key = term.encode("utf-8")
+        low, high = 0, len(self)
+        while low < high:
+            mid = (low + high) // 2
+            if self._term_bytes(mid) < key:
+                low = mid + 1
+            else:
+                high = mid
+        if low < len(self) and self._term_bytes(low) == key:
+            return low
+        return -1
+
+    def _entry(self, index: int) -> Tuple[array, array]:
+        entry = self._decoded.get(index)
+        if entry is None:
+            start, end = self._posting_offsets[index], self._posting_offsets[index + 1]
+            values = _decode_varints(self._postings[start:end].tobytes())
+            entry = array("I", itertools.accumulate(values[0::2])), array("H", values[1::2])
+            self._decoded[index] = entry
+        return entry
+
+    def get(self, term: str, default=None):
+        index = self._find(term)
+        return self._entry(index) if index >= 0 else default
+
+    def __contains__(self, term: str) -> bool:
+        return self._find(term) >= 0
+
+    def __getitem__(self, term: str):
+        index = self._find(term)
+        if index < 0:
+            raise KeyError(term)
+        return self._entry(index)
+
+    def items(self) -> Iterator[Tuple[str, tuple]]:
+        for index in range(len(self)):
+            yield self._term_bytes(index).decode("utf-8"), self._entry(index)
+
+class MappedChunkStore:
+    """Chunk table backed by a memory-mapped binary store; chunks are decoded on access"""
+    def __init__(self, document_id: str, path: str):
+        self.document_id = document_id
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+
+        magic, version, flags, chunk_count, section_count = _HEADER.unpack_from(view, 0)
+        if magic != CHUNK_STORE_MAGIC:
+            raise ValueError(f"{path} is not a chunk store")
+        if version > CHUNK_STORE_FORMAT_VERSION:
+            raise ValueError(f"{path} uses chunk store format {version}, newer than supported {CHUNK_STORE_FORMAT_VERSION}")
+        if version < POSTINGS_FORMAT_VERSION:
+            # Fixed-width postings of an older format - the keyword index is rebuilt
+            flags &= ~FLAG_HAS_POSTINGS
+            section_count = min(section_count, CHUNK_SECTIONS)
+        self.flags = flags
+        self.chunk_count = chunk_count
+
+        sections = {}
+        for n, (name, typecode) in enumerate(SECTIONS[:section_count]):
+            offset, length = _SECTION.unpack_from(view, _HEADER.size + n * _SECTION.size)
+            raw = view[offset:offset + length]
+            sections[name] = raw if typecode == "s" else _typed(raw, typecode)
+        self._sections = sections
+        self._text_offsets = sections["text_offsets"]
+        self._texts = sections["texts"]
+        self._id_offsets = sections["id_offsets"]
+        self._ids = sections["ids"]
+        self._pages = sections["pages"]
+        self._starts = sections["starts"]
+        self._ends = sections["ends"]
+
+    def __len__(self) -> int:
+        return self.chunk_count
+
+    def __iter__(self) -> Iterator[Chunk]:
+        for i in range(len(self)):
+            yield self.get(i)
+
+    def text(self, index: int) -> str:
+        return self._texts[self._text_offsets[index]:self._text_offsets[index + 1]].tobytes().decode("utf-8")
+
+    @property
+    def texts(self) -> List[str]:
+        """All chunk texts (decodes the whole string table)"""
+        return [self.text(i) for i in range(len(self))]
+
+    def get(self, index: int) -> Chunk:
+        chunk_id = self._ids[self._id_offsets[index]:self._id_offsets[index + 1]].tobytes().decode("utf-8")
+        page = self._pages[index]
+        if page < 0:
+            return Chunk(chunk_id, self.text(index), None, None, None)
+        return Chunk(chunk_id, self.text(index), page, self._starts[index], self._ends[index])
+
+    def page_numbers(self):
+        """Page number of every chunk (-1 when unknown), without copying"""
+        return self._pages
+
+    @property
+    def has_postings(self) -> bool:
+        return bool(self.flags & FLAG_HAS_POSTINGS)
+
+    def postings(self) -> Optional[Tuple[object, MappedPostings]]:
+        """
+        Keyword index data stored with the chunks
+        Returns: (doc_lengths, postings mapping) or None when the store has no postings section
+        """
+        if not self.has_postings:
+            return None
+        s = self._sections
+        return s["doc_lengths"], MappedPostings(s["term_offsets"], s["terms"], s["posting_offsets"], s["postings"])
+
+    def close(self):
+        self._sections = {}
+        self._text_offsets = self._texts = self._id_offsets = self._ids = None
+        self._pages = self._starts = self._ends = None
+        try:
+            self._mmap.close()
+        except BufferError:
+            # Views handed out (e.g. postings) are still alive; the map is released with them
+            pass
+
+def chunk_store_path(document_id: str) -> str:
+    return os.path.join(CHUNK_STORE_DIR, f"doc_{document_id}.chunks")
+
+def legacy_chunk_store_path(document_id: str) -> str:
+    return os.path.join(CHUNK_STORE_DIR, f"doc_{document_id}.json")
+
+def _pack(typecode: str, values) -> bytes:
+    data = array(typecode, values)
+    if not _LITTLE_ENDIAN:
+        data.byteswap()
+    return data.tobytes()
+
+def _string_table(strings: List[str]) -> Tuple[List[int], bytes]:
+    encoded = [value.encode("utf-8") for value in strings]
+    offsets = [0]
+    for value in encoded:
+        offsets.append(offsets[-1] + len(value))
+    return offsets, b"".join(encoded)
+
+def _encode_varints(values, out: bytearray):
+    """Append unsigned integers as LEB128 varints: 7 bits per byte, high bit set on all but the last"""
+    for value in values:
+        while value >= 0x80:
+            out.append((value & 0x7F) | 0x80)
+            value >>= 7
+        out.append(value)
+
+def _decode_varints(data: bytes) -> List[int]:
+    values = []
+    value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(value)
+            value = shift = 0
+    return values
+
+def _postings_sections(doc_lengths, postings) -> Dict[str, bytes]:
+    terms = sorted(postings.keys(), key=lambda term: term.encode("utf-8"))
+    term_offsets, term_bytes = _string_table(terms)
+    posting_offsets = [0]
+    encoded = bytearray()
+    for term in terms:
+        chunk_indexes, freqs = postings[term]
+        # Chunk indexes ascend, so the gaps between them are small
+        gaps = (chunk_index - previous for chunk_index, previous in zip(chunk_indexes, itertools.chain((0,), chunk_indexes)))
+        _encode_varints(itertools.chain.from_iterable(zip(gaps, freqs)), encoded)
+        posting_offsets.append(len(encoded))
+    return {
+        "doc_lengths": _pack("I", doc_lengths),
+        "term_offsets": _pack("I", term_offsets),
+        "terms": term_bytes,
+        "posting_offsets": _pack("I", posting_offsets),
+        "postings": bytes(encoded),
+    }
+
+def _section_length(data) -> int:
+    if isinstance(data, bytes):
+        return len(data)
+    return os.fstat(data.fileno()).st_size
+
+def _write_sections(path: str, chunk_count: int, flags: int, sections: Dict) -> str:
+    """
+    Write the header, section table and sections, then rename the file into place atomically
+    A section is bytes, or a binary file (read from its start) for sections spilled to disk
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        table_size = _HEADER.size + len(SECTIONS) * _SECTION.size
+        offset = (table_size + 7) & ~7
+        table = []
+        for name, _ in SECTIONS:
+            length = _section_length(sections.get(name, b""))
+            table.append((offset, length))
+            offset = (offset + length + 7) & ~7
+
+        f.write(_HEADER.pack(CHUNK_STORE_MAGIC, CHUNK_STORE_FORMAT_VERSION, flags, chunk_count, len(SECTIONS)))
+        for entry in table:
+            f.write(_SECTION.pack(*entry))
+        for (name, _), (section_offset, _) in zip(SECTIONS, table):
+            f.write(b"\0" * (section_offset - f.tell()))
+            data = sections.get(name, b"")
+            if isinstance(data, bytes):
+                f.write(data)
+            else:
+                data.seek(0)
+                shutil.copyfileobj(data, f, SPILL_COPY_BUFFER)
+    os.replace(tmp_path, path)
+    return path
+
+def write_chunk_store(path: str, chunks: List[Chunk], doc_lengths=None, postings=None) -> str:
+    """
+    Write chunks (and optionally a keyword index's doc_lengths and postings) in the binary format
+    The file is written next to its destination and renamed into place atomically
+    """
+    text_offsets, texts = _string_table([chunk.text for chunk in chunks])
+    id_offsets, ids = _string_table([chunk.chunk_id for chunk in chunks])
+    sections = {
+        "text_offsets": _pack("Q", text_offsets),
+        "texts": texts,
+        "id_offsets": _pack("I", id_offsets),
+        "ids": ids,
+        "pages": _pack("i", (-1 if chunk.page is None else chunk.page for chunk in chunks)),
+        "starts": _pack("i", (-1 if chunk.start is None else chunk.start for chunk in chunks)),
+        "ends": _pack("i", (-1 if chunk.end is None else chunk.end for chunk in chunks)),
+    }
+
+    flags = 0
+    if postings is not None:
+        flags |= FLAG_HAS_POSTINGS
+        sections.update(_postings_sections(doc_lengths, postings))
+    return _write_sections(path, len(chunks), flags, sections)
+
+class ChunkStoreWriter:
+    """
+    Builds a document's chunk store as chunks arrive
+    Chunk texts are spilled to a temporary file instead of being held in memory;
+    only the fixed-size columns and ids are kept until commit()
+    """
+    def __init__(self, document_id: str):
+        self.document_id = document_id
+        self.path = chunk_store_path(document_id)
+        os.makedirs(CHUNK_STORE_DIR, exist_ok=True)
+        self._texts = open(f"{self.path}.texts.tmp", 'w+b')
+        self._text_offsets = array("Q", [0])
+        self._id_offsets = array("I", [0])
+        self._ids = bytearray()
+        self._pages = array("i")
+        self._starts = array("i")
+        self._ends = array("i")
+
+    def __len__(self) -> int:
+        return len(self._pages)
+
+    def add(self, chunk: Chunk):
+        text = chunk.text.encode("utf-8")
+        self._texts.write(text)
+        self._text_offsets.append(self._text_offsets[-1] + len(text))
+        self._ids += chunk.chunk_id.encode("utf-8")
+        self._id_offsets.append(len(self._ids))
+        self._pages.append(-1 if chunk.page is None else chunk.page)
+        self._starts.append(-1 if chunk.start is None else chunk.start)
+        self._ends.append(-1 if chunk.end is None else chunk.end)
+
+    def commit(self, keyword_index=None) -> str:
+        """Write the store (with the keyword index's postings when given) and rename it into place"""
+        self._texts.flush()
+        sections = {
+            "text_offsets": _pack("Q", self._text_offsets),
+            "texts": self._texts,
+            "id_offsets": _pack("I", self._id_offsets),
+            "ids": bytes(self._ids),
+            "pages": _pack("i", self._pages),
+            "starts": _pack("i", self._starts),
+            "ends": _pack("i", self._ends),
+        }
+        flags = 0
+        if keyword_index is not None:
+            flags |= FLAG_HAS_POSTINGS
+            sections.update(_postings_sections(keyword_index.doc_lengths, keyword_index.postings))
+        try:
+            _write_sections(self.path, len(self), flags, sections)
+        finally:
+            self.abort()
+        logger.info(f"Saved chunk store for document {self.document_id} with {len(self)} chunks")
+        return self.path
+
+    def abort(self):
+        """Drop the spilled texts"""
+        if not self._texts.closed:
+            self._texts.close()
+        try:
+            os.unlink(self._texts.name)
+        except FileNotFoundError:
+            pass
+
+def save_chunk_store(document_id: str, chunks: List[Chunk], keyword_index=None) -> str:
+    """
+    Write the chunk table for a document, with the keyword index's postings when given
+    Returns: path to the chunk store file
+    """
+    os.makedirs(CHUNK_STORE_DIR, exist_ok=True)
+    if keyword_index is not None:
+        path = write_chunk_store(chunk_store_path(document_id), chunks, keyword_index.doc_lengths, keyword_index.postings)
+    else:
+        path = write_chunk_store(chunk_store_path(document_id), chunks)
+    logger.info(f"Saved chunk store for document {document_id} with {len(chunks)} chunks")
+    return path
+
+def load_legacy_chunk_store(document_id: str) -> Optional[ChunkStore]:
+    """
+    Read a JSON chunk store written before the binary format
+    Stores written before page tracking only hold chunk texts; their page and offsets are None
+    """
+    path = legacy_chunk_store_path(document_id)
+    if not os.path.exists(path):
+        return None
+
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    texts = data.get("chunks", [])
+    count = len(texts)
+    return ChunkStore(
+        document_id=document_id,
+        texts=texts,
+        chunk_ids=data.get("chunk_ids") or [f"{document_id}_{i}" for i in range(count)],
+        pages=data.get("pages") or [None] * count,
+        starts=data.get("starts") or [None] * count,
+        ends=data.get("ends") or [None] * count
+    )
+
+def load_chunk_store(document_id: str):
+    """
+    Load a document's chunk table, or None if the document has no store
+    Returns a MappedChunkStore, or an in-memory ChunkStore for legacy JSON stores
+    """
+    path = chunk_store_path(document_id)
+    if os.path.exists(path):
+        return MappedChunkStore(document_id, path)
+    return load_legacy_chunk_store(document_id)
@@ -0,0 +1,421 @@
+"""
+Document content registry
+Uploads are identified by the SHA-256 of their bytes. The first upload of some
+content is processed normally and becomes its canonical document; later uploads
+of the same bytes get their own document id, aliased to the canonical one, and
+reuse its stored PDF, extracted text, chunk store and indexes.
+
+Every upload also gets a document record (owner, filename, page count, storage
+key, index location, status) used to list, read and delete a user's documents.
+Deleting a document only tombstones its record; the storage collector removes
+it later, together with the content once no other document refers to it.
+"""
+import threading
+import logging
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import tuple_
+
+from .database import get_db_session, ContentBlobDB, DocumentDB
+
+logger = logging.getLogger(__name__)
+
+# Blob states
+CONTENT_PROCESSING = "processing"
+CONTENT_READY = "ready"
+CONTENT_FAILED = "failed"
+# Document state between deletion and collection
+DOCUMENT_DELETED = "deleted"
+
+class ContentBlob:
+    """Registry entry for one distinct file"""
+    def __init__(self, content_hash: str, canonical_document_id: str, storage_key: str, status: str,
+                 job_id: Optional[str] = None, size_bytes: int = 0, page_count: Optional[int] = None,
+                 text_length: Optional[int] = None, chunk_count: Optional[int] = None):
+        self.content_hash = content_hash
+        self.canonical_document_id = canonical_document_id
+        self.storage_key = storage_key
+        self.status = status
+        self.job_id = job_id
+        self.size_bytes = size_bytes
+        self.page_count = page_count
+        self.text_length = text_length
+        self.chunk_count = chunk_count
+
+    @classmethod
+    def from_db(cls, db_blob: ContentBlobDB) -> 'ContentBlob':
+        return cls(
+            content_hash=db_blob.content_hash,
+            canonical_document_id=db_blob.canonical_document_id,
+            storage_key=db_blob.storage_key,
+            status=db_blob.status,
+            job_id=db_blob.job_id,
+            size_bytes=db_blob.size_bytes,
+            page_count=db_blob.page_count,
+            text_length=db_blob.text_length,
+            chunk_count=db_blob.chunk_count
+        )
+
+class Document:
+    """A user's document as listed in their library"""
+    def __init__(self, document_id: str, user_id: str, filename: str, content_hash: str, storage_key: str,
+                 status: str, upload_date: datetime, updated_at: datetime,
+                 page_count: Optional[int] = None, index_path: Optional[str] = None):
+        self.document_id = document_id
+        self.user_id = user_id
+        self.filename = filename
+        self.content_hash = content_hash
+        self.storage_key = storage_key
+        self.status = status
+        self.upload_date = upload_date
+        self.updated_at = updated_at
+        self.page_count = page_count
+        self.index_path = index_path
+
+    @classmethod
+    def from_db(cls, db_document: DocumentDB) -> 'Document':
+        return cls(
+            document_id=db_document.document_id,
+            user_id=db_document.user_id,
+            filename=db_document.filename,
+            content_hash=db_document.content_hash,
+            storage_key=db_document.storage_key,
+            status=db_document.status,
+            upload_date=db_document.upload_date,
+            updated_at=db_document.updated_at,
+            page_count=db_document.page_count,
+            index_path=db_document.index_path
+        )
+
+class ContentRegistry:
+    """
+    Content hash -> canonical document, and document id -> content
+    Document ids without a registry entry (uploaded before the registry) resolve to themselves
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        # document id -> canonical document id; a canonical id only changes when content whose
+        # processing failed is uploaded again, which drops the entries pointing at the old one
+        self._resolved: Dict[str, str] = {}
+
+    def register_upload(self, content_hash: str, document_id: str, user_id: str, filename: str,
+                        size_bytes: int, storage_key: str, job_id: Optional[str],
+                        store_content: Optional[Callable[[ContentBlob, bool], None]] = None) -> tuple[ContentBlob, bool]:
+        """
+        Record an upload; returns (blob, duplicate)
+        When duplicate is False the caller owns processing: the blob's canonical
+        document is document_id and its job is job_id. Otherwise the content is
+        already processed (or being processed) under blob.canonical_document_id.
+        store_content(blob, duplicate) puts the received file in place; it runs under
+        the registry lock, like purging, so content is never removed between the
+        duplicate check and the upload's registration. If it raises nothing is recorded.
+        """
+        with self._lock:
+            db = get_db_session()
+            try:
+                db_blob = db.query(ContentBlobDB).filter(ContentBlobDB.content_hash == content_hash).first()
+                duplicate = db_blob is not None and db_blob.status != CONTENT_FAILED
+                if db_blob is None:
+                    db_blob = ContentBlobDB(content_hash=content_hash, created_at=datetime.now())
+                    db.add(db_blob)
+                index_path = None
+                previous_canonical = db_blob.canonical_document_id
+                if not duplicate:
+                    # New content, or a retry of content whose processing failed
+                    db_blob.canonical_document_id = document_id
+                    db_blob.storage_key = storage_key
+                    db_blob.status = CONTENT_PROCESSING
+                    db_blob.job_id = job_id
+                    db_blob.size_bytes = size_bytes
+                else:
+                    canonical = db.query(DocumentDB).filter(DocumentDB.document_id == db_blob.canonical_document_id).first()
+                    index_path = canonical.index_path if canonical is not None else None
+
+                now = datetime.now()
+                db.add(DocumentDB(
+                    document_id=document_id,
+                    user_id=user_id,
+                    filename=filename,
+                    content_hash=content_hash,
+                    storage_key=db_blob.storage_key,
+                    index_path=index_path,
+                    page_count=db_blob.page_count if duplicate else None,
+                    status=db_blob.status,
+                    upload_date=now,
+                    updated_at=now
+                ))
+                db.flush()
+                blob = ContentBlob.from_db(db_blob)
+                if store_content is not None:
+                    store_content(blob, duplicate)
+                db.commit()
+                if previous_canonical is not None and previous_canonical != blob.canonical_document_id:
+                    self._forget_canonical(previous_canonical)
+                self._resolved[document_id] = blob.canonical_document_id
+
+                if duplicate:
+                    logger.info(f"Upload {document_id} duplicates content {content_hash[:12]} of document {blob.canonical_document_id}")
+                return blob, duplicate
+            except Exception as e:
+                db.rollback()
+                logger.error(f"Error registering upload {document_id}: {e}")
+                raise
+            finally:
+                db.close()
+
+    def _forget_canonical(self, canonical_document_id: str):
+        """Drop cached resolutions to a document that no longer holds its content"""
+        for alias, canonical in list(self._resolved.items()):
+            if canonical == canonical_document_id:
+                self._resolved.pop(alias, None)
+
+    def release(self, document_id: str):
+        """Undo register_upload for an upload that was never queued"""
+        with self._lock:
+            db = get_db_session()
+            try:
+                db_document = db.query(DocumentDB).filter(DocumentDB.document_id == document_id).first()
+                if db_document is None:
+                    return
+                db_blob = db_document.blob
+                db.delete(db_document)
+                if db_blob is not None and db_blob.canonical_document_id == document_id and db_blob.status == CONTENT_PROCESSING:
+                    db_blob.status = CONTENT_FAILED
+                db.commit()
+                self._resolved.pop(document_id, None)
+            except Exception as e:
+                db.rollback()
+                logger.error(f"Error releasing upload {document_id}: {e}")
+            finally:
+                db.close()
+
+    def _set_status(self, content_hash: str, status: str, document_fields: Optional[dict] = None, **fields):
+        """Update a blob and the documents still waiting on its processing"""
+        db = get_db_session()
+        try:
+            db_blob = db.query(ContentBlobDB).filter(ContentBlobDB.content_hash == content_hash).first()
+            if db_blob is None:
+                return
+            db_blob.status = status
+            for name, value in fields.items():
+                setattr(db_blob, name, value)
+            db.query(DocumentDB).filter(
+                DocumentDB.content_hash == content_hash,
+                DocumentDB.status == CONTENT_PROCESSING
+            ).update(
+                {DocumentDB.status: status, DocumentDB.updated_at: datetime.now(), **(document_fields or {})},
+                synchronize_session=False
+            )
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error updating content {content_hash[:12]}: {e}")
+        finally:
+            db.close()
+
+    def mark_ready(self, content_hash: str, page_count: int, text_length: int, chunk_count: int,
+                   index_path: Optional[str] = None):
+        self._set_status(content_hash, CONTENT_READY,
+                         document_fields={DocumentDB.page_count: page_count, DocumentDB.index_path: index_path},
+                         page_count=page_count, text_length=text_length, chunk_count=chunk_count)
+
+    def mark_failed(self, content_hash: str):
+        self._set_status(content_hash, CONTENT_FAILED)
+
+    def get_blob(self, document_id: str) -> Optional[ContentBlob]:
+        """Content entry a document id refers to, or None for unregistered documents"""
+        db = get_db_session()
+        try:
+            db_document = db.query(DocumentDB).filter(DocumentDB.document_id == document_id).first()
+            if db_document is None or db_document.blob is None:
+                return None
+            return ContentBlob.from_db(db_document.blob)
+        finally:
+            db.close()
+
+    def get_document(self, document_id: str, user_id: str) -> Optional[Document]:
+        """One of the user's documents, or None if it does not exist or belongs to someone else"""
+        db = get_db_session()
+        try:
+            db_document = db.query(DocumentDB).filter(
+                DocumentDB.document_id == document_id,
+                DocumentDB.user_id == user_id,
+                DocumentDB.status != DOCUMENT_DELETED
+            ).first()
+            return Document.from_db(db_document) if db_document is not None else None
+        finally:
+            db.close()
+
+    def list_documents(self, user_id: str, limit: Optional[int] = None,
+                       after: Optional[Tuple[datetime, str]] = None) -> List[Document]:
+        """
+        A page of the user's documents (all of them when limit is None), newest first
+        after is the (upload_date, document_id) of the last document of the previous page;
+        seeking past it on the (user_id, upload_date, document_id) index keeps every page
+        equally cheap however deep the listing goes
+        """
+        db = get_db_session()
+        try:
+            query = db.query(DocumentDB).filter(DocumentDB.user_id == user_id, DocumentDB.status != DOCUMENT_DELETED)
+            if after is not None:
+                query = query.filter(tuple_(DocumentDB.upload_date, DocumentDB.document_id) < tuple_(*after))
+            rows = query.order_by(DocumentDB.upload_date.desc(), DocumentDB.document_id.desc()).limit(limit).all()
+            return [Document.from_db(row) for row in rows]
+        finally:
+            db.close()
+
+    def tombstone_document(self, document_id: str, user_id: str) -> bool:
+        """
+        Mark one of the user's documents deleted; returns False if there was none
+        It disappears from the user's library at once and is purged by the storage collector
+        """
+        db = get_db_session()
+        try:
+            updated = db.query(DocumentDB).filter(
+                DocumentDB.document_id == document_id,
+                DocumentDB.user_id == user_id,
+                DocumentDB.status != DOCUMENT_DELETED
+            ).update({DocumentDB.status: DOCUMENT_DELETED, DocumentDB.updated_at: datetime.now()},
+                     synchronize_session=False)
+            db.commit()
+            return bool(updated)
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error deleting document {document_id}: {e}")
+            raise
+        finally:
+            db.close()
+
+    def deleted_document_ids(self, limit: int) -> List[str]:
+        """Tombstoned documents waiting to be purged, oldest deletion first"""
+        db = get_db_session()
+        try:
+            rows = db.query(DocumentDB.document_id).filter(
+                DocumentDB.status == DOCUMENT_DELETED
+            ).order_by(DocumentDB.updated_at).limit(limit).all()
+            return [row[0] for row in rows]
+        finally:
+            db.close()
+
+    def unreferenced_content(self, limit: int) -> List[str]:
+        """Hashes of finished (ready or failed) content no document refers to any more"""
+        db = get_db_session()
+        try:
+            rows = db.query(ContentBlobDB.content_hash).filter(
+                ~ContentBlobDB.documents.any(),
+                ContentBlobDB.status != CONTENT_PROCESSING
+            ).limit(limit).all()
+            return [row[0] for row in rows]
+        finally:
+            db.close()
+
+    def canonical_document_ids(self) -> List[str]:
+        """Ids of the documents whose files hold registered content"""
+        db = get_db_session()
+        try:
+            return [row[0] for row in db.query(ContentBlobDB.canonical_document_id).all()]
+        finally:
+            db.close()
+
+    def storage_keys(self) -> List[str]:
+        db = get_db_session()
+        try:
+            return [row[0] for row in db.query(ContentBlobDB.storage_key).all()]
+        finally:
+            db.close()
+
+    def _purge_blob(self, db, db_blob: ContentBlobDB, remove_content: Callable[[ContentBlob], None]) -> bool:
+        # Still referenced, or its processing job still owns the files
+        if db_blob.status == CONTENT_PROCESSING or db.query(DocumentDB).filter(
+                DocumentDB.content_hash == db_blob.content_hash).first() is not None:
+            return False
+        remove_content(ContentBlob.from_db(db_blob))
+        db.delete(db_blob)
+        self._resolved.pop(db_blob.canonical_document_id, None)
+        return True
+
+    def purge_document(self, document_id: str, remove_content: Callable[[ContentBlob], None]) -> bool:
+        """
+        Delete a tombstoned document's record, and its content if this was the last reference
+        remove_content deletes the content's files; it runs under the registry lock, which
+        register_upload also holds while it checks for and stores a duplicate's file, so an
+        upload of the same bytes either links before removal (and the content is kept) or
+        stores its own copy afterwards. If remove_content raises nothing is purged
+        Returns: whether the content was removed too
+        """
+        with self._lock:
+            db = get_db_session()
+            try:
+                db_document = db.query(DocumentDB).filter(
+                    DocumentDB.document_id == document_id,
+                    DocumentDB.status == DOCUMENT_DELETED
+                ).first()
+                if db_document is None:
+                    return False
+                db_blob = db_document.blob
+                db.delete(db_document)
+                db.flush()
+                removed = db_blob is not None and self._purge_blob(db, db_blob, remove_content)
+                db.commit()
+                self._resolved.pop(document_id, None)
+                return removed
+            except Exception:
+                db.rollback()
+                raise
+            finally:
+                db.close()
+
+    def purge_content(self, content_hash: str, remove_content: Callable[[ContentBlob], None]) -> bool:
+        """Delete content no document refers to any more; see purge_document"""
+        with self._lock:
+            db = get_db_session()
+            try:
+                db_blob = db.query(ContentBlobDB).filter(ContentBlobDB.content_hash == content_hash).first()
+                removed = db_blob is not None and self._purge_blob(db, db_blob, remove_content)
+                db.commit()
+                return removed
+            except Exception:
+                db.rollback()
+                raise
+            finally:
+                db.close()
+
+    def storage_key(self, document_id: str, user_id: str) -> Optional[str]:
+        """Storage key of the PDF behind one of the user's documents, or None if unregistered"""
+        document = self.get_document(document_id, user_id)
+        return document.storage_key if document is not None else None
+
+    def resolve(self, document_id: str) -> str:
+        """Document id whose files hold this document's content"""
+        canonical = self._resolved.get(document_id)
+        if canonical is None:
+            blob = self.get_blob(document_id)
+            canonical = blob.canonical_document_id if blob is not None else document_id
+            self._resolved[document_id] = canonical
+        return canonical
+
+    def user_document_ids(self, user_id: str) -> List[str]:
+        db = get_db_session()
+        try:
+            rows = db.query(DocumentDB.document_id).filter(
+                DocumentDB.user_id == user_id,
+                DocumentDB.status != DOCUMENT_DELETED
+            ).all()
+            return [row[0] for row in rows]
+        finally:
+            db.close()
+
+    def user_has_content(self, user_id: str, content_hash: str) -> bool:
+        db = get_db_session()
+        try:
+            return db.query(DocumentDB).filter(
+                DocumentDB.user_id == user_id,
+                DocumentDB.content_hash == content_hash,
+                DocumentDB.status != DOCUMENT_DELETED
+            ).first() is not None
+        finally:
+            db.close()
+
+# Global content registry instance
+content_registry = ContentRegistry()
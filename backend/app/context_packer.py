@@ -0,0 +1,131 @@
+"""
+Context packing
+Turns ranked retrieval hits into the document context sent to the LLM:
+  - hits are taken in maximal-marginal-relevance order, trading each hit's
+    relevance against its similarity to the hits already taken, so near
+    duplicates do not crowd out other evidence
+  - a hit is packed only while the context stays within CONTEXT_TOKEN_BUDGET
+  - hits that overlap or touch on the same page are merged back into one
+    contiguous span, so text repeated by the chunk overlap is sent once and
+    only counted once against the budget
+"""
+import os
+import logging
+from typing import List, Optional, Sequence
+
+from .chunk_store import Chunk
+from .keyword_index import tokenize
+from .embedding_batcher import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Approximate tokens of document context per prompt
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1200"))
+# Hits retrieved per question for the packer to choose from
+CONTEXT_CANDIDATES = int(os.getenv("CONTEXT_CANDIDATES", "8"))
+# 1.0 packs purely by relevance; lower values favour hits unlike those already packed
+CONTEXT_MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))
+# Chunks of a page this close together are only separated by whitespace the splitter trimmed
+CONTEXT_MERGE_GAP = 8
+
+class ContextSpan:
+    """Contiguous text of one page, assembled from one or more chunks"""
+    def __init__(self, chunk: Chunk, document_id: Optional[str], rank: int):
+        self.document_id = document_id
+        self.page = chunk.page
+        self.start = chunk.start
+        self.end = chunk.end
+        self.text = chunk.text
+        self.rank = rank  # packing order of its most relevant chunk
+        self.chunks = [chunk]
+
+    def touches(self, chunk: Chunk, document_id: Optional[str]) -> bool:
+        if document_id != self.document_id or chunk.page != self.page:
+            return False
+        if None in (chunk.start, chunk.end, self.start, self.end):
+            return False
+        return chunk.start <= self.end + CONTEXT_MERGE_GAP and chunk.end >= self.start - CONTEXT_MERGE_GAP
+
+    def merged_with(self, other: 'ContextSpan') -> 'ContextSpan':
+        """One span covering both; texts are page slices, so overlapping characters are kept once"""
+        first, second = (self, other) if self.start <= other.start else (other, self)
+        if second.start <= first.end:
+            text = first.text + second.text[first.end - second.start:] if second.end > first.end else first.text
+        else:
+            text = first.text + "\n" + second.text
+        merged = ContextSpan(first.chunks[0], self.document_id, min(self.rank, other.rank))
+        merged.start, merged.end, merged.text = first.start, max(first.end, second.end), text
+        merged.chunks = self.chunks + other.chunks
+        return merged
+
+class PackedContext:
+    """The spans chosen for a prompt and the chunks they came from"""
+    def __init__(self, spans: List[ContextSpan], hits: list, tokens: int, candidates: int):
+        self.spans = spans
+        self.hits = hits  # packed hits, most relevant first
+        self.tokens = tokens
+        self.candidates = candidates
+
+    @property
+    def text(self) -> str:
+        return "\n\n".join(span.text for span in self.spans)
+
+def _similarity(a: frozenset, b: frozenset) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+def pack_context(hits: Sequence, token_budget: int = CONTEXT_TOKEN_BUDGET,
+                 mmr_lambda: float = CONTEXT_MMR_LAMBDA) -> PackedContext:
+    """
+    Choose and merge retrieval hits into a context of at most token_budget tokens
+    hits are best first and need chunk, score and document_id attributes (RetrievedChunk)
+    """
+    candidates, seen = [], set()
+    for hit in hits:
+        key = (hit.document_id, hit.chunk.chunk_id or hit.chunk.text)
+        if key not in seen:
+            seen.add(key)
+            candidates.append(hit)
+    if not candidates:
+        return PackedContext([], [], 0, 0)
+
+    # Scores of different search modes are not comparable; relevance is scaled within this list
+    scores = [hit.score for hit in candidates]
+    low, high = min(scores), max(scores)
+    relevance = [(score - low) / (high - low) if high > low else 1.0 for score in scores]
+    terms = [frozenset(tokenize(hit.chunk.text)) for hit in candidates]
+    redundancy = [0.0] * len(candidates)
+
+    spans: List[ContextSpan] = []
+    packed = []
+    tokens = 0
+    remaining = list(range(len(candidates)))
+    while remaining:
+        best = max(remaining, key=lambda i: mmr_lambda * relevance[i] - (1 - mmr_lambda) * redundancy[i])
+        remaining.remove(best)
+        hit = candidates[best]
+
+        # Merge with every span the chunk overlaps; only the new characters cost tokens
+        span = ContextSpan(hit.chunk, hit.document_id, len(packed))
+        absorbed = [other for other in spans if other.touches(hit.chunk, hit.document_id)]
+        for other in absorbed:
+            span = span.merged_with(other)
+        cost = estimate_tokens(span.text) - sum(estimate_tokens(other.text) for other in absorbed)
+        if tokens + cost > token_budget:
+            if packed:
+                continue
+            # Even the best hit alone is over budget - send as much of it as fits
+            span.text = span.text[:token_budget * 4]
+            if span.start is not None:
+                span.end = span.start + len(span.text)
+            cost = estimate_tokens(span.text)
+
+        spans = [other for other in spans if other not in absorbed] + [span]
+        packed.append(hit)
+        tokens += cost
+        for i in remaining:
+            redundancy[i] = max(redundancy[i], _similarity(terms[i], terms[best]))
+
+    spans.sort(key=lambda span: span.rank)
+    return PackedContext(spans, packed, tokens, len(candidates))
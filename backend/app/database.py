@@ -1,8 +1,8 @@
 """
-Database configuration and models for chat history
+Database configuration and models for chat history, documents and the content registry
 Uses SQLite with SQLAlchemy ORM
 """
-from sqlalchemy import create_engine, Column, String, DateTime, Text, ForeignKey, Integer
+from sqlalchemy import create_engine, Column, String, DateTime, Text, ForeignKey, Integer, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from datetime import datetime
@@ -56,6 +56,48 @@ class ChatMessageDB(Base):
     # Relationship to session
     session = relationship("ChatSessionDB", back_populates="messages")
 
+class ContentBlobDB(Base):
+    """A distinct uploaded file, identified by the SHA-256 of its bytes"""
+    __tablename__ = "content_blobs"
+    
+    content_hash = Column(String(64), primary_key=True)
+    # Document whose chunk store, vector index and stored PDF hold this content
+    canonical_document_id = Column(String(36), nullable=False, index=True)
+    storage_key = Column(String(255), nullable=False)
+    status = Column(String(20), nullable=False)  # 'processing', 'ready' or 'failed'
+    job_id = Column(String(36), nullable=True)
+    size_bytes = Column(Integer, nullable=False)
+    page_count = Column(Integer, nullable=True)
+    text_length = Column(Integer, nullable=True)
+    chunk_count = Column(Integer, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    
+    # Relationship to the documents sharing this content
+    documents = relationship("DocumentDB", back_populates="blob")
+
+class DocumentDB(Base):
+    """A user's uploaded document; uploads of the same bytes share one content blob"""
+    __tablename__ = "documents"
+    
+    document_id = Column(String(36), primary_key=True)
+    user_id = Column(String(100), nullable=False)
+    filename = Column(String(255), nullable=False)
+    content_hash = Column(String(64), ForeignKey("content_blobs.content_hash"), nullable=False, index=True)
+    storage_key = Column(String(255), nullable=False)
+    index_path = Column(String(500), nullable=True)
+    page_count = Column(Integer, nullable=True)
+    status = Column(String(20), nullable=False)  # 'processing', 'ready', 'failed' or 'deleted' (awaiting collection)
+    upload_date = Column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    
+    # Relationship to content
+    blob = relationship("ContentBlobDB", back_populates="documents")
+    
+    __table_args__ = (
+        # Newest-first listing of a user's documents, paginated on (upload_date, document_id)
+        Index("ix_documents_user_upload_date", "user_id", "upload_date", "document_id"),
+    )
+
 def init_db():
     """Initialize database - create all tables"""
     Base.metadata.create_all(bind=engine)
@@ -0,0 +1,174 @@
+"""
+Pluggable text embedders
+EMBEDDING_BACKEND selects the implementation:
+  auto    - OpenAI embeddings (via OpenRouter or OpenAI) when an API key is set, otherwise none
+  openai  - OpenAI embeddings, requires OPENROUTER_API_KEY or OPENAI_API_KEY
+  hashing - CPU-only hashing vectorizer, no network access needed
+  none    - semantic search disabled, keyword search only
+"""
+import os
+import math
+import zlib
+import logging
+from collections import Counter
+from typing import List, Optional
+
+import numpy as np
+
+from .keyword_index import tokenize
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "auto").lower()
+EMBEDDING_DIMENSION = int(os.getenv("EMBEDDING_DIMENSION", "512"))
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "256"))
+
+class Embedder:
+    """
+    Turns texts into dense float32 vectors
+    Subclasses implement _embed_batch; batching is handled here
+    """
+    name = "base"
+    model = "base"  # identifies the vector space; part of embedding cache keys
+    dimension: Optional[int] = None
+    # Worth caching - remote embedders are slow and billed per token
+    cacheable = False
+    # Close vectors mean close meaning, not just shared words - required by the semantic answer cache
+    paraphrases = False
+
+    def __init__(self, batch_size: int = EMBEDDING_BATCH_SIZE):
+        self.batch_size = max(1, batch_size)
+
+    def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        raise NotImplementedError
+
+    def embed_documents(self, texts: List[str]) -> np.ndarray:
+        """Embed texts in batches; returns an (n, dimension) float32 matrix"""
+        if not texts:
+            return np.zeros((0, self.dimension or 0), dtype=np.float32)
+        batches = [
+            self._embed_batch(texts[start:start + self.batch_size])
+            for start in range(0, len(texts), self.batch_size)
+        ]
+        return np.vstack(batches).astype(np.float32, copy=False)
+
+    def embed_query(self, text: str) -> np.ndarray:
+        return self._embed_batch([text])[0].astype(np.float32, copy=False)
+
+class HashingEmbedder(Embedder):
+    """
+    Signed feature hashing of word unigrams and bigrams with sublinear term
+    frequency, L2-normalized; deterministic across processes and restarts
+    """
+    name = "hashing"
+
+    def __init__(self, dimension: int = EMBEDDING_DIMENSION, batch_size: int = EMBEDDING_BATCH_SIZE):
+        super().__init__(batch_size)
+        self.dimension = dimension
+        self.model = f"hashing-v1-{dimension}"
+
+    @staticmethod
+    def features(text: str) -> Counter:
+        tokens = tokenize(text)
+        features = Counter(tokens)
+        features.update(f"{first} {second}" for first, second in zip(tokens, tokens[1:]))
+        return features
+
+    def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        rows: List[int] = []
+        cols: List[int] = []
+        values: List[float] = []
+        for row, text in enumerate(texts):
+            for feature, count in self.features(text).items():
+                digest = zlib.crc32(feature.encode("utf-8"))
+                rows.append(row)
+                cols.append(digest % self.dimension)
+                # Top bit picks the sign so colliding features tend to cancel out
+                weight = 1.0 + math.log(count)
+                values.append(weight if digest & 0x80000000 else -weight)
+
+        matrix = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        np.add.at(matrix, (np.asarray(rows, dtype=np.intp), np.asarray(cols, dtype=np.intp)),
+                  np.asarray(values, dtype=np.float32))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        np.divide(matrix, norms, out=matrix, where=norms > 0)
+        return matrix
+
+class OpenAIEmbedder(Embedder):
+    """OpenAI embedding models, through OpenRouter or the OpenAI API"""
+    name = "openai"
+    cacheable = True
+    paraphrases = True
+
+    def __init__(self, client, batch_size: int = EMBEDDING_BATCH_SIZE):
+        super().__init__(batch_size)
+        self.client = client
+        self.model = f"openai:{getattr(client, 'model', 'unknown')}"
+
+    def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        vectors = np.asarray(self.client.embed_documents(texts), dtype=np.float32)
+        self.dimension = vectors.shape[1]
+        return vectors
+
+    def embed_query(self, text: str) -> np.ndarray:
+        return np.asarray(self.client.embed_query(text), dtype=np.float32)
+
+def _create_openai_embedder() -> Optional[OpenAIEmbedder]:
+    """OpenAI embeddings - check OpenRouter key first, fallback to OpenAI"""
+    openrouter_api_key = os.getenv("OPENROUTER_API_KEY")
+    openai_api_key = os.getenv("OPENAI_API_KEY")
+    if not openrouter_api_key and not openai_api_key:
+        logger.warning("No API keys found - OpenAI embeddings unavailable")
+        return None
+
+    try:
+        from langchain_openai import OpenAIEmbeddings
+    except ImportError:
+        logger.warning("langchain_openai not available - OpenAI embeddings unavailable")
+        return None
+
+    if openrouter_api_key:
+        # OpenRouter proxies OpenAI's embedding models
+        client = OpenAIEmbeddings(
+            openai_api_key=openrouter_api_key,
+            base_url="https://openrouter.ai/api/v1",
+            model="text-embedding-ada-002"
+        )
+        logger.info("OpenAI embeddings initialized with OpenRouter")
+    else:
+        client = OpenAIEmbeddings(openai_api_key=openai_api_key)
+        logger.info("OpenAI embeddings initialized")
+    return OpenAIEmbedder(client)
+
+def create_embedder(backend: str = EMBEDDING_BACKEND) -> Optional[Embedder]:
+    """Build the embedder for a backend name, or None when semantic search is disabled"""
+    try:
+        if backend == "hashing":
+            logger.info(f"Local hashing embeddings initialized ({EMBEDDING_DIMENSION} dimensions)")
+            return HashingEmbedder()
+        if backend in ("openai", "auto"):
+            return _create_openai_embedder()
+        if backend != "none":
+            logger.warning(f"Unknown EMBEDDING_BACKEND '{backend}' - semantic search disabled")
+    except Exception as e:
+        logger.warning(f"Embeddings not available - using keyword search only: {e}")
+    return None
+
+_embedder: Optional[Embedder] = None
+_embedder_loaded = False
+
+def get_embedder() -> Optional[Embedder]:
+    """
+    Shared embedder instance for the configured backend
+    Remote embedders are wrapped in the persistent embedding cache (EMBEDDING_CACHE_MAX_MB=0 disables it)
+    """
+    global _embedder, _embedder_loaded
+    if not _embedder_loaded:
+        _embedder = create_embedder()
+        if _embedder is not None and _embedder.cacheable:
+            from .embedding_cache import CachedEmbedder, embedding_cache
+            if embedding_cache.max_bytes > 0:
+                _embedder = CachedEmbedder(_embedder, embedding_cache)
+                logger.info(f"Embedding cache enabled at {embedding_cache.path}")
+        _embedder_loaded = True
+    return _embedder
@@ -0,0 +1,174 @@
+"""
+Token-budget embedding batcher
+Chunks are grouped into batches that stay under an approximate token budget,
+batches are embedded concurrently up to a fixed limit, a failed batch is
+retried on its own, and each batch is handed to the index as soon as it is done
+"""
+import os
+import asyncio
+import logging
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, Tuple
+
+import numpy as np
+
+from .embedders import Embedder
+
+logger = logging.getLogger(__name__)
+
+# Approximate tokens per request - OpenAI's embedding endpoint accepts up to 8191 per input
+# and rejects very large requests, so stay well below it
+EMBEDDING_BATCH_TOKENS = int(os.getenv("EMBEDDING_BATCH_TOKENS", "8000"))
+EMBEDDING_BATCH_MAX_ITEMS = int(os.getenv("EMBEDDING_BATCH_SIZE", "256"))
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", "3"))
+EMBEDDING_RETRY_BACKOFF = float(os.getenv("EMBEDDING_RETRY_BACKOFF", "1.0"))  # seconds, doubled per attempt
+
+# Called with (first chunk index, vectors) as each batch finishes
+BatchCallback = Callable[[int, np.ndarray], Awaitable[None]]
+# Called with (chunks embedded so far, total chunks)
+ProgressCallback = Callable[[int, int], Awaitable[None]]
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count - about four characters per token for English text"""
+    return len(text) // 4 + 1
+
+class TokenBatchAccumulator:
+    """Groups texts that arrive one at a time into contiguous batches under the token budget"""
+    def __init__(self, max_tokens: int = EMBEDDING_BATCH_TOKENS, max_items: int = EMBEDDING_BATCH_MAX_ITEMS):
+        self.max_tokens = max_tokens
+        self.max_items = max_items
+        self.start = 0
+        self.items: List = []
+        self.tokens = 0
+
+    def add(self, item, text: str) -> Optional[Tuple[int, List]]:
+        """
+        Append the next item (with its text)
+        Returns the batch it closed as (first index, items), or None if it still fit
+        """
+        text_tokens = estimate_tokens(text)
+        closed = None
+        if self.items and (self.tokens + text_tokens > self.max_tokens or len(self.items) >= self.max_items):
+            closed = self.flush()
+        self.items.append(item)
+        self.tokens += text_tokens
+        return closed
+
+    def flush(self) -> Optional[Tuple[int, List]]:
+        """Close the current batch, if it has any items"""
+        if not self.items:
+            return None
+        batch = (self.start, self.items)
+        self.start += len(self.items)
+        self.items = []
+        self.tokens = 0
+        return batch
+
+def token_batches(texts: List[str], max_tokens: int = EMBEDDING_BATCH_TOKENS,
+                  max_items: int = EMBEDDING_BATCH_MAX_ITEMS) -> List[Tuple[int, int]]:
+    """
+    Split texts into contiguous [start, end) batches under the token budget
+    A single text over the budget gets a batch of its own
+    """
+    accumulator = TokenBatchAccumulator(max_tokens, max_items)
+    batches = [accumulator.add(text, text) for text in texts]
+    batches.append(accumulator.flush())
+    return [(start, start + len(items)) for start, items in filter(None, batches)]
+
+async def _embed_with_retries(embedder: Embedder, texts: List[str], start: int,
+                              max_retries: int) -> np.ndarray:
+    attempt = 0
+    while True:
+        try:
+            return await asyncio.to_thread(embedder.embed_documents, texts)
+        except Exception as e:
+            if attempt >= max_retries:
+                raise
+            delay = EMBEDDING_RETRY_BACKOFF * (2 ** attempt)
+            attempt += 1
+            logger.warning(f"Embedding batch at chunk {start} failed ({e}) - retry {attempt}/{max_retries} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+async def embed_batch_stream(
+    embedder: Embedder,
+    batches: AsyncIterator[Tuple[int, List[str]]],
+    on_batch: BatchCallback,
+    on_progress: Optional[ProgressCallback] = None,
+    concurrency: int = EMBEDDING_CONCURRENCY,
+    max_retries: int = EMBEDDING_MAX_RETRIES
+) -> int:
+    """
+    Embed (first index, texts) batches as they are produced, at most `concurrency` requests in flight
+    The next batch is only pulled once a request slot is free, so a bounded producer
+    is held back while the embedder is busy. Batches may finish out of order;
+    on_progress gets (texts embedded, texts pulled so far). If a batch still fails
+    after its retries, the remaining batches are cancelled and the error is raised.
+    Returns: number of batches
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    tasks = set()
+    submitted = 0
+    done = 0
+    batch_count = 0
+
+    async def run_batch(start: int, texts: List[str]):
+        nonlocal done
+        try:
+            vectors = await _embed_with_retries(embedder, texts, start, max_retries)
+            await on_batch(start, vectors)
+        finally:
+            semaphore.release()
+        done += len(texts)
+        if on_progress is not None:
+            await on_progress(done, submitted)
+
+    def reap():
+        # Surface a failed batch as soon as it is noticed rather than after the producer finishes
+        for task in [task for task in tasks if task.done()]:
+            tasks.discard(task)
+            task.result()
+
+    try:
+        iterator = batches.__aiter__()
+        while True:
+            await semaphore.acquire()
+            reap()
+            try:
+                start, texts = await iterator.__anext__()
+            except StopAsyncIteration:
+                semaphore.release()
+                break
+            submitted += len(texts)
+            batch_count += 1
+            tasks.add(asyncio.create_task(run_batch(start, texts)))
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    logger.info(f"Embedded {submitted} chunks in {batch_count} batches (concurrency {concurrency})")
+    return batch_count
+
+async def embed_in_batches(
+    embedder: Embedder,
+    texts: List[str],
+    on_batch: BatchCallback,
+    on_progress: Optional[ProgressCallback] = None,
+    concurrency: int = EMBEDDING_CONCURRENCY,
+    max_retries: int = EMBEDDING_MAX_RETRIES
+) -> int:
+    """
+    Embed texts in token-budget batches, at most `concurrency` requests in flight
+    on_progress gets (embedded, total)
+    Returns: number of batches
+    """
+    async def batches():
+        for start, end in token_batches(texts):
+            yield start, texts[start:end]
+
+    async def progress(done: int, submitted: int):
+        await on_progress(done, len(texts))
+
+    return await embed_batch_stream(embedder, batches(), on_batch, progress if on_progress else None,
+                                    concurrency, max_retries)
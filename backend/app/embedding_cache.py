@@ -0,0 +1,188 @@
+"""
+Content-addressed embedding cache
+Vectors are keyed by sha256(model + text), so repeated boilerplate (headers,
+legal footers) and re-uploaded documents are only embedded once. Entries live
+in a local SQLite file capped by EMBEDDING_CACHE_MAX_MB; the least recently
+used vectors are evicted first. Questions are embedded through a small
+in-memory LRU instead, so one-off user questions never evict chunk vectors.
+Uses sqlite3 directly rather than the SQLAlchemy models in database.py - this
+is a hot key/value path with bulk lookups, not application data.
+"""
+import os
+import hashlib
+import sqlite3
+import threading
+import time
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .embedders import Embedder
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "./data/database/embedding_cache.db")
+EMBEDDING_CACHE_MAX_MB = int(os.getenv("EMBEDDING_CACHE_MAX_MB", "512"))
+# Evict down to this fraction of the cap so eviction doesn't run on every insert
+EVICTION_TARGET = 0.9
+# SQLite's default limit on bound parameters is 999
+LOOKUP_BATCH = 500
+# Question embeddings kept in memory per embedder (0 disables)
+EMBEDDING_QUERY_CACHE_ENTRIES = int(os.getenv("EMBEDDING_QUERY_CACHE_ENTRIES", "1024"))
+
+def cache_key(model: str, text: str) -> bytes:
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).digest()
+
+class EmbeddingCache:
+    """SQLite-backed map of content hash -> float32 vector with LRU eviction"""
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, max_bytes: int = EMBEDDING_CACHE_MAX_MB * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key BLOB PRIMARY KEY, vector BLOB NOT NULL, last_used INTEGER NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)")
+            self._bytes = conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()[0]
+            self._conn = conn
+        return self._conn
+
+    def get_many(self, keys: List[bytes]) -> Dict[bytes, np.ndarray]:
+        """Look up vectors by key and mark the ones found as recently used"""
+        found: Dict[bytes, np.ndarray] = {}
+        now = time.time_ns()
+        with self._lock:
+            conn = self.conn
+            for start in range(0, len(keys), LOOKUP_BATCH):
+                batch = keys[start:start + LOOKUP_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = conn.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch).fetchall()
+                for key, vector in rows:
+                    found[key] = np.frombuffer(vector, dtype=np.float32)
+                if rows:
+                    conn.execute(f"UPDATE embeddings SET last_used = ? WHERE key IN ({placeholders})", [now, *batch])
+            conn.commit()
+            self.hits += len(found)
+            self.misses += len(set(keys)) - len(found)
+        return found
+
+    def put_many(self, entries: Dict[bytes, np.ndarray]):
+        now = time.time_ns()
+        rows = [(key, np.asarray(vector, dtype=np.float32).tobytes(), now) for key, vector in entries.items()]
+        with self._lock:
+            conn = self.conn
+            for row in rows:
+                # Another batch may have stored the same text in the meantime
+                if conn.execute("INSERT OR IGNORE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)", row).rowcount:
+                    self._bytes += len(row[1])
+            if self._bytes > self.max_bytes:
+                self._evict(conn)
+            conn.commit()
+
+    def _evict(self, conn: sqlite3.Connection):
+        target = int(self.max_bytes * EVICTION_TARGET)
+        while self._bytes > target:
+            rows = conn.execute("SELECT key, LENGTH(vector) FROM embeddings ORDER BY last_used LIMIT 1000").fetchall()
+            if not rows:
+                self._bytes = 0
+                break
+            victims = []
+            for key, size in rows:
+                victims.append((key,))
+                self._bytes -= size
+                if self._bytes <= target:
+                    break
+            conn.executemany("DELETE FROM embeddings WHERE key = ?", victims)
+            self.evictions += len(victims)
+        logger.info(f"Embedding cache evicted down to {self._bytes} bytes ({self.evictions} evictions so far)")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "evictions": self.evictions
+            }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+class CachedEmbedder(Embedder):
+    """
+    Wraps an embedder so only texts not seen before (for its model) are sent to it
+    Document chunks go through the persistent cache, questions through an in-memory LRU
+    """
+    def __init__(self, inner: Embedder, cache: EmbeddingCache, query_entries: int = EMBEDDING_QUERY_CACHE_ENTRIES):
+        super().__init__(inner.batch_size)
+        self.inner = inner
+        self.cache = cache
+        self.name = inner.name
+        self.model = inner.model
+        self.paraphrases = inner.paraphrases
+        self.query_entries = query_entries
+        self._queries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._query_lock = threading.Lock()
+
+    @property
+    def dimension(self):
+        return self.inner.dimension
+
+    def embed_documents(self, texts: List[str]) -> np.ndarray:
+        keys = [cache_key(self.model, text) for text in texts]
+        vectors = self.cache.get_many(keys)
+
+        # Each distinct missing text is embedded once, even if it repeats within the batch
+        missing: Dict[bytes, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors and key not in missing:
+                missing[key] = text
+        if missing:
+            embedded = self.inner.embed_documents(list(missing.values()))
+            new_entries = dict(zip(missing.keys(), embedded))
+            self.cache.put_many(new_entries)
+            vectors.update(new_entries)
+            logger.info(f"Embedding cache: {len(texts) - len(missing)} of {len(texts)} chunks reused, {len(missing)} embedded")
+
+        if not texts:
+            return np.zeros((0, self.dimension or 0), dtype=np.float32)
+        return np.vstack([vectors[key] for key in keys]).astype(np.float32, copy=False)
+
+    def embed_query(self, text: str) -> np.ndarray:
+        with self._query_lock:
+            vector = self._queries.get(text)
+            if vector is not None:
+                self._queries.move_to_end(text)
+                return vector
+        vector = self.inner.embed_query(text)
+        if self.query_entries > 0:
+            with self._query_lock:
+                self._queries[text] = vector
+                while len(self._queries) > self.query_entries:
+                    self._queries.popitem(last=False)
+        return vector
+
+# Global embedding cache instance
+embedding_cache = EmbeddingCache()
@@ -0,0 +1,66 @@
+"""
+Hybrid retrieval helpers
+Keyword (BM25) and vector search fail in opposite ways: exact terms such as
+clause numbers or part ids rarely survive embedding, and paraphrases share no
+terms with the text. Hybrid retrieval runs both searches concurrently, each
+within its own latency budget, and merges their rankings with reciprocal-rank
+fusion: a chunk scores sum(weight / (HYBRID_RRF_K + rank)) over the rankings it
+appears in, so agreement between the two searches decides the top k and the
+incompatible raw scores (cosine similarity vs. BM25) never need calibrating.
+"""
+import os
+import time
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional, Sequence, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+# Candidates each search contributes to fusion; deeper than the final k so agreement lower down still counts
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+# Rank damping constant; larger values flatten the difference between top and lower ranks
+HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))
+HYBRID_KEYWORD_WEIGHT = float(os.getenv("HYBRID_KEYWORD_WEIGHT", "1.0"))
+HYBRID_VECTOR_WEIGHT = float(os.getenv("HYBRID_VECTOR_WEIGHT", "1.0"))
+# Per-stage latency budgets; a stage that overruns is left out of the answer
+HYBRID_KEYWORD_BUDGET_MS = float(os.getenv("HYBRID_KEYWORD_BUDGET_MS", "250"))
+# Includes embedding the question; embedding the page ranges of lazily indexed documents has its own budget
+HYBRID_VECTOR_BUDGET_MS = float(os.getenv("HYBRID_VECTOR_BUDGET_MS", "2000"))
+
+T = TypeVar("T")
+
+def reciprocal_rank_fusion(
+    rankings: Sequence[Sequence[T]],
+    key: Callable[[T], Hashable],
+    weights: Optional[Sequence[float]] = None,
+    rrf_k: int = HYBRID_RRF_K
+) -> List[Tuple[T, float]]:
+    """
+    Fuse several best-first rankings into one
+    Items are matched across rankings by key; the first ranking an item appears in supplies it
+    Returns: (item, fused score) pairs, best first; ties keep first-seen order
+    """
+    weights = weights or [1.0] * len(rankings)
+    scores: Dict[Hashable, float] = {}
+    items: Dict[Hashable, T] = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, item in enumerate(ranking, start=1):
+            item_key = key(item)
+            if item_key not in items:
+                items[item_key] = item
+            scores[item_key] = scores.get(item_key, 0.0) + weight / (rrf_k + rank)
+    return sorted(((items[item_key], score) for item_key, score in scores.items()), key=lambda pair: -pair[1])
+
+async def run_with_budget(name: str, stage: Awaitable[T], budget_ms: float) -> Optional[T]:
+    """
+    Await a retrieval stage for at most budget_ms
+    Returns: its result, or None if it overran or failed (the other stages still answer)
+    """
+    start = time.perf_counter()
+    try:
+        return await asyncio.wait_for(stage, timeout=budget_ms / 1000)
+    except asyncio.TimeoutError:
+        logger.warning(f"{name} search exceeded its {budget_ms:.0f} ms budget - answering without it")
+    except Exception as e:
+        logger.warning(f"{name} search failed after {(time.perf_counter() - start) * 1000:.0f} ms: {e}")
+    return None
@@ -0,0 +1,148 @@
+"""
+In-process LRU cache of loaded per-document retrieval structures
+Keeps each document's chunk store, keyword index, vector index and ChromaDB
+collection handle in memory so follow-up questions about the same PDF never touch disk
+"""
+import os
+import threading
+import logging
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from .chunk_store import MappedChunkStore, load_chunk_store
+from .keyword_index import KeywordIndex, load_keyword_index
+from .vector_index import VectorIndex, load_vector_index, load_lazy_vector_index
+from .content_registry import content_registry
+
+logger = logging.getLogger(__name__)
+
+INDEX_CACHE_MAX_MB = int(os.getenv("INDEX_CACHE_MAX_MB", "256"))
+
+class DocumentIndex:
+    """
+    Retrieval structures for one document's content
+    document_id is the canonical document holding the files; duplicate uploads share its entry
+    """
+    def __init__(self, document_id: str, store, keyword_index: Optional[KeywordIndex],
+                 vector_index: Optional[VectorIndex] = None):
+        self.document_id = document_id
+        self.store = store
+        self.keyword_index = keyword_index
+        self.vector_index = vector_index
+        self._collection = None
+        self.size_bytes = self._estimate_size()
+
+    def _estimate_size(self) -> int:
+        size = 1024
+        if isinstance(self.store, MappedChunkStore):
+            # Mapped pages count against the budget once they become resident
+            size += os.path.getsize(self.store.path)
+        elif self.store is not None:
+            size += sum(len(text) for text in self.store.texts) * 2
+            if self.keyword_index is not None:
+                size += sum(len(chunks) for chunks, _ in self.keyword_index.postings.values()) * 6
+        if self.keyword_index is not None:
+            # Per-term weights are computed lazily; budget for them up front
+            size += len(self.keyword_index.doc_lengths) * 64
+        if self.vector_index is not None:
+            size += self.vector_index.nbytes
+        return size
+
+    def collection(self, chroma_client):
+        """ChromaDB collection handle, looked up on first use"""
+        if self._collection is None:
+            self._collection = chroma_client.get_collection(name=f"doc_{self.document_id}")
+        return self._collection
+
+def load_document_index(document_id: str) -> Optional[DocumentIndex]:
+    """Load a document's retrieval structures from disk, or None if it has no chunk store"""
+    store = load_chunk_store(document_id)
+    if store is None:
+        return None
+    # Large documents may still be embedding page ranges on demand
+    vector_index = load_lazy_vector_index(document_id, len(store)) or load_vector_index(document_id)
+    if vector_index is not None and len(vector_index) != len(store):
+        # Left over from an ingestion whose embedding step failed - rows no longer match chunks
+        logger.warning(f"Vector index for document {document_id} does not match its chunk store - ignoring it")
+        vector_index = None
+    return DocumentIndex(document_id, store, load_keyword_index(document_id, store), vector_index)
+
+class IndexCache:
+    """
+    LRU cache bounded by the estimated memory of its entries
+    Entries are dropped rather than closed on eviction, so requests still
+    holding one can finish; the memory is released once they let go
+    """
+    def __init__(self, max_bytes: int = INDEX_CACHE_MAX_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, DocumentIndex]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, document_id: str) -> Optional[DocumentIndex]:
+        """Return the document's cached index, loading it on a miss"""
+        document_id = content_registry.resolve(document_id)
+        with self._lock:
+            entry = self._entries.get(document_id)
+            if entry is not None:
+                self._entries.move_to_end(document_id)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        entry = load_document_index(document_id)
+        if entry is None:
+            return None
+
+        with self._lock:
+            existing = self._entries.pop(document_id, None)
+            if existing is not None:
+                self._bytes -= existing.size_bytes
+            self._entries[document_id] = entry
+            self._bytes += entry.size_bytes
+            self._evict()
+        logger.info(f"Loaded retrieval index for document {document_id} ({entry.size_bytes} bytes)")
+        return entry
+
+    def _evict(self):
+        # Always keep the most recently used entry, even if it alone exceeds the budget
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            document_id, entry = self._entries.popitem(last=False)
+            self._bytes -= entry.size_bytes
+            self.evictions += 1
+            logger.info(f"Evicted retrieval index for document {document_id}")
+
+    def invalidate(self, document_id: str):
+        """Drop a document's entry (after re-ingestion or deletion)"""
+        document_id = content_registry.resolve(document_id)
+        with self._lock:
+            entry = self._entries.pop(document_id, None)
+            if entry is not None:
+                self._bytes -= entry.size_bytes
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations
+            }
+
+# Global index cache instance
+index_cache = IndexCache()
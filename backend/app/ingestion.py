@@ -0,0 +1,221 @@
+"""
+Background ingestion job queue
+Uploads are queued and processed by a pool of asyncio workers so the HTTP
+request returns immediately; blocking stages run in worker threads
+"""
+import asyncio
+import os
+import uuid
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Callable, Awaitable
+
+from .content_registry import content_registry
+
+logger = logging.getLogger(__name__)
+
+INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", "2"))
+INGESTION_QUEUE_SIZE = int(os.getenv("INGESTION_QUEUE_SIZE", "100"))
+INGESTION_JOB_HISTORY = int(os.getenv("INGESTION_JOB_HISTORY", "1000"))
+
+# Job states
+JOB_QUEUED = "queued"
+JOB_PROCESSING = "processing"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+
+class IngestionQueueFull(Exception):
+    """Raised when the ingestion queue has no free slots"""
+
+class IngestionJob:
+    """State of a single document ingestion"""
+    def __init__(self, document_id: str, user_id: str, filename: str, file_path: str, storage_key: str,
+                 content_hash: Optional[str] = None, delete_file: bool = True):
+        self.job_id = str(uuid.uuid4())
+        self.document_id = document_id
+        self.user_id = user_id
+        self.filename = filename
+        self.file_path = file_path
+        self.storage_key = storage_key
+        self.content_hash = content_hash  # SHA-256 of the file, registered in the content registry
+        self.delete_file = delete_file  # remove file_path when the job ends (it is not the stored copy)
+        self.status = JOB_QUEUED
+        self.stage = "queued"
+        self.progress = 0
+        self.page_count: Optional[int] = None
+        self.text_length: Optional[int] = None
+        self.chunk_count: Optional[int] = None
+        self.index_path: Optional[str] = None
+        self.lazy = False  # embeddings are built on demand after the job completes
+        self.storage_url: Optional[str] = None
+        self.error: Optional[str] = None
+        self.created_at = datetime.now()
+        self.updated_at = self.created_at
+
+    @property
+    def room(self) -> str:
+        """Socket.IO room that receives progress events for this job"""
+        return f"job_{self.job_id}"
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (JOB_COMPLETED, JOB_FAILED)
+
+    def to_dict(self) -> Dict:
+        return {
+            'job_id': self.job_id,
+            'document_id': self.document_id,
+            'filename': self.filename,
+            'status': self.status,
+            'stage': self.stage,
+            'progress': self.progress,
+            'page_count': self.page_count,
+            'text_length': self.text_length,
+            'chunk_count': self.chunk_count,
+            'lazy': self.lazy,
+            'error': self.error,
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat()
+        }
+
+ProgressCallback = Callable[[IngestionJob], Awaitable[None]]
+
+class IngestionManager:
+    """
+    Bounded job queue with a fixed pool of workers
+    Each job stores the file, then runs extract -> chunk -> embed/index as a streaming pipeline
+    """
+    def __init__(self, worker_count: int = INGESTION_WORKERS, queue_size: int = INGESTION_QUEUE_SIZE):
+        self.worker_count = max(1, worker_count)
+        self.queue_size = queue_size
+        self.jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._progress_callbacks: List[ProgressCallback] = []
+
+    def add_progress_callback(self, callback: ProgressCallback):
+        """Register a coroutine called on every job state change"""
+        self._progress_callbacks.append(callback)
+
+    @property
+    def queue(self) -> asyncio.Queue:
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.queue_size)
+        return self._queue
+
+    async def start(self):
+        """Start the worker pool (called on application startup)"""
+        if self._workers:
+            return
+        for n in range(self.worker_count):
+            self._workers.append(asyncio.create_task(self._worker(n)))
+        logger.info(f"Ingestion workers started: {self.worker_count} workers, queue size {self.queue_size}")
+
+    async def stop(self):
+        """Cancel the worker pool (called on application shutdown)"""
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def submit(self, job: IngestionJob) -> IngestionJob:
+        """Queue a job; raises IngestionQueueFull when the queue is at capacity"""
+        try:
+            self.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise IngestionQueueFull(f"Ingestion queue is full ({self.queue_size} jobs)")
+        self.jobs[job.job_id] = job
+        self._prune_history()
+        logger.info(f"Queued ingestion job {job.job_id} for document {job.document_id}")
+        return job
+
+    def get_job(self, job_id: str) -> Optional[IngestionJob]:
+        return self.jobs.get(job_id)
+
+    def stats(self) -> Dict:
+        return {
+            'workers': self.worker_count,
+            'queue_size': self.queue_size,
+            'queued': self.queue.qsize(),
+            'processing': sum(1 for job in self.jobs.values() if job.status == JOB_PROCESSING)
+        }
+
+    def _prune_history(self):
+        """Forget the oldest finished jobs once the history limit is reached"""
+        excess = len(self.jobs) - INGESTION_JOB_HISTORY
+        if excess <= 0:
+            return
+        for job_id in [job_id for job_id, job in self.jobs.items() if job.finished][:excess]:
+            del self.jobs[job_id]
+
+    async def _report(self, job: IngestionJob, stage: str, progress: int, status: str = JOB_PROCESSING):
+        job.stage = stage
+        job.progress = progress
+        job.status = status
+        job.updated_at = datetime.now()
+        for callback in self._progress_callbacks:
+            try:
+                await callback(job)
+            except Exception as e:
+                logger.warning(f"Ingestion progress callback failed for job {job.job_id}: {e}")
+
+    async def _worker(self, worker_number: int):
+        while True:
+            job = await self.queue.get()
+            try:
+                await self._run_job(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                job.error = getattr(e, "detail", None) or str(e)
+                logger.error(f"Ingestion job {job.job_id} failed: {job.error}")
+                if job.content_hash:
+                    # Later uploads of the same bytes will be processed again instead of linked
+                    content_registry.mark_failed(job.content_hash)
+                await self._report(job, job.stage, job.progress, status=JOB_FAILED)
+            finally:
+                self.queue.task_done()
+                if job.delete_file:
+                    try:
+                        os.unlink(job.file_path)
+                    except OSError:
+                        pass
+
+    async def _run_job(self, job: IngestionJob):
+        from .pdf_processing import extract_text_from_pdf, count_pdf_pages, upload_to_s3, index_pages
+        from .pdf_extraction import read_toc
+        from .lazy_index import lazy_indexing_enabled
+
+        await self._report(job, "storing", 5)
+        job.storage_url = await asyncio.to_thread(upload_to_s3, job.file_path, job.storage_key)
+
+        # Extraction, chunking and embedding overlap, so they are reported as one stage
+        job.page_count = await asyncio.to_thread(count_pdf_pages, job.file_path)
+        # Very large documents get keyword search now and embeddings on demand
+        job.lazy = lazy_indexing_enabled(job.page_count)
+        toc = await asyncio.to_thread(read_toc, job.file_path) if job.lazy else None
+        await self._report(job, "indexing", 10)
+
+        async def indexing_progress(done: int, total: int):
+            progress = 10 + (89 * done) // max(total, 1)
+            if progress > job.progress:
+                await self._report(job, "indexing", progress)
+
+        result = await index_pages(extract_text_from_pdf(job.file_path), job.document_id,
+                                   page_count=job.page_count, on_progress=indexing_progress,
+                                   lazy=job.lazy, toc=toc)
+        job.page_count = result.page_count
+        job.text_length = result.text_length
+        job.chunk_count = result.chunk_count
+        job.index_path = result.index_path
+
+        if job.content_hash:
+            content_registry.mark_ready(job.content_hash, job.page_count, job.text_length, job.chunk_count,
+                                        job.index_path)
+
+        logger.info(f"Ingestion job {job.job_id} completed for document {job.document_id}")
+        await self._report(job, "completed", 100, status=JOB_COMPLETED)
+
+# Global ingestion manager instance
+ingestion_manager = IngestionManager()
@@ -0,0 +1,179 @@
+"""
+Streaming ingestion pipeline
+A document is processed by three concurrent stages connected by bounded queues:
+  extract - pulls page texts from a page generator in a worker thread
+  chunk   - splits each page, appends its chunks to the chunk store and keyword
+            index, and groups chunks into token-budget embedding batches
+  embed   - embeds batches concurrently and hands the vectors to the index
+A full queue blocks the stage feeding it, so a slow embedder holds extraction
+back instead of letting pages pile up; memory stays flat whatever the PDF size.
+"""
+import os
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+
+from .chunk_store import Chunk, ChunkStoreWriter
+from .keyword_index import KeywordIndexBuilder
+from .embedders import Embedder
+from .embedding_batcher import TokenBatchAccumulator, embed_batch_stream
+
+logger = logging.getLogger(__name__)
+
+# Pages extracted ahead of the chunker
+PIPELINE_PAGE_QUEUE_SIZE = int(os.getenv("PIPELINE_PAGE_QUEUE_SIZE", "16"))
+# Embedding batches chunked ahead of the embedder
+PIPELINE_BATCH_QUEUE_SIZE = int(os.getenv("PIPELINE_BATCH_QUEUE_SIZE", "4"))
+
+# End-of-stream marker passed through the queues
+_END = object()
+
+# (page number, page text) -> chunks of that page
+PageChunker = Callable[[int, str], List[Chunk]]
+# Called in a worker thread with (page number, page text) for every page, in page order
+PageCallback = Callable[[int, str], None]
+# Called with (first chunk index, chunks, vectors) as each batch is embedded
+VectorsCallback = Callable[[int, List[Chunk], np.ndarray], Awaitable[None]]
+# Called with (chunks done, estimated total chunks)
+ProgressCallback = Callable[[int, int], Awaitable[None]]
+
+class PipelineResult:
+    """What ingesting one document produced"""
+    def __init__(self, page_count: int, text_length: int, chunk_count: int, store_path: str):
+        self.page_count = page_count
+        self.text_length = text_length
+        self.chunk_count = chunk_count
+        self.store_path = store_path
+        self.index_path = store_path  # replaced by the vector index path when there is one
+
+class IngestionPipeline:
+    """
+    Runs extract -> chunk -> embed for one document
+    Without an embedder only the chunk store and keyword index are built
+    """
+    def __init__(self, document_id: str, chunk_page: PageChunker,
+                 embedder: Optional[Embedder] = None,
+                 on_vectors: Optional[VectorsCallback] = None,
+                 on_page: Optional[PageCallback] = None,
+                 on_progress: Optional[ProgressCallback] = None,
+                 page_count: Optional[int] = None,
+                 page_queue_size: int = PIPELINE_PAGE_QUEUE_SIZE,
+                 batch_queue_size: int = PIPELINE_BATCH_QUEUE_SIZE):
+        self.document_id = document_id
+        self.chunk_page = chunk_page
+        self.embedder = embedder if on_vectors is not None else None
+        self.on_vectors = on_vectors
+        self.on_page = on_page
+        self.on_progress = on_progress
+        self.page_count = page_count  # expected pages, used for progress estimates only
+        self._pages: asyncio.Queue = asyncio.Queue(maxsize=max(1, page_queue_size))
+        self._batches: asyncio.Queue = asyncio.Queue(maxsize=max(1, batch_queue_size))
+        self._store: Optional[ChunkStoreWriter] = None
+        self._keywords = KeywordIndexBuilder()
+        self._in_flight: Dict[int, List[Chunk]] = {}
+        self._pages_done = 0
+        self._text_length = 0
+        self._extraction_done = False
+
+    @property
+    def chunk_count(self) -> int:
+        return len(self._store) if self._store is not None else 0
+
+    def estimated_chunk_count(self) -> int:
+        """Chunks so far, extrapolated to the whole document while pages are still coming"""
+        if self._extraction_done or not self.page_count or not self._pages_done:
+            return self.chunk_count
+        return max(self.chunk_count, self.chunk_count * self.page_count // self._pages_done)
+
+    async def _report(self, done: int):
+        if self.on_progress is not None:
+            await self.on_progress(done, self.estimated_chunk_count())
+
+    async def _extract(self, pages: Iterator[str]):
+        while True:
+            page_text = await asyncio.to_thread(next, pages, _END)
+            await self._pages.put(page_text)
+            if page_text is _END:
+                return
+
+    def _add_page(self, page_number: int, page_text: str) -> List[Chunk]:
+        """Record one page - runs in a worker thread, one page at a time"""
+        if self.on_page is not None:
+            self.on_page(page_number, page_text)
+        chunks = self.chunk_page(page_number, page_text)
+        for chunk in chunks:
+            self._store.add(chunk)
+            self._keywords.add(chunk.text)
+        self._text_length += len(page_text)
+        self._pages_done = page_number
+        return chunks
+
+    async def _chunk(self):
+        accumulator = TokenBatchAccumulator()
+        while True:
+            page_text = await self._pages.get()
+            if page_text is _END:
+                break
+            chunks = await asyncio.to_thread(self._add_page, self._pages_done + 1, page_text)
+            if self.embedder is None:
+                await self._report(self.chunk_count)
+                continue
+            for chunk in chunks:
+                batch = accumulator.add(chunk, chunk.text)
+                if batch is not None:
+                    await self._batches.put(batch)
+        self._extraction_done = True
+        if self.embedder is not None:
+            batch = accumulator.flush()
+            if batch is not None:
+                await self._batches.put(batch)
+            await self._batches.put(_END)
+
+    async def _embed(self):
+        async def batches():
+            while True:
+                batch = await self._batches.get()
+                if batch is _END:
+                    return
+                start, chunks = batch
+                self._in_flight[start] = chunks
+                yield start, [chunk.text for chunk in chunks]
+
+        async def write_batch(start: int, vectors: np.ndarray):
+            await self.on_vectors(start, self._in_flight.pop(start), vectors)
+
+        async def progress(done: int, submitted: int):
+            await self._report(done)
+
+        await embed_batch_stream(self.embedder, batches(), write_batch, progress)
+
+    async def run(self, pages: Iterator[str]) -> PipelineResult:
+        """
+        Consume the page generator and build the document's chunk store and keyword index,
+        embedding chunks along the way; the chunk store is committed once every stage is done
+        """
+        self._store = ChunkStoreWriter(self.document_id)
+        stages = [asyncio.create_task(self._extract(pages)), asyncio.create_task(self._chunk())]
+        if self.embedder is not None:
+            stages.append(asyncio.create_task(self._embed()))
+        try:
+            await asyncio.gather(*stages)
+            keyword_index = self._keywords.build()
+            store_path = await asyncio.to_thread(self._store.commit, keyword_index)
+        except BaseException:
+            for stage in stages:
+                stage.cancel()
+            await asyncio.gather(*stages, return_exceptions=True)
+            self._store.abort()
+            raise
+        finally:
+            try:
+                pages.close()
+            except (AttributeError, ValueError):
+                # Not a generator, or still running in an abandoned extraction thread
+                pass
+
+        logger.info(f"Ingested document {self.document_id}: {self._pages_done} pages, {self.chunk_count} chunks")
+        return PipelineResult(self._pages_done, self._text_length, self.chunk_count, store_path)
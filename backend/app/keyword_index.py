@@ -0,0 +1,154 @@
+"""
+BM25 keyword index
+Built once at ingestion and persisted in the postings section of the
+document's chunk store; queries only touch the postings of the query terms
+"""
+import math
+import re
+import heapq
+import logging
+from array import array
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from .chunk_store import load_chunk_store, save_chunk_store
+
+logger = logging.getLogger(__name__)
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have how i in is it its of on or that the this to
+was were what when where which who why will with do does did can you your about into
+""".split())
+
+def tokenize(text: str) -> List[str]:
+    """Tokenizer shared by indexing and querying"""
+    return [token for token in _TOKEN_RE.findall(text.lower()) if token not in STOPWORDS]
+
+class KeywordIndex:
+    """
+    Inverted index over a document's chunks
+    postings maps term -> (chunk indexes, term frequencies); it is a dict when
+    built in memory and a MappedPostings view when loaded from a chunk store
+    """
+    def __init__(self, doc_lengths, postings,
+                 k1: float = BM25_K1, b: float = BM25_B):
+        self.doc_lengths = doc_lengths
+        self.postings = postings
+        self.k1 = k1
+        self.b = b
+        self.doc_count = len(doc_lengths)
+        self.avg_doc_length = (sum(doc_lengths) / self.doc_count) if self.doc_count else 0.0
+        self._idf: Dict[str, float] = {}
+        self._weights: Dict[str, array] = {}
+
+    @classmethod
+    def build(cls, texts: List[str]) -> 'KeywordIndex':
+        builder = KeywordIndexBuilder()
+        for text in texts:
+            builder.add(text)
+        return builder.build()
+
+    def idf(self, term: str, entry) -> float:
+        value = self._idf.get(term)
+        if value is None:
+            df = len(entry[0])
+            value = math.log(1 + (self.doc_count - df + 0.5) / (df + 0.5))
+            self._idf[term] = value
+        return value
+
+    def weights(self, term: str, entry) -> array:
+        """Per-posting BM25 term weights (without idf), computed on first use of the term"""
+        weights = self._weights.get(term)
+        if weights is None:
+            k1, b = self.k1, self.b
+            norm = b / self.avg_doc_length if self.avg_doc_length else 0.0
+            doc_lengths = self.doc_lengths
+            chunk_indexes, freqs = entry
+            weights = array('d', (
+                tf * (k1 + 1) / (tf + k1 * (1 - b + norm * doc_lengths[chunk_index]))
+                for chunk_index, tf in zip(chunk_indexes, freqs)
+            ))
+            self._weights[term] = weights
+        return weights
+
+    def max_score(self, query: str) -> float:
+        """
+        Score of a chunk matching every query term at saturation - an upper bound on search scores
+        Terms the document lacks count at the idf of an unseen term, so dividing by this makes
+        scores of different documents comparable (the fraction of the query a chunk covers)
+        """
+        k1 = self.k1
+        total = 0.0
+        for term in set(tokenize(query)):
+            entry = self.postings.get(term)
+            if entry is not None:
+                total += self.idf(term, entry) * (k1 + 1)
+            else:
+                total += math.log(1 + (self.doc_count + 0.5) / 0.5) * (k1 + 1)
+        return total
+
+    def search(self, query: str, k: int = 3) -> List[Tuple[int, float]]:
+        """
+        Score chunks against the query
+        Returns: up to k (chunk_index, score) pairs, best first
+        """
+        if not self.doc_count:
+            return []
+
+        scores: Dict[int, float] = {}
+        get = scores.get
+        for term in set(tokenize(query)):
+            entry = self.postings.get(term)
+            if entry is None:
+                continue
+            idf = self.idf(term, entry)
+            for chunk_index, weight in zip(entry[0], self.weights(term, entry)):
+                scores[chunk_index] = get(chunk_index, 0.0) + idf * weight
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+class KeywordIndexBuilder:
+    """Builds a KeywordIndex one chunk at a time, in chunk order"""
+    def __init__(self):
+        self.doc_lengths = array('I')
+        self._term_chunks: Dict[str, array] = {}
+        self._term_freqs: Dict[str, array] = {}
+
+    def add(self, text: str):
+        chunk_index = len(self.doc_lengths)
+        tokens = tokenize(text)
+        self.doc_lengths.append(len(tokens))
+        for term, freq in Counter(tokens).items():
+            if term not in self._term_chunks:
+                self._term_chunks[term] = array('I')
+                self._term_freqs[term] = array('H')
+            self._term_chunks[term].append(chunk_index)
+            self._term_freqs[term].append(min(freq, 0xFFFF))
+
+    def build(self) -> KeywordIndex:
+        postings = {term: (self._term_chunks[term], self._term_freqs[term]) for term in self._term_chunks}
+        return KeywordIndex(self.doc_lengths, postings)
+
+def load_keyword_index(document_id: str, store=None) -> Optional[KeywordIndex]:
+    """
+    Load a document's BM25 index from the postings section of its chunk store
+    Stores written without postings (including legacy JSON stores) get the
+    index built on first use and are rewritten in the binary format with it
+    """
+    store = store if store is not None else load_chunk_store(document_id)
+    if store is None:
+        return None
+
+    postings = store.postings()
+    if postings is not None:
+        doc_lengths, mapped_postings = postings
+        return KeywordIndex(doc_lengths, mapped_postings)
+
+    logger.info(f"Building missing keyword index for document {document_id} ({len(store)} chunks)")
+    index = KeywordIndex.build(store.texts)
+    save_chunk_store(document_id, list(store), index)
+    return index
@@ -0,0 +1,281 @@
+"""
+Lazy indexing of very large PDFs
+Documents with at least LAZY_INDEX_PAGE_THRESHOLD pages are ingested without
+embeddings: the upload only extracts text and builds the chunk store, the BM25
+keyword index, the PDF outline and a table of page ranges, so questions can be
+answered (by keyword) seconds after upload. The first question that points
+into a page range - through its keyword hits or a matching outline entry -
+embeds that range, and a background task fills in the remaining ranges while
+the server is otherwise idle.
+"""
+import os
+import json
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from functools import lru_cache
+from typing import List, Optional
+
+import numpy as np
+
+from .chunk_store import CHUNK_STORE_DIR, load_chunk_store
+from .embedders import get_embedder
+from .keyword_index import tokenize
+from .vector_index import (
+    VECTOR_BACKEND, LazyVectorIndex, create_lazy_vector_index, vector_ranges_path
+)
+from .index_cache import index_cache, DocumentIndex
+
+logger = logging.getLogger(__name__)
+
+# Documents with at least this many pages are indexed lazily; 0 disables lazy indexing
+LAZY_INDEX_PAGE_THRESHOLD = int(os.getenv("LAZY_INDEX_PAGE_THRESHOLD", "500"))
+LAZY_INDEX_RANGE_PAGES = int(os.getenv("LAZY_INDEX_RANGE_PAGES", "20"))
+# Ranges a single question may embed before it is answered
+LAZY_INDEX_MAX_RANGES_PER_QUERY = int(os.getenv("LAZY_INDEX_MAX_RANGES_PER_QUERY", "3"))
+# How long a question waits for its ranges; separate from the semantic search budget,
+# since a remote embedder takes seconds per range
+LAZY_INDEX_QUERY_BUDGET_MS = float(os.getenv("LAZY_INDEX_QUERY_BUDGET_MS", "15000"))
+# Background filling waits until no question has been asked for this long
+LAZY_INDEX_IDLE_SECONDS = float(os.getenv("LAZY_INDEX_IDLE_SECONDS", "5"))
+# Keyword hits consulted when choosing the ranges to embed for a question
+LAZY_INDEX_KEYWORD_HITS = 8
+# Outline entries matching a question that are embedded
+LAZY_INDEX_TOC_ENTRIES = 2
+# How often the background task checks whether the server has gone idle
+LAZY_INDEX_POLL_SECONDS = 1.0
+# Pause before retrying a document whose range failed to embed
+LAZY_INDEX_RETRY_SECONDS = 30.0
+
+def toc_path(document_id: str) -> str:
+    return os.path.join(CHUNK_STORE_DIR, f"doc_{document_id}.toc.json")
+
+def lazy_indexing_enabled(page_count: Optional[int]) -> bool:
+    """Whether a document of this size is indexed lazily (NumPy vector backend with embeddings only)"""
+    return (
+        LAZY_INDEX_PAGE_THRESHOLD > 0
+        and page_count is not None
+        and page_count >= LAZY_INDEX_PAGE_THRESHOLD
+        and VECTOR_BACKEND == "numpy"
+        and get_embedder() is not None
+    )
+
+def start_lazy_index(document_id: str, page_count: int, toc: List[list]) -> str:
+    """
+    Record the outline and page ranges of a freshly ingested document
+    Returns: path to the range table
+    """
+    store = load_chunk_store(document_id)
+    try:
+        pages = np.asarray(store.page_numbers(), dtype=np.int64)
+    finally:
+        if hasattr(store, "close"):
+            store.close()
+    with open(toc_path(document_id), 'w', encoding='utf-8') as f:
+        json.dump({"page_count": page_count, "toc": toc}, f, ensure_ascii=False)
+    create_lazy_vector_index(document_id, pages, page_count, LAZY_INDEX_RANGE_PAGES)
+    return vector_ranges_path(document_id)
+
+@lru_cache(maxsize=64)
+def load_toc(document_id: str) -> tuple:
+    """Outline entries as (level, title tokens, first page, last page) tuples"""
+    try:
+        with open(toc_path(document_id), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return ()
+    toc = data.get("toc", [])
+    page_count = data.get("page_count") or 0
+    entries = []
+    for position, (level, title, page) in enumerate(toc):
+        # A section runs until the next entry at the same or a higher level
+        last_page = page_count
+        for next_level, _, next_page in toc[position + 1:]:
+            if next_level <= level:
+                last_page = max(page, next_page - 1)
+                break
+        entries.append((level, frozenset(tokenize(title)), page, last_page))
+    return tuple(entries)
+
+def toc_pages(document_id: str, question: str) -> List[int]:
+    """First page of each page range covered by the outline sections the question mentions"""
+    terms = set(tokenize(question))
+    if not terms:
+        return []
+    matches = sorted(
+        ((len(terms & title_terms), level, first, last) for level, title_terms, first, last in load_toc(document_id)),
+        key=lambda match: (-match[0], match[1])
+    )
+    pages = []
+    for overlap, _, first, last in matches[:LAZY_INDEX_TOC_ENTRIES]:
+        if overlap:
+            pages.extend(range(first, last + 1, LAZY_INDEX_RANGE_PAGES))
+    return pages
+
+def candidate_ranges(doc_index: DocumentIndex, question: str) -> List[int]:
+    """Page ranges a question points at, most relevant first"""
+    index = doc_index.vector_index
+    pages = []
+    if doc_index.keyword_index is not None:
+        for chunk_index, _ in doc_index.keyword_index.search(question, k=LAZY_INDEX_KEYWORD_HITS):
+            pages.append(doc_index.store.get(chunk_index).page)
+    pages.extend(toc_pages(doc_index.document_id, question))
+    return index.ranges_for_pages(page for page in pages if page is not None)
+
+def embed_ranges(doc_index: DocumentIndex, range_indexes: List[int], embedder) -> int:
+    """
+    Embed and store the given ranges that are not filled yet
+    Blocking - call through asyncio.to_thread from async code
+    Returns: number of ranges filled
+    """
+    index = doc_index.vector_index
+    filled = 0
+    for range_index in index.missing(range_indexes):
+        first, end = index.rows(range_index)
+        vectors = embedder.embed_documents([doc_index.store.text(row) for row in range(first, end)])
+        if index.fill(range_index, vectors):
+            filled += 1
+    if index.complete:
+        index.finish()
+    return filled
+
+def lazily_indexed(doc_index: Optional[DocumentIndex]) -> bool:
+    """Whether a document's vector index still has page ranges to embed"""
+    index = doc_index.vector_index if doc_index is not None else None
+    return isinstance(index, LazyVectorIndex) and not index.complete
+
+def index_ranges_for_question(doc_index: DocumentIndex, question: str):
+    """
+    Make sure the page ranges a question points at are embedded before it is searched
+    No-op for documents that are not lazily indexed. Blocking.
+    """
+    index = doc_index.vector_index
+    if not isinstance(index, LazyVectorIndex) or index.complete:
+        return
+    embedder = get_embedder()
+    if embedder is None:
+        return
+    missing = index.missing(candidate_ranges(doc_index, question))[:LAZY_INDEX_MAX_RANGES_PER_QUERY]
+    if not missing:
+        return
+    start = time.perf_counter()
+    filled = embed_ranges(doc_index, missing, embedder)
+    logger.info(
+        f"Embedded {filled} page ranges of document {doc_index.document_id} on demand in "
+        f"{(time.perf_counter() - start) * 1000:.0f} ms ({index.filled_count}/{len(index.ranges)} ranges indexed)"
+    )
+
+async def index_ranges_within_budget(doc_index: DocumentIndex, question: str,
+                                    budget_ms: float = LAZY_INDEX_QUERY_BUDGET_MS) -> bool:
+    """
+    Embed the ranges a question points at off the event loop, waiting at most budget_ms
+    After an overrun embedding carries on in the background and the question searches
+    the ranges filled so far
+    Returns: whether the ranges were embedded in time
+    """
+    indexing = asyncio.ensure_future(asyncio.to_thread(index_ranges_for_question, doc_index, question))
+    try:
+        await asyncio.wait_for(asyncio.shield(indexing), timeout=budget_ms / 1000)
+        return True
+    except asyncio.TimeoutError:
+        logger.warning(
+            f"Embedding page ranges of document {doc_index.document_id} exceeded its {budget_ms:.0f} ms budget - "
+            f"searching the {doc_index.vector_index.filled_count}/{len(doc_index.vector_index.ranges)} ranges indexed so far"
+        )
+    except Exception as e:
+        logger.warning(f"Embedding page ranges of document {doc_index.document_id} failed: {e}")
+    return False
+
+class LazyIndexer:
+    """Background task that fills lazily indexed documents one range at a time while the server is idle"""
+    def __init__(self, idle_seconds: float = LAZY_INDEX_IDLE_SECONDS):
+        self.idle_seconds = idle_seconds
+        self._pending: "OrderedDict[str, None]" = OrderedDict()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._last_activity = time.monotonic()
+        self.ranges_filled = 0
+
+    def touch(self):
+        """Note that a question is being answered - background filling backs off"""
+        self._last_activity = time.monotonic()
+
+    def schedule(self, document_id: str):
+        self._pending[document_id] = None
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def discard(self, document_id: str):
+        self._pending.pop(document_id, None)
+
+    async def start(self):
+        """Start the background task, resuming documents left partially indexed (called on application startup)"""
+        if self._task is not None:
+            return
+        self._wakeup = asyncio.Event()
+        if os.path.isdir(CHUNK_STORE_DIR):
+            for name in sorted(os.listdir(CHUNK_STORE_DIR)):
+                if name.startswith("doc_") and name.endswith(".ranges.npy"):
+                    self.schedule(name[len("doc_"):-len(".ranges.npy")])
+        if self._pending:
+            self._wakeup.set()
+            logger.info(f"Resuming lazy indexing of {len(self._pending)} documents")
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Cancel the background task (called on application shutdown)"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def _idle(self) -> bool:
+        from .ingestion import ingestion_manager
+        if time.monotonic() - self._last_activity < self.idle_seconds:
+            return False
+        stats = ingestion_manager.stats()
+        return stats['queued'] == 0 and stats['processing'] == 0
+
+    async def _run(self):
+        while True:
+            if not self._pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            if not self._idle():
+                await asyncio.sleep(LAZY_INDEX_POLL_SECONDS)
+                continue
+
+            document_id = next(iter(self._pending))
+            try:
+                finished = await asyncio.to_thread(self._fill_next_range, document_id)
+            except Exception as e:
+                logger.warning(f"Background indexing of document {document_id} failed: {e} - retrying later")
+                self._pending.move_to_end(document_id)
+                await asyncio.sleep(LAZY_INDEX_RETRY_SECONDS)
+                continue
+            if finished:
+                self._pending.pop(document_id, None)
+
+    def _fill_next_range(self, document_id: str) -> bool:
+        """Embed one more range of a document; returns True once it needs no more work"""
+        embedder = get_embedder()
+        doc_index = index_cache.get(document_id)
+        if embedder is None or doc_index is None or not isinstance(doc_index.vector_index, LazyVectorIndex):
+            return True
+        index = doc_index.vector_index
+        range_index = index.next_missing()
+        if range_index is not None:
+            self.ranges_filled += embed_ranges(doc_index, [range_index], embedder)
+        else:
+            index.finish()
+        if not index.complete:
+            return False
+        # Reload as an ordinary read-only vector index
+        index_cache.invalidate(document_id)
+        logger.info(f"Lazy indexing of document {document_id} complete")
+        return True
+
+# Global lazy indexer instance
+lazy_indexer = LazyIndexer()
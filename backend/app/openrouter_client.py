@@ -1,10 +1,21 @@
 """
 Custom OpenRouter client to bypass OpenAI client library issues
+Uses a shared httpx.AsyncClient so LLM calls never block the event loop
+
+Identical requests in flight at the same time (same model, messages and
+sampling parameters - typically a team asking the same question about a
+shared document) are coalesced: one upstream call is made and every caller
+receives its result, or, when streaming, every chunk of it. A caller that
+goes away stops waiting without affecting the others; the upstream call is
+only cancelled once no caller is left.
 """
-import requests
+import httpx
+import json
 import os
+import asyncio
+import hashlib
 import logging
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, AsyncIterator
 from dotenv import load_dotenv
 
 # Ensure environment variables are loaded
@@ -12,8 +23,76 @@ load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+# Connection pool and timeout settings (seconds)
+OPENROUTER_TIMEOUT = float(os.getenv("OPENROUTER_TIMEOUT", "30"))
+OPENROUTER_CONNECT_TIMEOUT = float(os.getenv("OPENROUTER_CONNECT_TIMEOUT", "5"))
+OPENROUTER_MAX_CONNECTIONS = int(os.getenv("OPENROUTER_MAX_CONNECTIONS", "200"))
+OPENROUTER_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENROUTER_MAX_KEEPALIVE_CONNECTIONS", "50"))
+OPENROUTER_KEEPALIVE_EXPIRY = float(os.getenv("OPENROUTER_KEEPALIVE_EXPIRY", "60"))
+# Share one upstream call between identical concurrent requests (0 disables)
+OPENROUTER_COALESCE = int(os.getenv("OPENROUTER_COALESCE", "1"))
+
+def request_key(data: Dict[str, Any]) -> str:
+    """Hash of a completion request body; requests with equal keys get the same completion"""
+    return hashlib.sha256(json.dumps(data, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+class CompletionFlight:
+    """One upstream completion call shared by every caller waiting on it"""
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+class StreamFlight:
+    """
+    One upstream completion stream fanned out to every caller
+    Chunks are kept until the stream ends, so callers joining late still receive the whole answer
+    """
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.error: Optional[BaseException] = None
+        self.finished = False
+        self.waiters = 0
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def run(self, source: AsyncIterator[str]):
+        try:
+            async for chunk in source:
+                self.chunks.append(chunk)
+                self._notify()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.finished = True
+            self._notify()
+
+    async def subscribe(self) -> AsyncIterator[str]:
+        position = 0
+        while True:
+            if position < len(self.chunks):
+                position += 1
+                yield self.chunks[position - 1]
+            elif self.finished:
+                if self.error is not None:
+                    raise self.error
+                return
+            else:
+                await self._changed.wait()
+
 class OpenRouterClient:
-    def __init__(self, api_key: str):
+    def __init__(
+        self,
+        api_key: str,
+        timeout: float = OPENROUTER_TIMEOUT,
+        connect_timeout: float = OPENROUTER_CONNECT_TIMEOUT,
+        max_connections: int = OPENROUTER_MAX_CONNECTIONS,
+        max_keepalive_connections: int = OPENROUTER_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry: float = OPENROUTER_KEEPALIVE_EXPIRY
+    ):
         self.api_key = api_key
         self.base_url = "https://openrouter.ai/api/v1"
         self.headers = {
@@ -22,67 +101,192 @@ class OpenRouterClient:
             "HTTP-Referer": "http://localhost:3000",
             "X-Title": "PDFPixie Assistant"
         }
-    
-    def chat_completion(
-        self, 
-        messages: List[Dict[str, str]], 
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        self._http: Optional[httpx.AsyncClient] = None
+        self.coalesce = bool(OPENROUTER_COALESCE)
+        self._completions: Dict[str, CompletionFlight] = {}
+        self._streams: Dict[str, StreamFlight] = {}
+        self.coalesced_requests = 0
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        """Shared keep-alive connection pool, created on first use"""
+        if self._http is None or self._http.is_closed:
+            self._http = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=self.headers,
+                timeout=self.timeout,
+                limits=self.limits
+            )
+        return self._http
+
+    async def chat_completion(
+        self,
+        messages: List[Dict[str, str]],
         model: str = "meta-llama/llama-3.1-8b-instruct",
         max_tokens: int = 500,
         temperature: float = 0.7
     ) -> Optional[str]:
         """
         Create a chat completion using OpenRouter API
+        Joins an identical request already in flight instead of sending another
         """
+        data = {
+            "model": model,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": temperature
+        }
+        if not self.coalesce:
+            return await self._chat_completion(data)
+
+        key = request_key(data)
+        flight = self._completions.get(key)
+        if flight is None:
+            flight = CompletionFlight(asyncio.create_task(self._chat_completion(data)))
+            self._completions[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(self._completions, key, flight))
+        else:
+            self.coalesced_requests += 1
+            logger.info(f"Joining identical OpenRouter request in flight ({flight.waiters} waiting)")
+
+        flight.waiters += 1
         try:
-            data = {
-                "model": model,
-                "messages": messages,
-                "max_tokens": max_tokens,
-                "temperature": temperature
-            }
-            
-            response = requests.post(
-                f"{self.base_url}/chat/completions",
-                headers=self.headers,
-                json=data,
-                timeout=30
-            )
-            
+            # Shielded: a caller being cancelled must not cancel the call others wait on
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Every caller has gone away - nobody needs the answer any more
+                self._forget(self._completions, key, flight)
+                flight.task.cancel()
+
+    @staticmethod
+    def _forget(flights: Dict[str, Any], key: str, flight):
+        """Remove a finished or abandoned flight so later requests start a new one"""
+        if flights.get(key) is flight:
+            del flights[key]
+
+    async def _chat_completion(self, data: Dict[str, Any]) -> Optional[str]:
+        try:
+            response = await self.http.post("/chat/completions", json=data)
+
             if response.status_code == 200:
                 result = response.json()
                 return result["choices"][0]["message"]["content"]
             else:
                 logger.error(f"OpenRouter API error: {response.status_code} - {response.text}")
                 return None
-                
+
         except Exception as e:
             logger.error(f"OpenRouter client error: {str(e)}")
             return None
-    
-    def is_available(self) -> bool:
+
+    async def stream_chat_completion(
+        self,
+        messages: List[Dict[str, str]],
+        model: str = "meta-llama/llama-3.1-8b-instruct",
+        max_tokens: int = 500,
+        temperature: float = 0.7
+    ) -> AsyncIterator[str]:
+        """
+        Stream a chat completion from OpenRouter's SSE endpoint
+        Yields incremental content deltas as they arrive; identical streams in flight are shared
+        """
+        data = {
+            "model": model,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "stream": True
+        }
+        if not self.coalesce:
+            async for chunk in self._stream_chat_completion(data):
+                yield chunk
+            return
+
+        key = request_key(data)
+        flight = self._streams.get(key)
+        if flight is None:
+            flight = StreamFlight()
+            flight.task = asyncio.create_task(flight.run(self._stream_chat_completion(data)))
+            self._streams[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(self._streams, key, flight))
+        else:
+            self.coalesced_requests += 1
+            logger.info(f"Joining identical OpenRouter stream in flight ({flight.waiters} waiting)")
+
+        flight.waiters += 1
+        try:
+            async for chunk in flight.subscribe():
+                yield chunk
+        finally:
+            # Runs when the caller finishes, fails or stops iterating (e.g. its client disconnected)
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.finished:
+                self._forget(self._streams, key, flight)
+                flight.task.cancel()
+
+    async def _stream_chat_completion(self, data: Dict[str, Any]) -> AsyncIterator[str]:
+        async with self.http.stream("POST", "/chat/completions", json=data) as response:
+            if response.status_code != 200:
+                body = await response.aread()
+                logger.error(f"OpenRouter API error: {response.status_code} - {body.decode('utf-8', 'replace')}")
+                return
+
+            async for line in response.aiter_lines():
+                # SSE comments (e.g. ": OPENROUTER PROCESSING") and blank keep-alive lines
+                if not line.startswith("data:"):
+                    continue
+                payload = line[5:].strip()
+                if payload == "[DONE]":
+                    break
+                try:
+                    event = json.loads(payload)
+                except json.JSONDecodeError:
+                    logger.warning(f"Skipping malformed OpenRouter stream event: {payload[:100]}")
+                    continue
+                if "error" in event:
+                    logger.error(f"OpenRouter stream error: {event['error']}")
+                    break
+                choices = event.get("choices") or []
+                if not choices:
+                    continue
+                delta = choices[0].get("delta", {}).get("content")
+                if delta:
+                    yield delta
+
+    async def is_available(self) -> bool:
         """Check if OpenRouter is available"""
         try:
-            response = requests.get(
-                f"{self.base_url}/models",
-                headers=self.headers,
-                timeout=10
-            )
+            response = await self.http.get("/models", timeout=10)
             return response.status_code == 200
         except Exception:
             return False
 
+    async def aclose(self):
+        """Close the connection pool"""
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
 # Global OpenRouter client instance
 openrouter_client = None
 
 def get_openrouter_client() -> Optional[OpenRouterClient]:
     """Get the global OpenRouter client instance"""
     global openrouter_client
-    
+
     if openrouter_client is None:
         api_key = os.getenv("OPENROUTER_API_KEY")
         if api_key and api_key != "your-openrouter-api-key":
             openrouter_client = OpenRouterClient(api_key)
-    
+
     return openrouter_client
 
 def is_openrouter_enabled() -> bool:
@@ -90,15 +294,20 @@ def is_openrouter_enabled() -> bool:
     client = get_openrouter_client()
     return client is not None  # Just check if client exists, don't test API availability here
 
-def generate_response(messages: List[Dict[str, str]]) -> str:
+async def close_openrouter_client():
+    """Release pooled connections (called on application shutdown)"""
+    if openrouter_client is not None:
+        await openrouter_client.aclose()
+
+async def generate_response(messages: List[Dict[str, str]]) -> str:
     """
     Generate a response using OpenRouter or mock response
     """
     client = get_openrouter_client()
-    
+
     if client:
         logger.info("Attempting to generate response with OpenRouter...")
-        response = client.chat_completion(messages)
+        response = await client.chat_completion(messages)
         if response:
             logger.info(f"OpenRouter response generated successfully (length: {len(response)} chars)")
             return response
@@ -106,8 +315,37 @@ def generate_response(messages: List[Dict[str, str]]) -> str:
             logger.error("OpenRouter returned None - API call failed")
     else:
         logger.warning("OpenRouter client not available - API key not configured")
-    
+
     # Fallback to mock response
     user_message = messages[-1]["content"] if messages else "Hello"
     logger.info("Using fallback mock response")
-    return f"Mock response: I received your message '{user_message[:100]}...'. This is a development response since OpenRouter API call failed or is not configured."
\ No newline at end of file
+    return f"Mock response: I received your message '{user_message[:100]}...'. This is a development response since OpenRouter API call failed or is not configured."
+
+async def generate_response_stream(messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+    """
+    Stream a response using OpenRouter, falling back to the mock response
+    when the API is not configured or produced nothing
+    """
+    client = get_openrouter_client()
+    received = False
+
+    if client:
+        logger.info("Attempting to stream response with OpenRouter...")
+        try:
+            async for chunk in client.stream_chat_completion(messages):
+                received = True
+                yield chunk
+        except Exception as e:
+            logger.error(f"OpenRouter streaming error: {str(e)}")
+            if received:
+                # Partial answer already delivered - don't append a mock response to it
+                return
+        if received:
+            return
+        logger.error("OpenRouter stream returned no content - API call failed")
+    else:
+        logger.warning("OpenRouter client not available - API key not configured")
+
+    user_message = messages[-1]["content"] if messages else "Hello"
+    logger.info("Using fallback mock response")
+    yield f"Mock response: I received your message '{user_message[:100]}...'. This is a development response since OpenRouter API call failed or is not configured."
@@ -1,16 +1,14 @@
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, Form
+from fastapi import APIRouter, Depends, HTTPException, Form, Request, Query
 from fastapi.responses import JSONResponse, FileResponse
-from typing import List, Optional
+from typing import Iterator, List, Optional, Callable, Awaitable, Union
+import asyncio
 import os
-import tempfile
-import shutil
+import base64
 import logging
 from pydantic import BaseModel
 import uuid
 from datetime import datetime
 from pathlib import Path
-import fitz  # PyMuPDF
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 
 # Optional imports for production use
 try:
@@ -22,14 +20,6 @@ except ImportError:
     logger = logging.getLogger(__name__)
     logger.warning("boto3 not available - S3 features disabled for local development")
 
-try:
-    from langchain_openai import OpenAIEmbeddings
-    LANGCHAIN_OPENAI_AVAILABLE = True
-except ImportError:
-    LANGCHAIN_OPENAI_AVAILABLE = False
-    logger = logging.getLogger(__name__)
-    logger.warning("langchain_openai not available - using mock embeddings for local development")
-
 try:
     import chromadb
     from chromadb.config import Settings
@@ -40,6 +30,20 @@ except ImportError:
     logger.warning("chromadb not available - using mock storage for local development")
 
 from .auth import verify_token, UserInfo
+from .pdf_extraction import extract_pages, iter_pages, count_pages
+from .chunk_store import Chunk, make_chunk_id, CHUNK_STORE_DIR
+from .text_splitter import RecursiveTextSplitter
+from .index_cache import index_cache
+from .answer_cache import answer_cache
+from .semantic_cache import semantic_cache
+from .embedders import get_embedder
+from .vector_index import VECTOR_BACKEND, VectorIndexWriter
+from .ingestion_pipeline import IngestionPipeline, PipelineResult
+from .lazy_index import lazy_indexer, start_lazy_index
+from .ingestion import ingestion_manager, IngestionJob, IngestionQueueFull, JOB_COMPLETED, JOB_PROCESSING
+from .content_registry import content_registry, CONTENT_READY, CONTENT_PROCESSING
+from .upload_stream import receive_pdf_upload, content_storage_key, discard_upload, store_upload
+from .storage_gc import storage_collector
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -51,14 +55,42 @@ class UploadResponse(BaseModel):
     status: str
     page_count: int
     text_length: int
+    job_id: Optional[str] = None
+
+class JobStatusResponse(BaseModel):
+    job_id: str
+    document_id: str
+    filename: str
+    status: str
+    stage: str
+    progress: int
+    page_count: Optional[int] = None
+    text_length: Optional[int] = None
+    chunk_count: Optional[int] = None
+    lazy: bool = False
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
 
 class DocumentInfo(BaseModel):
     document_id: str
     filename: str
     upload_date: datetime
-    page_count: int
+    page_count: Optional[int] = None
     status: str
 
+class DocumentListResponse(BaseModel):
+    """One page of GET /documents?limit=&cursor="""
+    documents: List[DocumentInfo]
+    next_cursor: Optional[str] = None  # pass as ?cursor= to get the next page; None on the last page
+
+# Separates pages in persisted extracted text; form feeds inside a page are saved as newlines
+PAGE_SEPARATOR = "\f"
+
+# Documents per page of GET /documents when paginated without a limit
+DOCUMENT_PAGE_SIZE = 50
+MAX_DOCUMENT_PAGE_SIZE = 200
+
 # AWS S3 configuration
 S3_BUCKET = os.getenv("S3_BUCKET_NAME", "newchat-documents")
 
@@ -81,38 +113,11 @@ except Exception as e:
     S3_ENABLED = False
     logger.warning(f"S3 client not available - using local storage for development: {e}")
 
-# Initialize OpenAI embeddings - check OpenRouter key first, fallback to OpenAI
-if LANGCHAIN_OPENAI_AVAILABLE:
-    try:
-        openrouter_api_key = os.getenv("OPENROUTER_API_KEY")
-        openai_api_key = os.getenv("OPENAI_API_KEY")
-        
-        if openrouter_api_key:
-            # Use OpenRouter for embeddings (they proxy OpenAI's embedding models)
-            embeddings = OpenAIEmbeddings(
-                openai_api_key=openrouter_api_key,
-                base_url="https://openrouter.ai/api/v1",
-                model="text-embedding-ada-002"
-            )
-            EMBEDDINGS_ENABLED = True
-            logger.info("OpenAI embeddings initialized with OpenRouter")
-        elif openai_api_key:
-            # Fallback to direct OpenAI API
-            embeddings = OpenAIEmbeddings(openai_api_key=openai_api_key)
-            EMBEDDINGS_ENABLED = True
-            logger.info("OpenAI embeddings initialized")
-        else:
-            embeddings = None
-            EMBEDDINGS_ENABLED = False
-            logger.warning("No API keys found - using mock embeddings")
-    except Exception as e:
-        embeddings = None
-        EMBEDDINGS_ENABLED = False
-        logger.warning(f"OpenAI embeddings not available - using mock mode for development: {e}")
-else:
-    embeddings = None
-    EMBEDDINGS_ENABLED = False
-    logger.warning("langchain_openai not available - using mock embeddings for local development")
+# Embedder for the configured EMBEDDING_BACKEND (OpenAI, local hashing, or none)
+embeddings = get_embedder()
+EMBEDDINGS_ENABLED = embeddings is not None
+if not EMBEDDINGS_ENABLED:
+    logger.warning("No embedding backend configured - using mock embeddings")
 
 # Initialize ChromaDB client only if available
 if CHROMADB_AVAILABLE:
@@ -129,35 +134,100 @@ else:
     CHROMADB_ENABLED = False
     logger.warning("ChromaDB not available - using mock storage for development")
 
-# Text splitter for chunking
-text_splitter = RecursiveCharacterTextSplitter(
+# Text splitter for chunking (same chunks as LangChain's RecursiveCharacterTextSplitter)
+text_splitter = RecursiveTextSplitter(
     chunk_size=500,
-    chunk_overlap=50,
-    length_function=len,
+    chunk_overlap=50
 )
 
-def extract_text_from_pdf(pdf_path: str) -> tuple[str, int]:
+def extract_pages_from_pdf(pdf_path: str) -> List[str]:
     """
-    Extract text from PDF using PyMuPDF
-    Returns: (extracted_text, page_count)
+    Extract the text of each page using PyMuPDF
+    Large documents are extracted in parallel across worker processes
+    Returns: list of page texts in page order
     """
     try:
-        doc = fitz.open(pdf_path)
-        text_content = ""
-        page_count = len(doc)
-        
-        for page_num in range(page_count):
-            page = doc[page_num]
-            text_content += page.get_text()
-            text_content += "\n\n"  # Add page breaks
+        return extract_pages(pdf_path)
         
-        doc.close()
-        return text_content, page_count
+    except Exception as e:
+        logger.error(f"Error extracting text from PDF: {e}")
+        raise HTTPException(status_code=500, detail="Failed to extract text from PDF")
+
+def extracted_text_path(document_id: str) -> str:
+    return os.path.join(CHUNK_STORE_DIR, f"doc_{document_id}.txt")
+
+class ExtractedTextWriter:
+    """
+    Persists a document's extracted text page by page, pages separated by form feeds
+    Duplicate uploads and text requests read it instead of re-parsing the PDF
+    """
+    def __init__(self, document_id: str):
+        self.path = extracted_text_path(document_id)
+        self._tmp_path = f"{self.path}.tmp"
+        self._file = None
+        self._pages = 0
+
+    def _open(self):
+        os.makedirs(CHUNK_STORE_DIR, exist_ok=True)
+        self._file = open(self._tmp_path, 'w', encoding='utf-8')
+
+    def write_page(self, page_number: int, page_text: str):
+        if self._file is None:
+            self._open()
+        if self._pages:
+            self._file.write(PAGE_SEPARATOR)
+        self._file.write(page_text.replace(PAGE_SEPARATOR, "\n"))
+        self._pages += 1
+
+    def commit(self) -> str:
+        if self._file is None:
+            self._open()
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+        return self.path
+
+    def abort(self):
+        if self._file is not None:
+            self._file.close()
+        try:
+            os.unlink(self._tmp_path)
+        except FileNotFoundError:
+            pass
+
+def save_extracted_text(document_id: str, pages: List[str]) -> str:
+    """Persist a document's extracted text"""
+    writer = ExtractedTextWriter(document_id)
+    for page_number, page_text in enumerate(pages, start=1):
+        writer.write_page(page_number, page_text)
+    return writer.commit()
+
+def load_extracted_text(document_id: str) -> Optional[List[str]]:
+    """Pages of a document's extracted text, or None if it was never saved"""
+    path = extracted_text_path(content_registry.resolve(document_id))
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read().split(PAGE_SEPARATOR)
+
+def extract_text_from_pdf(pdf_path: str) -> Iterator[str]:
+    """
+    Yield the text of each page using PyMuPDF, in page order
+    Large documents are extracted in parallel, a bounded number of page ranges ahead
+    """
+    try:
+        yield from iter_pages(pdf_path)
         
     except Exception as e:
         logger.error(f"Error extracting text from PDF: {e}")
         raise HTTPException(status_code=500, detail="Failed to extract text from PDF")
 
+def count_pdf_pages(pdf_path: str) -> int:
+    try:
+        return count_pages(pdf_path)
+    except Exception as e:
+        logger.error(f"Error opening PDF: {e}")
+        raise HTTPException(status_code=500, detail="Failed to extract text from PDF")
+
 def upload_to_s3(file_path: str, s3_key: str) -> str:
     """
     Upload file to S3 and return the S3 URL
@@ -171,11 +241,12 @@ def upload_to_s3(file_path: str, s3_key: str) -> str:
         # Create the local file path
         local_file_path = local_storage_dir / s3_key.replace("/", "_")
         
-        # Copy the file to local storage
-        import shutil
-        shutil.copy2(file_path, local_file_path)
-        
-        logger.info(f"File saved locally: {local_file_path}")
+        # Streamed uploads are already written to their storage location
+        if not (local_file_path.exists() and os.path.samefile(file_path, local_file_path)):
+            # Copy the file to local storage
+            import shutil
+            shutil.copy2(file_path, local_file_path)
+            logger.info(f"File saved locally: {local_file_path}")
         return f"local://{local_file_path}"
     
     try:
@@ -193,138 +264,371 @@ def upload_to_s3(file_path: str, s3_key: str) -> str:
         logger.error(f"Error uploading to S3: {e}")
         raise HTTPException(status_code=500, detail="Failed to upload file to storage")
 
-def create_embeddings(text: str, document_id: str) -> str:
+def delete_from_storage(s3_key: str):
+    """Remove a stored file; missing files are ignored"""
+    if not S3_ENABLED:
+        try:
+            os.unlink(Path("./data/uploads") / s3_key.replace("/", "_"))
+        except FileNotFoundError:
+            pass
+        return
+    
+    try:
+        s3_client.delete_object(Bucket=S3_BUCKET, Key=s3_key)
+    except ClientError as e:
+        logger.error(f"Error deleting {s3_key} from S3: {e}")
+        raise HTTPException(status_code=500, detail="Failed to delete file from storage")
+
+def stored_files(prefix: str) -> Iterator[tuple[str, float]]:
+    """(storage key, last modified timestamp) of every stored file under a key prefix"""
+    if not S3_ENABLED:
+        local_prefix = prefix.replace("/", "_")
+        local_storage_dir = Path("./data/uploads")
+        if not local_storage_dir.exists():
+            return
+        for path in local_storage_dir.glob(f"{local_prefix}*"):
+            # Local names flatten "/" to "_"; the prefix is the only part restored
+            yield prefix + path.name[len(local_prefix):], path.stat().st_mtime
+        return
+    
+    try:
+        paginator = s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=S3_BUCKET, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                yield obj['Key'], obj['LastModified'].timestamp()
+    except ClientError as e:
+        logger.error(f"Error listing {prefix} in S3: {e}")
+        raise HTTPException(status_code=500, detail="Failed to list stored files")
+
+def document_storage_key(document_id: str, user_id: str) -> str:
+    """
+    Storage key of a document's PDF
+    Duplicate uploads point at the file stored for the first upload of the same content
+    """
+    return content_registry.storage_key(document_id, user_id) or f"documents/{user_id}/{document_id}.pdf"
+
+def list_user_document_ids(user_id: str) -> List[str]:
+    """
+    Ids of the documents a user has uploaded: those in the content registry plus any
+    stored under documents/{user_id}/{document_id}.pdf from before the registry
+    """
+    return sorted(set(content_registry.user_document_ids(user_id)) | set(stored_user_document_ids(user_id)))
+
+def stored_user_document_ids(user_id: str) -> List[str]:
+    """Ids of the PDFs stored under the user's storage prefix"""
+    prefix = f"documents/{user_id}/"
+    if not S3_ENABLED:
+        local_prefix = prefix.replace("/", "_")
+        local_storage_dir = Path("./data/uploads")
+        if not local_storage_dir.exists():
+            return []
+        return sorted(
+            path.name[len(local_prefix):-len(".pdf")]
+            for path in local_storage_dir.glob(f"{local_prefix}*.pdf")
+        )
+    
+    try:
+        document_ids = []
+        paginator = s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=S3_BUCKET, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                if obj['Key'].endswith(".pdf"):
+                    document_ids.append(obj['Key'][len(prefix):-len(".pdf")])
+        return sorted(document_ids)
+    except ClientError as e:
+        logger.error(f"Error listing documents in S3: {e}")
+        raise HTTPException(status_code=500, detail="Failed to list documents")
+
+def split_page(page_text: str) -> List[tuple[int, int]]:
     """
-    Create embeddings from text and save to local storage
-    For local development, uses mock storage when dependencies are unavailable
+    Split one page into chunks
+    Returns: (start, end) character offsets of each chunk within the page
+    """
+    return text_splitter.split_spans(page_text)
+
+def page_chunks(document_id: str, page_number: int, page_text: str) -> List[Chunk]:
+    """Split one page into chunks, keeping the page number and offsets of every chunk"""
+    return [
+        Chunk(
+            chunk_id=make_chunk_id(document_id, page_number, start, end),
+            text=page_text[start:end],
+            page=page_number,
+            start=start,
+            end=end
+        )
+        for start, end in split_page(page_text)
+    ]
+
+def chunk_pages(pages: List[str], document_id: str) -> List[Chunk]:
+    """
+    Split each page into chunks, keeping the page number and offsets of every chunk
+    """
+    chunks = []
+    for page_number, page_text in enumerate(pages, start=1):
+        chunks.extend(page_chunks(document_id, page_number, page_text))
+    return chunks
+
+async def create_embeddings(pages: List[str], document_id: str) -> str:
+    """
+    Create embeddings from page texts and save to local storage
     Returns: path to saved collection
     """
+    result = await index_pages(iter(pages), document_id, page_count=len(pages))
+    return result.index_path
+
+async def index_pages(
+    pages: Iterator[str],
+    document_id: str,
+    page_count: Optional[int] = None,
+    on_progress: Optional[Callable[[int, int], Awaitable[None]]] = None,
+    lazy: bool = False,
+    toc: Optional[List[list]] = None
+) -> PipelineResult:
+    """
+    Ingest a document from its page texts as they are extracted: save the extracted
+    text, the chunk store and keyword index, and embed chunks into its vector index
+    (VECTOR_BACKEND: the NumPy index next to the chunk store, or a ChromaDB collection)
+    Extraction, chunking and embedding run concurrently; on_progress gets
+    (chunks embedded, estimated total chunks)
+    With lazy=True (very large documents) nothing is embedded up front: the page
+    ranges and outline (toc) are recorded and ranges are embedded on demand
+    For local development, only the chunk store is written when dependencies are unavailable
+    """
+    text_writer = ExtractedTextWriter(document_id)
+    writer = None
+    collection_name = None
+    on_vectors = None
+    
+    use_numpy_index = EMBEDDINGS_ENABLED and VECTOR_BACKEND == "numpy"
     try:
-        # Split text into chunks
-        chunks = text_splitter.split_text(text)
-        
-        if not CHROMADB_ENABLED or not EMBEDDINGS_ENABLED:
-            # Mock mode for local development
-            logger.info(f"Mock embeddings creation for document {document_id} with {len(chunks)} chunks")
-            # Create local directory for mock storage
-            import os
-            mock_dir = f"./data/mock_embeddings"
-            os.makedirs(mock_dir, exist_ok=True)
-            
-            # Save chunks to a simple JSON file for mock retrieval
-            import json
-            mock_data = {
-                "document_id": document_id,
-                "chunks": chunks,
-                "created_at": str(datetime.now())
-            }
+        if lazy:
+            logger.info(f"Lazy indexing for document {document_id} ({page_count} pages) - embeddings deferred")
+        elif use_numpy_index:
+            writer = VectorIndexWriter(document_id)
+            # Batches finish concurrently; the writer's row bookkeeping takes one write at a time
+            write_lock = asyncio.Lock()
             
-            mock_file = f"{mock_dir}/doc_{document_id}.json"
-            with open(mock_file, 'w', encoding='utf-8') as f:
-                json.dump(mock_data, f, ensure_ascii=False, indent=2)
+            async def on_vectors(start: int, chunks: List[Chunk], vectors):
+                async with write_lock:
+                    await asyncio.to_thread(writer.write, start, vectors)
+        elif CHROMADB_ENABLED and EMBEDDINGS_ENABLED:
+            # Real ChromaDB implementation
+            collection_name = f"doc_{document_id}"
+            collection = chroma_client.get_or_create_collection(
+                name=collection_name,
+                metadata={"document_id": document_id}
+            )
             
-            return mock_file
-        
-        # Real ChromaDB implementation
-        collection_name = f"doc_{document_id}"
-        collection = chroma_client.get_or_create_collection(
-            name=collection_name,
-            metadata={"document_id": document_id}
-        )
-        
-        # Generate embeddings for chunks
-        chunk_embeddings = embeddings.embed_documents(chunks)
-        
-        # Add documents to collection
-        collection.add(
-            documents=chunks,
-            embeddings=chunk_embeddings,
-            ids=[f"{document_id}_{i}" for i in range(len(chunks))]
+            async def on_vectors(start: int, chunks: List[Chunk], vectors):
+                # Add documents to collection
+                await asyncio.to_thread(
+                    collection.add,
+                    documents=[chunk.text for chunk in chunks],
+                    embeddings=vectors.tolist(),
+                    ids=[chunk.chunk_id for chunk in chunks],
+                    metadatas=[{"page": chunk.page, "start": chunk.start, "end": chunk.end} for chunk in chunks]
+                )
+        else:
+            # Mock mode for local development
+            logger.info(f"Mock embeddings creation for document {document_id} - keyword index only")
+        
+        # The chunk store and keyword index are always written - they back keyword search and source lookups
+        pipeline = IngestionPipeline(
+            document_id,
+            chunk_page=lambda page_number, page_text: page_chunks(document_id, page_number, page_text),
+            embedder=embeddings,
+            on_vectors=on_vectors,
+            on_page=text_writer.write_page,
+            on_progress=on_progress,
+            page_count=page_count
         )
-        
-        # Return collection path info
-        collection_path = f"./data/chromadb/{collection_name}"
-        
-        return collection_path
-        
-    except Exception as e:
+        result = await pipeline.run(pages)
+        await asyncio.to_thread(text_writer.commit)
+        if writer is not None:
+            result.index_path = await asyncio.to_thread(writer.commit)
+        elif collection_name is not None:
+            # Return collection path info
+            result.index_path = f"./data/chromadb/{collection_name}"
+        elif lazy:
+            result.index_path = await asyncio.to_thread(start_lazy_index, document_id, result.page_count, toc or [])
+            lazy_indexer.schedule(document_id)
+        return result
+        
+    except BaseException as e:
+        text_writer.abort()
+        if writer is not None:
+            writer.abort()
+        if isinstance(e, HTTPException) or not isinstance(e, Exception):
+            raise
         logger.error(f"Error creating embeddings: {e}")
         raise HTTPException(status_code=500, detail="Failed to create document embeddings")
+    finally:
+        # Re-ingestion replaces the document's index files - drop any cached copy and answers from the old one
+        index_cache.invalidate(document_id)
+        answer_cache.invalidate(document_id)
+        semantic_cache.invalidate(document_id)
 
-@router.post("/upload", response_model=UploadResponse)
+@router.post(
+    "/upload",
+    response_model=UploadResponse,
+    openapi_extra={"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": {
+        "type": "object", "required": ["file"], "properties": {"file": {"type": "string", "format": "binary"}}
+    }}}}}
+)
 async def upload_pdf(
-    file: UploadFile = File(...),
+    request: Request,
     current_user: UserInfo = Depends(verify_token)
 ):
     """
-    Upload and process PDF file
+    Upload a PDF file and queue it for background processing
+    The body is streamed straight to its content-addressed location in one pass
+    Progress is reported on the job_{job_id} Socket.IO room and via /jobs/{job_id}
     """
-    # Validate file type
-    if not file.filename.lower().endswith('.pdf'):
-        raise HTTPException(status_code=400, detail="Only PDF files are allowed")
+    # Validates the file type and size while streaming; the file is stored as content_{sha256}.pdf on registration
+    upload = await receive_pdf_upload(request)
     
     document_id = str(uuid.uuid4())
+    storage_key = content_storage_key(upload.content_hash)
+    registered = False
+    
+    def store_content(blob, duplicate: bool):
+        if not duplicate:
+            store_upload(upload, reuse_existing=False)
+        elif not S3_ENABLED and blob.storage_key == storage_key:
+            # Reuse the stored copy of the same bytes, or restore it if it has gone missing
+            store_upload(upload, reuse_existing=True)
+        else:
+            # The content is stored elsewhere (S3, or a legacy key) - this copy is not needed
+            discard_upload(upload.temp_path)
     
     try:
-        # Create temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
-            # Save uploaded file
-            shutil.copyfileobj(file.file, temp_file)
-            temp_path = temp_file.name
-        
-        # Extract text from PDF
-        text_content, page_count = extract_text_from_pdf(temp_path)
-        
-        # Upload to S3
-        s3_key = f"documents/{current_user.user_id}/{document_id}.pdf"
-        s3_url = upload_to_s3(temp_path, s3_key)
-        
-        # Create embeddings
-        index_path = create_embeddings(text_content, document_id)
-        
-        # TODO: Save document metadata to PostgreSQL
-        # - document_id, filename, user_id, s3_key, index_path, page_count, upload_date
+        job = IngestionJob(
+            document_id=document_id,
+            user_id=current_user.user_id,
+            filename=upload.filename,
+            file_path=upload.path,
+            storage_key=storage_key,
+            content_hash=upload.content_hash,
+            # Locally the received file is the stored copy; with S3 it is only needed until uploaded
+            delete_file=S3_ENABLED
+        )
+        blob, duplicate = content_registry.register_upload(
+            upload.content_hash, document_id, current_user.user_id, upload.filename, upload.size_bytes, storage_key,
+            job.job_id, store_content
+        )
+        registered = True
+        
+        if duplicate:
+            # Same bytes as an earlier upload - reuse its stored file, text, chunk store and indexes
+            ready = blob.status == CONTENT_READY
+            logger.info(f"Linked upload {upload.filename} for user {current_user.user_id} to existing document {blob.canonical_document_id}")
+            return UploadResponse(
+                document_id=document_id,
+                filename=upload.filename,
+                status=JOB_COMPLETED if ready else JOB_PROCESSING,
+                page_count=blob.page_count or 0,
+                text_length=blob.text_length or 0,
+                job_id=None if ready else blob.job_id
+            )
         
-        # Clean up temporary file
-        os.unlink(temp_path)
+        ingestion_manager.submit(job)
         
-        logger.info(f"Successfully processed PDF: {file.filename} for user: {current_user.user_id}")
+        logger.info(f"Queued PDF for processing: {upload.filename} for user: {current_user.user_id} (job {job.job_id})")
         
         return UploadResponse(
             document_id=document_id,
-            filename=file.filename,
-            status="processed",
-            page_count=page_count,
-            text_length=len(text_content)
+            filename=upload.filename,
+            status=job.status,
+            page_count=0,
+            text_length=0,
+            job_id=job.job_id
         )
         
+    except IngestionQueueFull as e:
+        # No other upload of this content is stored or processing, or it would have been linked
+        discard_upload(upload.path)
+        content_registry.release(document_id)
+        logger.warning(f"Rejecting upload {upload.filename}: {e}")
+        raise HTTPException(status_code=503, detail="Too many documents are being processed. Please try again shortly.")
     except Exception as e:
-        # Clean up on error
-        if 'temp_path' in locals():
-            try:
-                os.unlink(temp_path)
-            except:
-                pass
+        if registered:
+            content_registry.release(document_id)
+        else:
+            discard_upload(upload.temp_path)
         
         logger.error(f"Error processing PDF upload: {e}")
         raise HTTPException(status_code=500, detail="Failed to process PDF file")
 
-@router.get("/documents", response_model=List[DocumentInfo])
-async def list_documents(current_user: UserInfo = Depends(verify_token)):
+@router.get("/jobs/{job_id}", response_model=JobStatusResponse)
+async def get_job_status(
+    job_id: str,
+    current_user: UserInfo = Depends(verify_token)
+):
     """
-    List all documents for the current user
+    Get the status and progress of a background ingestion job
     """
-    # TODO: Implement database query to get user's documents
-    # For now, return mock data
-    return [
+    job = ingestion_manager.get_job(job_id)
+    
+    # Users who uploaded the same file while it was processing share its job
+    if not job or (job.user_id != current_user.user_id and
+                   not (job.content_hash and content_registry.user_has_content(current_user.user_id, job.content_hash))):
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    return JobStatusResponse(**job.to_dict())
+
+def encode_document_cursor(upload_date: datetime, document_id: str) -> str:
+    """Opaque pagination cursor pointing just past a document"""
+    return base64.urlsafe_b64encode(f"{upload_date.isoformat()}|{document_id}".encode()).decode()
+
+def decode_document_cursor(cursor: str) -> tuple[datetime, str]:
+    try:
+        upload_date, document_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+        return datetime.fromisoformat(upload_date), document_id
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@router.get("/documents", response_model=Union[List[DocumentInfo], DocumentListResponse])
+async def list_documents(
+    limit: Optional[int] = Query(None, ge=1, le=MAX_DOCUMENT_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    current_user: UserInfo = Depends(verify_token)
+):
+    """
+    List the current user's documents, newest first
+    Returns a list of every document. Passing limit or cursor returns one page instead,
+    as {"documents": [...], "next_cursor": ...}; pass next_cursor back as ?cursor= for the
+    next page (it is null on the last one)
+    """
+    paginated = limit is not None or cursor is not None
+    limit = limit or DOCUMENT_PAGE_SIZE
+    after = decode_document_cursor(cursor) if cursor else None
+    try:
+        # One extra row tells whether there is a next page
+        documents = await asyncio.to_thread(
+            content_registry.list_documents, current_user.user_id, limit + 1 if paginated else None, after
+        )
+    except Exception as e:
+        logger.error(f"Error listing documents for user {current_user.user_id}: {e}")
+        raise HTTPException(status_code=500, detail="Failed to list documents")
+    
+    next_cursor = None
+    if paginated and len(documents) > limit:
+        documents = documents[:limit]
+        next_cursor = encode_document_cursor(documents[-1].upload_date, documents[-1].document_id)
+    
+    document_infos = [
         DocumentInfo(
-            document_id="sample-doc-1",
-            filename="sample.pdf",
-            upload_date=datetime.now(),
-            page_count=10,
-            status="processed"
+            document_id=document.document_id,
+            filename=document.filename,
+            upload_date=document.upload_date,
+            page_count=document.page_count,
+            status=document.status
         )
+        for document in documents
     ]
+    if not paginated:
+        return document_infos
+    return DocumentListResponse(documents=document_infos, next_cursor=next_cursor)
 
 @router.delete("/documents/{document_id}")
 async def delete_document(
@@ -332,16 +636,20 @@ async def delete_document(
     current_user: UserInfo = Depends(verify_token)
 ):
     """
-    Delete a document and its associated data
+    Delete a document from the user's library
+    The document is tombstoned immediately; its files, index and chat sessions are
+    removed by the background storage collector
     """
     try:
-        # TODO: Implement document deletion
-        # 1. Delete from S3
-        # 2. Delete embeddings from local storage
-        # 3. Delete metadata from database
+        if not await asyncio.to_thread(content_registry.tombstone_document, document_id, current_user.user_id):
+            raise HTTPException(status_code=404, detail="Document not found")
+        
+        storage_collector.wake()
         
         return {"message": f"Document {document_id} deleted successfully"}
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error deleting document {document_id}: {e}")
         raise HTTPException(status_code=500, detail="Failed to delete document")
@@ -354,8 +662,17 @@ async def get_document_text(
     """
     Get extracted text from a document
     """
-    # TODO: Implement text retrieval from database or re-extract from S3
-    return {"text": "Sample extracted text from document"}
+    document = await asyncio.to_thread(content_registry.get_document, document_id, current_user.user_id)
+    if document is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    if document.status == CONTENT_PROCESSING:
+        raise HTTPException(status_code=409, detail="Document is still being processed")
+    
+    pages = await asyncio.to_thread(load_extracted_text, document_id)
+    if pages is None:
+        raise HTTPException(status_code=404, detail="Extracted text not available")
+    
+    return {"document_id": document_id, "page_count": len(pages), "text": "\n\n".join(pages)}
 
 @router.get("/documents/{document_id}/download")
 async def download_document(
@@ -366,7 +683,7 @@ async def download_document(
     Generate presigned URL for document download or local file path
     """
     try:
-        s3_key = f"documents/{current_user.user_id}/{document_id}.pdf"
+        s3_key = document_storage_key(document_id, current_user.user_id)
         
         if not S3_ENABLED:
             # For local development - check if file exists locally
@@ -405,7 +722,7 @@ async def get_pdf_document(
     This is the main endpoint for PDF retrieval
     """
     try:
-        s3_key = f"documents/{current_user.user_id}/{document_id}.pdf"
+        s3_key = document_storage_key(document_id, current_user.user_id)
         
         if not S3_ENABLED:
             # For local development - serve file directly
@@ -0,0 +1,237 @@
+"""
+Semantic answer cache
+The exact answer cache misses paraphrases ("what is the refund policy" vs.
+"how do refunds work"). This layer keeps, per document version, a small
+matrix of the embeddings of questions already answered; a new question whose
+cosine similarity to one of them reaches SEMANTIC_CACHE_THRESHOLD gets that
+question's answer and sources without retrieval or an LLM call.
+
+The question embedding is the one hybrid retrieval needs anyway, so a miss
+costs one matrix-vector product. Each document keeps at most
+SEMANTIC_CACHE_PER_DOCUMENT questions, evicted least recently used (lru) or
+least often hit (lfu); at most SEMANTIC_CACHE_DOCUMENTS documents are kept,
+least recently used first.
+
+The cache is opt-in (SEMANTIC_CACHE_ENABLED) and only used with embedders
+whose vectors capture meaning rather than shared words: the hashing embedder
+ignores stopwords, so "when was the contract signed" and "where was the
+contract signed" embed identically. Even with a semantic embedder such
+questions can be very close, so a question only matches questions asking the
+same way - the same interrogatives (who, when, where, ...). The right
+threshold depends on the embedding model - too low and differently scoped
+questions share answers.
+"""
+import os
+import re
+import time
+import threading
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .answer_cache import CachedAnswer, document_version, ANSWER_CACHE_TTL_SECONDS
+from .content_registry import content_registry
+
+logger = logging.getLogger(__name__)
+
+# Paraphrase lookups are off unless enabled (1)
+SEMANTIC_CACHE_ENABLED = int(os.getenv("SEMANTIC_CACHE_ENABLED", "0"))
+# Minimum cosine similarity for a question to reuse another's answer (above 1 disables the cache)
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+# Answered questions remembered per document
+SEMANTIC_CACHE_PER_DOCUMENT = int(os.getenv("SEMANTIC_CACHE_PER_DOCUMENT", "200"))
+# Documents whose questions are remembered
+SEMANTIC_CACHE_DOCUMENTS = int(os.getenv("SEMANTIC_CACHE_DOCUMENTS", "500"))
+# Which question a full document forgets: lru (least recently used) or lfu (least often hit)
+SEMANTIC_CACHE_EVICTION = os.getenv("SEMANTIC_CACHE_EVICTION", "lru")
+SEMANTIC_CACHE_TTL_SECONDS = float(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", str(ANSWER_CACHE_TTL_SECONDS)))
+
+EVICTION_POLICIES = ("lru", "lfu")
+
+INTERROGATIVES = frozenset("how what when where which who whom whose why".split())
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+def question_form(question: str) -> str:
+    """The interrogatives a question uses, e.g. "when" or "how what"; questions only match within a form"""
+    return " ".join(sorted({word for word in _WORD_RE.findall(question.lower()) if word in INTERROGATIVES}))
+
+class DocumentQuestions:
+    """Unit-length embeddings of one document version's answered questions, row-aligned with their answers"""
+    def __init__(self, version: str, dimension: int):
+        self.version = version
+        self.vectors = np.zeros((0, dimension), dtype=np.float32)
+        self.answers: List[CachedAnswer] = []
+        self.forms: List[str] = []
+        self.expires_at: List[float] = []
+        self.last_used: List[float] = []
+        self.hit_counts: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self.answers)
+
+    def best_match(self, vector: np.ndarray, form: str, now: float) -> Tuple[int, float]:
+        """(row, similarity) of the most similar live question of the same form, or (-1, 0.0)"""
+        if not self.answers:
+            return -1, 0.0
+        similarities = self.vectors @ vector
+        similarities[(np.asarray(self.expires_at) <= now) | (np.asarray(self.forms) != form)] = -np.inf
+        row = int(np.argmax(similarities))
+        if not np.isfinite(similarities[row]):
+            return -1, 0.0
+        return row, float(similarities[row])
+
+    def add(self, vector: np.ndarray, form: str, answer: CachedAnswer, expires_at: float, now: float):
+        self.vectors = np.vstack([self.vectors, vector[np.newaxis, :]])
+        self.answers.append(answer)
+        self.forms.append(form)
+        self.expires_at.append(expires_at)
+        self.last_used.append(now)
+        self.hit_counts.append(0)
+
+    def remove(self, row: int):
+        self.vectors = np.delete(self.vectors, row, axis=0)
+        for values in (self.answers, self.forms, self.expires_at, self.last_used, self.hit_counts):
+            del values[row]
+
+    def victim(self, policy: str, now: float) -> int:
+        """Row to evict: an expired question if there is one, otherwise by policy"""
+        for row, expires_at in enumerate(self.expires_at):
+            if expires_at <= now:
+                return row
+        if policy == "lfu":
+            return min(range(len(self)), key=lambda row: (self.hit_counts[row], self.last_used[row]))
+        return min(range(len(self)), key=lambda row: self.last_used[row])
+
+def unit_vector(vector) -> Optional[np.ndarray]:
+    vector = np.asarray(vector, dtype=np.float32).ravel()
+    norm = float(np.linalg.norm(vector))
+    if norm == 0.0 or not np.isfinite(norm):
+        return None
+    return vector / norm
+
+class SemanticAnswerCache:
+    """Per-document nearest-question lookup over previously answered questions"""
+    def __init__(self, enabled: bool = bool(SEMANTIC_CACHE_ENABLED), threshold: float = SEMANTIC_CACHE_THRESHOLD, per_document: int = SEMANTIC_CACHE_PER_DOCUMENT,
+                 max_documents: int = SEMANTIC_CACHE_DOCUMENTS, eviction: str = SEMANTIC_CACHE_EVICTION,
+                 ttl: float = SEMANTIC_CACHE_TTL_SECONDS):
+        if eviction not in EVICTION_POLICIES:
+            logger.warning(f"Unknown SEMANTIC_CACHE_EVICTION '{eviction}' - using lru")
+            eviction = "lru"
+        self.switched_on = enabled
+        self.threshold = threshold
+        self.per_document = per_document
+        self.max_documents = max_documents
+        self.eviction = eviction
+        self.ttl = ttl
+        self._documents: "OrderedDict[str, DocumentQuestions]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._unsupported_warned = False
+
+    @property
+    def enabled(self) -> bool:
+        return self.switched_on and self.threshold <= 1.0 and self.per_document > 0 and self.max_documents > 0
+
+    def supports(self, embedder) -> bool:
+        """Whether the cache is enabled and the embedder's vectors are safe to match paraphrases with"""
+        if not self.enabled:
+            return False
+        if embedder is None or not embedder.paraphrases:
+            if not self._unsupported_warned:
+                self._unsupported_warned = True
+                name = embedder.name if embedder is not None else "none"
+                logger.warning(f"Semantic answer cache disabled - the {name} embedder does not capture paraphrases")
+            return False
+        return True
+
+    def _questions(self, canonical: str, version: str, dimension: int) -> Optional[DocumentQuestions]:
+        """The document's questions for this version; those of an older version or other embedder are dropped"""
+        questions = self._documents.get(canonical)
+        if questions is not None and (questions.version != version or questions.vectors.shape[1] != dimension):
+            del self._documents[canonical]
+            questions = None
+        if questions is not None:
+            self._documents.move_to_end(canonical)
+        return questions
+
+    def get(self, document_id: str, question: str, question_embedding) -> Optional[CachedAnswer]:
+        """Answer of the most similar previously answered question of the same form, if similar enough (blocking)"""
+        if not self.enabled:
+            return None
+        vector = unit_vector(question_embedding)
+        form = question_form(question)
+        canonical = content_registry.resolve(document_id)
+        version = document_version(canonical)
+        now = time.time()
+        with self._lock:
+            questions = self._questions(canonical, version, len(vector)) if vector is not None and version else None
+            row, similarity = questions.best_match(vector, form, now) if questions is not None else (-1, 0.0)
+            if row < 0 or similarity < self.threshold:
+                self.misses += 1
+                return None
+            questions.last_used[row] = now
+            questions.hit_counts[row] += 1
+            self.hits += 1
+            logger.info(f"Semantic cache hit for document {canonical} (similarity {similarity:.3f})")
+            return questions.answers[row]
+
+    def put(self, document_id: str, question: str, question_embedding, answer: CachedAnswer):
+        """Remember an answered question (blocking); ignored when the document's answers can't be cached"""
+        if not self.enabled:
+            return
+        vector = unit_vector(question_embedding)
+        form = question_form(question)
+        canonical = content_registry.resolve(document_id)
+        version = document_version(canonical)
+        if vector is None or version is None:
+            return
+        now = time.time()
+        with self._lock:
+            questions = self._questions(canonical, version, len(vector))
+            if questions is None:
+                questions = DocumentQuestions(version, len(vector))
+                self._documents[canonical] = questions
+                while len(self._documents) > self.max_documents:
+                    _, evicted = self._documents.popitem(last=False)
+                    self.evictions += len(evicted)
+            row, similarity = questions.best_match(vector, form, now)
+            if row >= 0 and similarity >= self.threshold:
+                # A paraphrase is already cached (e.g. answered again with bypass) - refresh it in place
+                questions.remove(row)
+            elif len(questions) >= self.per_document:
+                questions.remove(questions.victim(self.eviction, now))
+                self.evictions += 1
+            questions.add(vector, form, answer, now + self.ttl, now)
+
+    def invalidate(self, document_id: str):
+        """Forget a document's questions (after re-ingestion or deletion)"""
+        canonical = content_registry.resolve(document_id)
+        with self._lock:
+            if self._documents.pop(canonical, None) is not None:
+                self.invalidations += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "threshold": self.threshold,
+                "eviction": self.eviction,
+                "documents": len(self._documents),
+                "questions": sum(len(questions) for questions in self._documents.values()),
+                "max_documents": self.max_documents,
+                "per_document": self.per_document,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations
+            }
+
+# Global semantic answer cache instance
+semantic_cache = SemanticAnswerCache()
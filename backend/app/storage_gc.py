@@ -0,0 +1,251 @@
+"""
+Storage garbage collection
+Deleting a document only tombstones its record. A background collector then
+purges tombstoned documents in batches: their chat sessions and records, and
+once no other document shares the content, the stored PDF, chunk store,
+vector index and extracted text, the Chroma collection and cached indexes.
+
+A periodic sweep catches what slipped through: content no document refers to
+any more, index files of documents the registry does not know, abandoned
+partial uploads and stored PDFs without content. Files younger than
+GC_ORPHAN_MIN_AGE_SECONDS are left alone so in-flight uploads and ingestion
+jobs are never touched.
+"""
+import os
+import time
+import asyncio
+import logging
+from typing import Optional, Set
+
+from .chunk_store import CHUNK_STORE_DIR
+from .content_registry import content_registry, ContentBlob
+from .chat_history_db import chat_history_manager
+from .index_cache import index_cache
+from .answer_cache import answer_cache
+from .semantic_cache import semantic_cache
+from .lazy_index import lazy_indexer, load_toc
+from .upload_stream import UPLOAD_DIR
+
+logger = logging.getLogger(__name__)
+
+# Tombstoned documents (or unreferenced contents) purged per batch
+GC_BATCH_SIZE = int(os.getenv("GC_BATCH_SIZE", "50"))
+# Seconds between orphan sweeps; 0 disables sweeping
+GC_SWEEP_INTERVAL_SECONDS = float(os.getenv("GC_SWEEP_INTERVAL_SECONDS", "3600"))
+# Orphaned files younger than this are kept
+GC_ORPHAN_MIN_AGE_SECONDS = float(os.getenv("GC_ORPHAN_MIN_AGE_SECONDS", "3600"))
+
+# Storage prefixes of uploaded content and of documents stored before the content registry
+CONTENT_PREFIX = "content/"
+LEGACY_DOCUMENT_PREFIX = "documents/"
+
+def document_file_id(filename: str) -> Optional[str]:
+    """Document id of a doc_{id}.* file in the chunk store directory"""
+    if not filename.startswith("doc_"):
+        return None
+    return filename[len("doc_"):].split(".", 1)[0]
+
+def remove_document_files(document_id: str) -> int:
+    """Delete a document's chunk store, vector index, outline and extracted text; returns files removed"""
+    removed = 0
+    if not os.path.isdir(CHUNK_STORE_DIR):
+        return removed
+    for name in os.listdir(CHUNK_STORE_DIR):
+        if document_file_id(name) == document_id:
+            try:
+                os.unlink(os.path.join(CHUNK_STORE_DIR, name))
+                removed += 1
+            except FileNotFoundError:
+                pass
+    return removed
+
+def drop_chroma_collection(document_id: str):
+    from .pdf_processing import chroma_client, CHROMADB_ENABLED
+    if not CHROMADB_ENABLED:
+        return
+    try:
+        chroma_client.delete_collection(name=f"doc_{document_id}")
+    except Exception as e:
+        # Raised when the collection does not exist - nothing to drop
+        logger.debug(f"No Chroma collection for document {document_id}: {e}")
+
+def remove_content(blob: ContentBlob):
+    """Delete everything stored for a content blob (blocking)"""
+    from .pdf_processing import delete_from_storage
+    document_id = blob.canonical_document_id
+    lazy_indexer.discard(document_id)
+    index_cache.invalidate(document_id)
+    answer_cache.invalidate(document_id)
+    semantic_cache.invalidate(document_id)
+    delete_from_storage(blob.storage_key)
+    files = remove_document_files(document_id)
+    drop_chroma_collection(document_id)
+    load_toc.cache_clear()
+    logger.info(f"Removed content {blob.content_hash[:12]} of document {document_id} ({files} index files)")
+
+class StorageCollector:
+    """Background task purging deleted documents and sweeping orphaned storage"""
+    def __init__(self, batch_size: int = GC_BATCH_SIZE, sweep_interval: float = GC_SWEEP_INTERVAL_SECONDS,
+                 orphan_min_age: float = GC_ORPHAN_MIN_AGE_SECONDS):
+        self.batch_size = batch_size
+        self.sweep_interval = sweep_interval
+        self.orphan_min_age = orphan_min_age
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._last_sweep: Optional[float] = None
+        self.documents_purged = 0
+        self.contents_removed = 0
+        self.orphans_removed = 0
+
+    def wake(self):
+        """Purge tombstoned documents now rather than at the next sweep"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def start(self):
+        """Start the background task (called on application startup); the first sweep runs at once"""
+        if self._task is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Cancel the background task (called on application shutdown)"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "documents_purged": self.documents_purged,
+            "contents_removed": self.contents_removed,
+            "orphans_removed": self.orphans_removed,
+        }
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                # Batches run in a worker thread; yield between them so requests keep flowing
+                while await asyncio.to_thread(self.collect_batch) == self.batch_size:
+                    await asyncio.sleep(0)
+                if self.sweep_interval > 0 and (
+                        self._last_sweep is None or time.monotonic() - self._last_sweep >= self.sweep_interval):
+                    self._last_sweep = time.monotonic()
+                    await asyncio.to_thread(self.sweep)
+            except Exception as e:
+                logger.error(f"Storage collection failed: {e}")
+            await self._wait()
+
+    async def _wait(self):
+        """Sleep until woken by a deletion or the next sweep is due"""
+        timeout = None
+        if self.sweep_interval > 0:
+            since_sweep = time.monotonic() - self._last_sweep if self._last_sweep is not None else self.sweep_interval
+            timeout = max(1.0, self.sweep_interval - since_sweep)
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def collect_batch(self) -> int:
+        """Purge up to batch_size tombstoned documents (blocking); returns how many were purged"""
+        purged = 0
+        for document_id in content_registry.deleted_document_ids(self.batch_size):
+            try:
+                chat_history_manager.delete_document_sessions(document_id)
+                if content_registry.purge_document(document_id, remove_content):
+                    self.contents_removed += 1
+                purged += 1
+            except Exception as e:
+                # The tombstone stays and the document is retried on the next pass
+                logger.warning(f"Could not purge document {document_id}: {e}")
+        self.documents_purged += purged
+        return purged
+
+    def sweep(self):
+        """Find and remove orphaned content and files (blocking)"""
+        start = time.perf_counter()
+        before = self.contents_removed, self.orphans_removed
+
+        # Content left behind by documents deleted while it was still processing
+        for content_hash in content_registry.unreferenced_content(self.batch_size):
+            try:
+                if content_registry.purge_content(content_hash, remove_content):
+                    self.contents_removed += 1
+            except Exception as e:
+                logger.warning(f"Could not remove content {content_hash[:12]}: {e}")
+
+        live_ids = self._live_document_ids()
+        self._sweep_index_files(live_ids)
+        self._sweep_uploads()
+        self._sweep_chroma(live_ids)
+
+        contents, orphans = self.contents_removed - before[0], self.orphans_removed - before[1]
+        if contents or orphans:
+            logger.info(f"Storage sweep removed {contents} unreferenced contents and {orphans} orphaned files "
+                        f"in {time.perf_counter() - start:.1f} s")
+
+    def _live_document_ids(self) -> Set[str]:
+        """Documents whose files are in use: registered content plus documents stored before the registry"""
+        from .pdf_processing import stored_files
+        live_ids = set(content_registry.canonical_document_ids())
+        for key, _ in stored_files(LEGACY_DOCUMENT_PREFIX):
+            if key.endswith(".pdf"):
+                # documents/{user_id}/{document_id}.pdf, flattened to documents_{user_id}_{document_id}.pdf locally
+                live_ids.add(key[:-len(".pdf")].replace("/", "_").rsplit("_", 1)[-1])
+        return live_ids
+
+    def _is_old(self, modified: float) -> bool:
+        return time.time() - modified >= self.orphan_min_age
+
+    def _remove_orphan(self, path: str):
+        try:
+            os.unlink(path)
+            self.orphans_removed += 1
+        except FileNotFoundError:
+            pass
+
+    def _sweep_index_files(self, live_ids: Set[str]):
+        if not os.path.isdir(CHUNK_STORE_DIR):
+            return
+        for name in os.listdir(CHUNK_STORE_DIR):
+            document_id = document_file_id(name)
+            if document_id is None:
+                continue
+            path = os.path.join(CHUNK_STORE_DIR, name)
+            # Unknown documents, and temporary files of writers that never finished
+            if (document_id not in live_ids or name.endswith(".tmp")) and self._is_old(os.path.getmtime(path)):
+                self._remove_orphan(path)
+
+    def _sweep_uploads(self):
+        from .pdf_processing import stored_files, delete_from_storage
+        # Uploads whose request died before the file was renamed into place
+        if os.path.isdir(UPLOAD_DIR):
+            for name in os.listdir(UPLOAD_DIR):
+                path = os.path.join(UPLOAD_DIR, name)
+                if name.startswith(".upload-") and name.endswith(".part") and self._is_old(os.path.getmtime(path)):
+                    self._remove_orphan(path)
+
+        # Stored PDFs of content the registry no longer knows
+        storage_keys = set(content_registry.storage_keys())
+        for key, modified in list(stored_files(CONTENT_PREFIX)):
+            if key not in storage_keys and self._is_old(modified):
+                delete_from_storage(key)
+                self.orphans_removed += 1
+
+    def _sweep_chroma(self, live_ids: Set[str]):
+        from .pdf_processing import chroma_client, CHROMADB_ENABLED
+        if not CHROMADB_ENABLED:
+            return
+        for collection in chroma_client.list_collections():
+            # Collection objects in older chromadb releases, names in newer ones
+            name = getattr(collection, "name", collection)
+            document_id = document_file_id(name)
+            if document_id is not None and document_id not in live_ids:
+                drop_chroma_collection(document_id)
+                self.orphans_removed += 1
+
+# Global storage collector instance
+storage_collector = StorageCollector()
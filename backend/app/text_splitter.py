@@ -0,0 +1,118 @@
+"""
+Span-based recursive text splitter
+Produces the same chunks as LangChain's RecursiveCharacterTextSplitter with its
+defaults (separators "\\n\\n", "\\n", " ", "", keep_separator=True,
+strip_whitespace=True), without building intermediate strings: pieces are
+(start, end) offsets into the original text, merging only moves span
+boundaries, and each chunk comes back as its span within the text.
+
+With keep_separator=True every piece starts with the separator that preceded
+it, so the pieces of a text are contiguous and a merged chunk is always a plain
+slice of the text, trimmed of surrounding whitespace.
+"""
+from typing import List, Sequence, Tuple
+
+DEFAULT_SEPARATORS = ("\n\n", "\n", " ", "")
+
+Span = Tuple[int, int]
+
+class RecursiveTextSplitter:
+    """
+    Splits on the highest-priority separator present, merges pieces up to
+    chunk_size characters with up to chunk_overlap characters carried over,
+    and re-splits pieces that are too long with the next separators
+    """
+    def __init__(self, chunk_size: int = 500, chunk_overlap: int = 50,
+                 separators: Sequence[str] = DEFAULT_SEPARATORS):
+        if chunk_size <= 0:
+            raise ValueError(f"chunk_size must be > 0, got {chunk_size}")
+        if chunk_overlap < 0:
+            raise ValueError(f"chunk_overlap must be >= 0, got {chunk_overlap}")
+        if chunk_overlap > chunk_size:
+            raise ValueError(f"Got a larger chunk overlap ({chunk_overlap}) than chunk size ({chunk_size})")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.separators = tuple(separators)
+
+    def split_spans(self, text: str) -> List[Span]:
+        """(start, end) offsets of each chunk, in order; chunks may overlap"""
+        spans: List[Span] = []
+        if text:
+            self._split(text, 0, len(text), self.separators, spans)
+        return spans
+
+    def split_text(self, text: str) -> List[str]:
+        return [text[start:end] for start, end in self.split_spans(text)]
+
+    def _split(self, text: str, start: int, end: int, separators: Sequence[str], spans: List[Span]):
+        # First separator that occurs in this span; "" (single characters) always matches
+        separator = separators[-1]
+        remaining: Sequence[str] = ()
+        for index, candidate in enumerate(separators):
+            if not candidate:
+                separator = candidate
+                break
+            if text.find(candidate, start, end) >= 0:
+                separator = candidate
+                remaining = separators[index + 1:]
+                break
+
+        short: List[Span] = []
+        for piece in self._pieces(text, start, end, separator):
+            if piece[1] - piece[0] < self.chunk_size:
+                short.append(piece)
+                continue
+            if short:
+                self._merge(text, short, spans)
+                short = []
+            if remaining:
+                self._split(text, piece[0], piece[1], remaining, spans)
+            else:
+                # Nothing left to split on - kept whole, and unlike merged chunks not stripped
+                spans.append(piece)
+        if short:
+            self._merge(text, short, spans)
+
+    @staticmethod
+    def _pieces(text: str, start: int, end: int, separator: str) -> List[Span]:
+        """Split [start, end) before each occurrence of separator, dropping empty pieces"""
+        if not separator:
+            return [(position, position + 1) for position in range(start, end)]
+        pieces = []
+        piece_start = start
+        step = len(separator)
+        position = text.find(separator, start, end)
+        while position >= 0:
+            if position > piece_start:
+                pieces.append((piece_start, position))
+            piece_start = position
+            position = text.find(separator, position + step, end)
+        if end > piece_start:
+            pieces.append((piece_start, end))
+        return pieces
+
+    def _merge(self, text: str, pieces: List[Span], spans: List[Span]):
+        """Greedily combine adjacent pieces into chunks, keeping a tail of up to chunk_overlap characters"""
+        chunk_size = self.chunk_size
+        chunk_overlap = self.chunk_overlap
+        first = 0  # the chunk being built is pieces[first:index]
+        total = 0
+        for index, (piece_start, piece_end) in enumerate(pieces):
+            length = piece_end - piece_start
+            if total + length > chunk_size and index > first:
+                self._emit(text, pieces[first][0], pieces[index - 1][1], spans)
+                while total > chunk_overlap or (total + length > chunk_size and total > 0):
+                    total -= pieces[first][1] - pieces[first][0]
+                    first += 1
+            total += length
+        if first < len(pieces):
+            self._emit(text, pieces[first][0], pieces[-1][1], spans)
+
+    @staticmethod
+    def _emit(text: str, start: int, end: int, spans: List[Span]):
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        if end > start:
+            spans.append((start, end))
@@ -0,0 +1,188 @@
+"""
+Single-pass streaming PDF uploads
+The multipart request body is parsed as it arrives and the file part is
+written straight into the uploads directory, hashed along the way, then
+renamed to its content-addressed name when the upload is registered. Nothing is spooled to a temporary
+file first, and oversized uploads are rejected as soon as they cross the limit.
+"""
+import os
+import asyncio
+import hashlib
+import logging
+import tempfile
+from typing import Optional
+
+from fastapi import HTTPException, Request
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "./data/uploads")
+MAX_FILE_SIZE = int(os.getenv("MAX_FILE_SIZE", "50")) * 1024 * 1024  # configured in MB
+# Allowance for multipart boundaries and part headers when checking Content-Length
+MULTIPART_OVERHEAD = 64 * 1024
+# Buffered part data is written out once it reaches this size
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+class StreamedUpload:
+    """
+    A PDF received from a request
+    It waits in temp_path until store_upload moves it to path, its content-addressed location
+    """
+    def __init__(self, filename: str, temp_path: str, path: str, content_hash: str, size_bytes: int):
+        self.filename = filename
+        self.temp_path = temp_path
+        self.path = path
+        self.content_hash = content_hash
+        self.size_bytes = size_bytes
+
+def content_storage_key(content_hash: str) -> str:
+    """Storage key for uploaded content; stored locally as content_{hash}.pdf in UPLOAD_DIR"""
+    return f"content/{content_hash}.pdf"
+
+def content_path(content_hash: str) -> str:
+    return os.path.join(UPLOAD_DIR, content_storage_key(content_hash).replace("/", "_"))
+
+def discard_upload(path: str):
+    """Remove a received file that turned out not to be needed"""
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+def store_upload(upload: StreamedUpload, reuse_existing: bool):
+    """
+    Move a received upload to its content-addressed path
+    With reuse_existing an already stored copy (identical bytes) is kept and the upload dropped.
+    Call under the content registry lock (register_upload's store_content), so storage
+    collection cannot delete the stored copy between this check and the upload's registration.
+    """
+    if reuse_existing and os.path.exists(upload.path):
+        discard_upload(upload.temp_path)
+    else:
+        os.replace(upload.temp_path, upload.path)
+
+class _FilePartReceiver:
+    """Multipart parser callbacks that write one file field to disk"""
+    def __init__(self, field_name: str, max_bytes: int):
+        self.field_name = field_name
+        self.max_bytes = max_bytes
+        self.filename: Optional[str] = None
+        self.file = None
+        self.hasher = hashlib.sha256()
+        self.size_bytes = 0
+        self.buffer = bytearray()
+        self.error: Optional[HTTPException] = None
+        self._header_field = b""
+        self._header_value = b""
+        self._headers = {}
+        self._in_file_part = False
+
+    def callbacks(self):
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+        }
+
+    def on_part_begin(self):
+        self._headers = {}
+        self._in_file_part = False
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        if options.get(b"name", b"").decode("utf-8", "replace") != self.field_name or self.file is not None:
+            return
+        self.filename = os.path.basename(options.get(b"filename", b"").decode("utf-8", "replace"))
+        if not self.filename.lower().endswith(".pdf"):
+            self.error = HTTPException(status_code=400, detail="Only PDF files are allowed")
+            return
+        os.makedirs(UPLOAD_DIR, exist_ok=True)
+        # Same directory as the final file so the rename is atomic
+        self.file = tempfile.NamedTemporaryFile(dir=UPLOAD_DIR, prefix=".upload-", suffix=".part", delete=False)
+        self._in_file_part = True
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        if not self._in_file_part or self.error is not None:
+            return
+        self.size_bytes += end - start
+        if self.size_bytes > self.max_bytes:
+            self.error = HTTPException(status_code=413, detail=f"File too large (limit {self.max_bytes // (1024 * 1024)} MB)")
+            return
+        self.buffer += data[start:end]
+
+    def on_part_end(self):
+        self._in_file_part = False
+
+    def take_buffer(self) -> bytes:
+        data = bytes(self.buffer)
+        self.hasher.update(data)
+        self.buffer.clear()
+        return data
+
+    def discard(self):
+        if self.file is not None:
+            self.file.close()
+            try:
+                os.unlink(self.file.name)
+            except FileNotFoundError:
+                pass
+
+async def receive_pdf_upload(request: Request, field_name: str = "file", max_bytes: int = MAX_FILE_SIZE) -> StreamedUpload:
+    """
+    Stream a multipart/form-data PDF upload to a temporary file in UPLOAD_DIR
+    store_upload moves it to UPLOAD_DIR/content_{sha256}.pdf once it is registered
+    Raises HTTPException 400 for a missing or non-PDF file and 413 when it is over max_bytes
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data upload")
+
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes + MULTIPART_OVERHEAD:
+        raise HTTPException(status_code=413, detail=f"File too large (limit {max_bytes // (1024 * 1024)} MB)")
+
+    receiver = _FilePartReceiver(field_name, max_bytes)
+    parser = MultipartParser(boundary, receiver.callbacks())
+    try:
+        async for body_chunk in request.stream():
+            parser.write(body_chunk)
+            if receiver.error is not None:
+                raise receiver.error
+            if len(receiver.buffer) >= WRITE_BUFFER_SIZE:
+                await asyncio.to_thread(receiver.file.write, receiver.take_buffer())
+        parser.finalize()
+
+        if receiver.file is None:
+            raise HTTPException(status_code=400, detail="No PDF file in the upload")
+        if receiver.buffer:
+            await asyncio.to_thread(receiver.file.write, receiver.take_buffer())
+        receiver.file.close()
+    except BaseException:
+        receiver.discard()
+        raise
+
+    content_hash = receiver.hasher.hexdigest()
+    path = content_path(content_hash)
+    logger.info(f"Received upload {receiver.filename} ({receiver.size_bytes} bytes) for {path}")
+    return StreamedUpload(receiver.filename, receiver.file.name, path, content_hash, receiver.size_bytes)
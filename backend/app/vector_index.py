@@ -0,0 +1,404 @@
+"""
+Per-document vector index
+Each document's chunk embeddings are stored as a .npy matrix (row i is chunk i
+of the chunk store) with precomputed L2 norms next to it. The matrix is
+memory-mapped on load; top-k is a blocked matrix-vector product followed by
+argpartition, which for a few hundred to a few thousand chunks is faster and
+far lighter than a ChromaDB collection.
+
+VECTOR_BACKEND selects where embeddings go:
+  numpy  - this index (default); documents that only have a ChromaDB collection are still queried there
+  chroma - ChromaDB collections
+"""
+import io
+import os
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .chunk_store import CHUNK_STORE_DIR
+
+logger = logging.getLogger(__name__)
+
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "numpy").lower()
+# float16 halves the file and page cache footprint, but NumPy has no fast float16
+# product: each query upcasts the rows to float32 block by block, which makes it
+# 5-10x slower to search (58 vs. 11 ms at 20,000 x 1536), so it is opt-in for
+# hosts short on memory rather than CPU
+VECTOR_INDEX_DTYPE = np.dtype(os.getenv("VECTOR_INDEX_DTYPE", "float32"))
+# Size of the float32 working copy a float16 matrix is upcast into, one block of rows at a time
+VECTOR_SEARCH_BLOCK_BYTES = 1024 * 1024
+
+def vector_index_path(document_id: str) -> str:
+    return os.path.join(CHUNK_STORE_DIR, f"doc_{document_id}.vectors.npy")
+
+def vector_norms_path(document_id: str) -> str:
+    return os.path.join(CHUNK_STORE_DIR, f"doc_{document_id}.norms.npy")
+
+class VectorIndex:
+    """Cosine-similarity search over one document's chunk embeddings"""
+    def __init__(self, vectors: np.ndarray, norms: np.ndarray):
+        self.vectors = vectors
+        self.norms = norms
+
+    def __len__(self) -> int:
+        return self.vectors.shape[0]
+
+    @property
+    def dimension(self) -> int:
+        return self.vectors.shape[1]
+
+    @property
+    def nbytes(self) -> int:
+        return self.vectors.nbytes + self.norms.nbytes
+
+    def scores(self, query_vector: np.ndarray, first: int = 0, end: Optional[int] = None) -> np.ndarray:
+        """Cosine similarity of the query against chunks first..end (every chunk by default)"""
+        end = len(self) if end is None else end
+        query = np.asarray(query_vector, dtype=np.float32)
+        query_norm = float(np.linalg.norm(query))
+        scores = np.empty(end - first, dtype=np.float32)
+        if self.vectors.dtype == np.float32:
+            np.matmul(self.vectors[first:end], query, out=scores)
+        else:
+            # One reused float32 buffer instead of a full-size upcast copy per query
+            block_rows = max(1, VECTOR_SEARCH_BLOCK_BYTES // (4 * max(1, self.dimension)))
+            buffer = np.empty((min(block_rows, end - first), self.dimension), dtype=np.float32)
+            for start in range(first, end, block_rows):
+                block = buffer[:min(block_rows, end - start)]
+                np.copyto(block, self.vectors[start:start + len(block)])
+                np.matmul(block, query, out=scores[start - first:start - first + len(block)])
+        # Zero vectors (empty chunks, stopword-only questions) keep their score of 0
+        denominators = self.norms[first:end] * query_norm
+        np.divide(scores, denominators, out=scores, where=denominators > 0)
+        return scores
+
+    def search(self, query_vector: np.ndarray, k: int = 3) -> List[Tuple[int, float]]:
+        """
+        Returns: up to k (chunk_index, score) pairs, best first
+        """
+        count = len(self)
+        if not count or k <= 0:
+            return []
+        if len(query_vector) != self.dimension:
+            logger.warning(f"Query vector has {len(query_vector)} dimensions, index has {self.dimension} - was the embedding backend changed?")
+            return []
+
+        scores = self.scores(query_vector)
+        if k < count:
+            top = np.argpartition(scores, count - k)[count - k:]
+        else:
+            top = np.arange(count)
+        top = top[np.argsort(scores[top])[::-1]]
+        return [(int(chunk_index), float(scores[chunk_index])) for chunk_index in top]
+
+def _save_array(path: str, values: np.ndarray):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.save(f, values)
+    os.replace(tmp_path, path)
+
+class VectorIndexWriter:
+    """
+    Writes a document's vector index batch by batch into a temporary .npy file;
+    readers only see it once commit() renames it into place
+    The row count does not have to be known up front: rows are written at their
+    offsets as batches arrive (in any order) and the header is finalized on commit
+    """
+    def __init__(self, document_id: str, count: Optional[int] = None, dtype: np.dtype = VECTOR_INDEX_DTYPE):
+        self.document_id = document_id
+        self.count = count
+        self.dtype = np.dtype(dtype)
+        self.path = vector_index_path(document_id)
+        self._tmp_path = f"{self.path}.tmp"
+        self._fd: Optional[int] = None
+        self._dimension = 0
+        self._header_size = 0
+        self._rows = 0
+        self._norms = np.zeros(count or 0, dtype=np.float32)
+
+    def _header(self, rows: int) -> bytes:
+        header = io.BytesIO()
+        np.lib.format.write_array_header_1_0(header, {
+            'descr': np.lib.format.dtype_to_descr(self.dtype),
+            'fortran_order': False,
+            'shape': (rows, self._dimension)
+        })
+        return header.getvalue()
+
+    def _open(self, dimension: int):
+        os.makedirs(CHUNK_STORE_DIR, exist_ok=True)
+        self._dimension = dimension
+        self._fd = os.open(self._tmp_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        # Rewritten with the final row count on commit; the header is padded so its size doesn't change
+        header = self._header(0)
+        self._header_size = len(header)
+        os.pwrite(self._fd, header, 0)
+
+    def write(self, start: int, vectors: np.ndarray):
+        """Store rows [start, start + len(vectors)); the dimension is fixed by the first write"""
+        if self._fd is None:
+            self._open(vectors.shape[1])
+        rows = np.ascontiguousarray(vectors, dtype=self.dtype)
+        end = start + len(rows)
+        os.pwrite(self._fd, rows.tobytes(), self._header_size + start * self._dimension * self.dtype.itemsize)
+        if end > len(self._norms):
+            self._norms = np.concatenate([self._norms, np.zeros(max(end, 2 * len(self._norms)) - len(self._norms), dtype=np.float32)])
+        # Norms are taken from the stored (possibly float16) values so scores stay consistent
+        self._norms[start:end] = np.linalg.norm(rows.astype(np.float32), axis=1)
+        self._rows = max(self._rows, end)
+
+    def commit(self) -> str:
+        """Publish the index; returns the path to the vector file"""
+        count = self.count if self.count is not None else self._rows
+        if self._fd is None:
+            with open(self._tmp_path, 'wb') as f:
+                np.save(f, np.zeros((count, 0), dtype=self.dtype))
+        else:
+            header = self._header(count)
+            if len(header) != self._header_size:
+                raise ValueError(f"Vector index header for {count} rows does not fit the reserved {self._header_size} bytes")
+            # Rows that were never written (there should be none) read back as zeros
+            os.ftruncate(self._fd, self._header_size + count * self._dimension * self.dtype.itemsize)
+            os.pwrite(self._fd, header, 0)
+            os.close(self._fd)
+            self._fd = None
+        norms = np.zeros(count, dtype=np.float32)
+        norms[:min(count, len(self._norms))] = self._norms[:count]
+        # Norms first: the vector file appearing is what makes the index visible
+        _save_array(vector_norms_path(self.document_id), norms)
+        os.replace(self._tmp_path, self.path)
+        # A complete index replaces any lazily filled one
+        try:
+            os.unlink(vector_ranges_path(self.document_id))
+        except FileNotFoundError:
+            pass
+        logger.info(f"Saved vector index for document {self.document_id}: {count} x {self._dimension} {self.dtype}")
+        return self.path
+
+    def abort(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        try:
+            os.unlink(self._tmp_path)
+        except FileNotFoundError:
+            pass
+
+def save_vector_index(document_id: str, vectors: np.ndarray, dtype: np.dtype = VECTOR_INDEX_DTYPE) -> str:
+    """
+    Write a document's chunk embeddings (in chunk store order) and their norms
+    Returns: path to the vector file
+    """
+    writer = VectorIndexWriter(document_id, len(vectors), dtype)
+    if len(vectors):
+        writer.write(0, vectors)
+    return writer.commit()
+
+def load_vector_index(document_id: str) -> Optional[VectorIndex]:
+    """Memory-map a document's vector index, or None if it has none"""
+    path = vector_index_path(document_id)
+    norms_path = vector_norms_path(document_id)
+    if not os.path.exists(path) or not os.path.exists(norms_path):
+        return None
+    try:
+        vectors = np.load(path, mmap_mode='r')
+        norms = np.load(norms_path)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not read vector index for document {document_id}: {e}")
+        return None
+    if vectors.ndim != 2 or norms.shape != (vectors.shape[0],):
+        logger.warning(f"Vector index for document {document_id} is inconsistent - ignoring it")
+        return None
+    return VectorIndex(vectors, norms)
+
+def vector_ranges_path(document_id: str) -> str:
+    return os.path.join(CHUNK_STORE_DIR, f"doc_{document_id}.ranges.npy")
+
+# Columns of a lazy index's range table
+RANGE_FIRST_PAGE, RANGE_LAST_PAGE, RANGE_FIRST_ROW, RANGE_END_ROW, RANGE_FILLED = range(5)
+
+# Lazy indexes touched from several threads share one lock per document, even across reloads
+_range_locks: Dict[str, threading.Lock] = {}
+_range_locks_guard = threading.Lock()
+
+def _range_lock(document_id: str) -> threading.Lock:
+    with _range_locks_guard:
+        return _range_locks.setdefault(document_id, threading.Lock())
+
+class LazyVectorIndex(VectorIndex):
+    """
+    Vector index that is filled one page range at a time
+    The range table (doc_{id}.ranges.npy) maps page ranges to chunk rows and
+    records which ranges are embedded; rows of other ranges are never returned.
+    The vector and norm files are created full size on the first fill and
+    written in place; the range table is removed once every range is filled,
+    leaving an ordinary vector index behind.
+    """
+    def __init__(self, document_id: str, count: int, ranges: np.ndarray,
+                 vectors: Optional[np.ndarray] = None, norms: Optional[np.ndarray] = None):
+        super().__init__(vectors, norms)
+        self.document_id = document_id
+        self.count = count
+        self.ranges = ranges
+        self._filled_rows: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def dimension(self) -> int:
+        return self.vectors.shape[1] if self.vectors is not None else 0
+
+    @property
+    def nbytes(self) -> int:
+        return self.vectors.nbytes + self.norms.nbytes if self.vectors is not None else 0
+
+    @property
+    def complete(self) -> bool:
+        return bool(self.ranges[:, RANGE_FILLED].all())
+
+    @property
+    def filled_count(self) -> int:
+        return int(self.ranges[:, RANGE_FILLED].sum())
+
+    def ranges_for_pages(self, pages) -> List[int]:
+        """Range indexes covering the given page numbers, in the order given, without repeats"""
+        found = []
+        for page in pages:
+            index = int(np.searchsorted(self.ranges[:, RANGE_LAST_PAGE], page, side='left'))
+            if index < len(self.ranges) and self.ranges[index, RANGE_FIRST_PAGE] <= page and index not in found:
+                found.append(index)
+        return found
+
+    def range_of_row(self, row: int) -> int:
+        return int(np.searchsorted(self.ranges[:, RANGE_END_ROW], row, side='right'))
+
+    def missing(self, range_indexes: List[int]) -> List[int]:
+        return [index for index in range_indexes if not self.ranges[index, RANGE_FILLED]]
+
+    def next_missing(self) -> Optional[int]:
+        missing = np.flatnonzero(self.ranges[:, RANGE_FILLED] == 0)
+        return int(missing[0]) if len(missing) else None
+
+    def rows(self, range_index: int) -> Tuple[int, int]:
+        return int(self.ranges[range_index, RANGE_FIRST_ROW]), int(self.ranges[range_index, RANGE_END_ROW])
+
+    def _open(self, dimension: int, dtype: np.dtype):
+        path = vector_index_path(self.document_id)
+        norms_path = vector_norms_path(self.document_id)
+        if not os.path.exists(path):
+            # Another copy of this index (e.g. reloaded after a cache eviction) may have created them already
+            np.lib.format.open_memmap(norms_path, mode='w+', dtype=np.float32, shape=(self.count,)).flush()
+            np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=(self.count, dimension)).flush()
+        self.vectors = np.load(path, mmap_mode='r+')
+        self.norms = np.load(norms_path, mmap_mode='r+')
+
+    def fill(self, range_index: int, vectors: np.ndarray, dtype: np.dtype = VECTOR_INDEX_DTYPE) -> bool:
+        """Store the embeddings of one range's rows; returns False if the range was already filled"""
+        with _range_lock(self.document_id):
+            # Re-read the table - another copy of this index may have filled ranges since it was loaded
+            self.ranges = np.load(vector_ranges_path(self.document_id))
+            self._filled_rows = None
+            if self.ranges[range_index, RANGE_FILLED]:
+                return False
+            if self.vectors is None:
+                self._open(vectors.shape[1], np.dtype(dtype))
+            first, end = self.rows(range_index)
+            rows = self.vectors[first:end]
+            rows[:] = vectors
+            self.norms[first:end] = np.linalg.norm(rows.astype(np.float32), axis=1)
+            self.vectors.flush()
+            self.norms.flush()
+            # Marked filled only after its rows are on disk
+            ranges = self.ranges.copy()
+            ranges[range_index, RANGE_FILLED] = 1
+            _save_array(vector_ranges_path(self.document_id), ranges)
+            self.ranges = ranges
+            return True
+
+    def finish(self):
+        """Drop the range table once every range is filled"""
+        with _range_lock(self.document_id):
+            if self.complete:
+                try:
+                    os.unlink(vector_ranges_path(self.document_id))
+                except FileNotFoundError:
+                    pass
+
+    def filled_rows(self) -> np.ndarray:
+        if self._filled_rows is None:
+            filled = self.ranges[self.ranges[:, RANGE_FILLED] == 1]
+            self._filled_rows = np.concatenate(
+                [np.arange(first, end) for first, end in filled[:, [RANGE_FIRST_ROW, RANGE_END_ROW]]]
+            ) if len(filled) else np.zeros(0, dtype=np.int64)
+        return self._filled_rows
+
+    def search(self, query_vector: np.ndarray, k: int = 3) -> List[Tuple[int, float]]:
+        """Search the filled ranges only"""
+        if self.vectors is None or k <= 0:
+            return []
+        if len(query_vector) != self.dimension:
+            logger.warning(f"Query vector has {len(query_vector)} dimensions, index has {self.dimension} - was the embedding backend changed?")
+            return []
+        rows = self.filled_rows()
+        if not len(rows):
+            return []
+        # Only filled ranges are scored; rows not embedded yet are never read
+        filled = self.ranges[self.ranges[:, RANGE_FILLED] == 1]
+        scores = np.concatenate([
+            self.scores(query_vector, int(first), int(end))
+            for first, end in filled[:, [RANGE_FIRST_ROW, RANGE_END_ROW]]
+        ])
+        if k < len(rows):
+            top = np.argpartition(scores, len(rows) - k)[len(rows) - k:]
+        else:
+            top = np.arange(len(rows))
+        top = top[np.argsort(scores[top])[::-1]]
+        return [(int(rows[i]), float(scores[i])) for i in top]
+
+def create_lazy_vector_index(document_id: str, pages: np.ndarray, page_count: int, range_pages: int) -> LazyVectorIndex:
+    """
+    Start a lazy index for a document whose chunk i is on page pages[i]
+    Any previous vector index of the document is removed
+    """
+    os.makedirs(CHUNK_STORE_DIR, exist_ok=True)
+    pages = np.asarray(pages, dtype=np.int64)
+    table = []
+    for first_page in range(1, max(page_count, 1) + 1, range_pages):
+        last_page = min(first_page + range_pages - 1, max(page_count, 1))
+        first_row = int(np.searchsorted(pages, first_page, side='left'))
+        end_row = int(np.searchsorted(pages, last_page, side='right'))
+        # Ranges without chunks (blank pages) count as filled
+        table.append((first_page, last_page, first_row, end_row, int(end_row == first_row)))
+    ranges = np.asarray(table, dtype=np.int64).reshape(-1, 5)
+    with _range_lock(document_id):
+        for path in (vector_index_path(document_id), vector_norms_path(document_id)):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+        _save_array(vector_ranges_path(document_id), ranges)
+    logger.info(f"Created lazy vector index for document {document_id}: {len(ranges)} ranges of {range_pages} pages")
+    return LazyVectorIndex(document_id, len(pages), ranges)
+
+def load_lazy_vector_index(document_id: str, count: int) -> Optional[LazyVectorIndex]:
+    """Load a document's partially filled index, or None if the document is not lazily indexed"""
+    ranges_path = vector_ranges_path(document_id)
+    if not os.path.exists(ranges_path):
+        return None
+    try:
+        ranges = np.load(ranges_path)
+        vectors = norms = None
+        if os.path.exists(vector_index_path(document_id)):
+            vectors = np.load(vector_index_path(document_id), mmap_mode='r+')
+            norms = np.load(vector_norms_path(document_id), mmap_mode='r+')
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not read lazy vector index for document {document_id}: {e}")
+        return None
+    if vectors is not None and (vectors.shape[0] != count or norms.shape != (count,)):
+        logger.warning(f"Lazy vector index for document {document_id} does not match its chunk store - ignoring it")
+        return None
+    return LazyVectorIndex(document_id, count, ranges, vectors, norms)
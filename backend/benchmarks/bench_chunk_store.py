@@ -0,0 +1,80 @@
+"""
+Benchmark: binary memory-mapped chunk store vs. the legacy JSON file
+
+Per query, the legacy path parses the whole pretty-printed JSON file; the
+binary store is opened with mmap and only the requested chunks (and the
+postings of the query terms) are decoded.
+
+The legacy file holds chunk texts only; the binary store adds chunk ids, page
+references and the BM25 postings, so it is larger - the size without postings
+is printed too.
+
+Usage (from backend/):
+    python -m benchmarks.bench_chunk_store [--chunks 10000] [--queries 50]
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from app import chunk_store
+from app.chunk_store import Chunk, load_chunk_store, save_chunk_store
+from app.keyword_index import KeywordIndex, load_keyword_index
+from benchmarks.bench_keyword_index import WORDS, make_chunks
+
+def measure(fn, repeat: int):
+    """Returns (mean seconds, peak Python heap bytes) for one call of fn"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    elapsed = (time.perf_counter() - start) / repeat
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=10000)
+    parser.add_argument("--queries", type=int, default=50)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    texts = make_chunks(args.chunks, rng)
+    chunk_store.CHUNK_STORE_DIR = tempfile.mkdtemp()
+    document_id = "bench"
+
+    legacy_file = os.path.join(chunk_store.CHUNK_STORE_DIR, f"doc_{document_id}.json")
+    with open(legacy_file, 'w', encoding='utf-8') as f:
+        json.dump({"document_id": document_id, "chunks": texts}, f, ensure_ascii=False, indent=2)
+
+    chunks = [Chunk(f"{document_id}:p{i // 4 + 1}:{i}", text, i // 4 + 1, 0, len(text)) for i, text in enumerate(texts)]
+    binary_file = save_chunk_store(document_id, chunks, KeywordIndex.build(texts))
+    chunks_only_file = save_chunk_store(f"{document_id}-chunks-only", chunks)
+    question = " ".join(rng.sample(WORDS[-15:], 2) + rng.sample(WORDS[200:5000], 3))
+
+    def legacy_query():
+        with open(legacy_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return data["chunks"][:3]
+
+    def binary_query():
+        store = load_chunk_store(document_id)
+        hits = load_keyword_index(document_id, store).search(question, k=3)
+        return [store.get(i) for i, _ in hits]
+
+    legacy_time, legacy_peak = measure(legacy_query, args.queries)
+    binary_time, binary_peak = measure(binary_query, args.queries)
+
+    print(f"chunks: {args.chunks}")
+    print(f"file size          JSON {os.path.getsize(legacy_file) / 1e6:8.2f} MB   binary+postings {os.path.getsize(binary_file) / 1e6:8.2f} MB"
+          f"   binary without postings {os.path.getsize(chunks_only_file) / 1e6:8.2f} MB")
+    print(f"load per query     JSON {legacy_time * 1000:8.2f} ms   binary (open + BM25 + fetch) {binary_time * 1000:8.2f} ms")
+    print(f"heap per query     JSON {legacy_peak / 1e6:8.2f} MB   binary {binary_peak / 1e6:8.3f} MB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Benchmark: embedding a document in one request vs. concurrent token-budget batches
+
+The remote embedding API is simulated with a fixed per-request latency plus a
+per-token cost, so the numbers show how wall time scales with concurrency
+rather than with page count.
+
+Usage (from backend/):
+    python -m benchmarks.bench_embedding_batcher [--chunks 2000] [--latency 0.2]
+"""
+import argparse
+import asyncio
+import random
+import time
+
+import numpy as np
+
+from app.embedders import HashingEmbedder
+from app.embedding_batcher import embed_in_batches, estimate_tokens, token_batches
+from benchmarks.bench_keyword_index import make_chunks
+
+class SimulatedRemoteEmbedder(HashingEmbedder):
+    """Hashing vectors, delivered with the latency profile of a remote API"""
+    def __init__(self, latency: float, seconds_per_token: float):
+        super().__init__()
+        self.latency = latency
+        self.seconds_per_token = seconds_per_token
+
+    def embed_documents(self, texts):
+        time.sleep(self.latency + self.seconds_per_token * sum(estimate_tokens(text) for text in texts))
+        return super().embed_documents(texts)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds per request")
+    parser.add_argument("--seconds-per-token", type=float, default=2e-5)
+    args = parser.parse_args()
+
+    texts = make_chunks(args.chunks, random.Random(7))
+    embedder = SimulatedRemoteEmbedder(args.latency, args.seconds_per_token)
+    print(f"chunks: {args.chunks}  batches: {len(token_batches(texts))}")
+
+    start = time.perf_counter()
+    reference = embedder._embed_batch(texts)
+    time.sleep(args.latency + args.seconds_per_token * sum(estimate_tokens(text) for text in texts))
+    print(f"single request       {time.perf_counter() - start:7.2f} s   (over provider limits for large documents)")
+
+    for concurrency in (1, 4, 8, 16):
+        matrix = np.zeros_like(reference)
+
+        async def write_batch(first: int, vectors):
+            matrix[first:first + len(vectors)] = vectors
+
+        start = time.perf_counter()
+        asyncio.run(embed_in_batches(embedder, texts, write_batch, concurrency=concurrency))
+        elapsed = time.perf_counter() - start
+        print(f"concurrency {concurrency:3}      {elapsed:7.2f} s   identical: {np.array_equal(matrix, reference)}")
+
+if __name__ == "__main__":
+    main()
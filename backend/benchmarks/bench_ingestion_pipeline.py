@@ -0,0 +1,112 @@
+"""
+Benchmark: sequential ingestion vs. the streaming extract -> chunk -> embed pipeline
+
+Sequential ingestion extracts every page, then chunks the whole document, then
+embeds it. The pipeline embeds the first batches while later pages are still
+being extracted and never holds the whole text. The remote embedding API is
+simulated with a fixed per-request latency plus a per-token cost.
+
+Usage (from backend/):
+    python -m benchmarks.bench_ingestion_pipeline [--pages 600] [--latency 0.05]
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from app import chunk_store, vector_index
+from app.chunk_store import Chunk, save_chunk_store
+from app.keyword_index import KeywordIndex
+from app.pdf_extraction import extract_pages, iter_pages, shutdown_extraction_pool
+from app.vector_index import VectorIndexWriter, save_vector_index
+from app.embedding_batcher import embed_in_batches
+from app.ingestion_pipeline import IngestionPipeline
+from benchmarks.bench_embedding_batcher import SimulatedRemoteEmbedder
+from benchmarks.bench_pdf_extraction import make_pdf
+
+CHUNK_SIZE = 500
+
+def page_chunks(page_number: int, page_text: str):
+    return [
+        Chunk(f"bench:p{page_number}:{start}", page_text[start:start + CHUNK_SIZE], page_number, start,
+              min(start + CHUNK_SIZE, len(page_text)))
+        for start in range(0, len(page_text), CHUNK_SIZE)
+    ]
+
+def sequential(pdf_path: str, embedder) -> int:
+    pages = extract_pages(pdf_path)
+    chunks = [chunk for page_number, page_text in enumerate(pages, start=1)
+              for chunk in page_chunks(page_number, page_text)]
+    texts = [chunk.text for chunk in chunks]
+    save_chunk_store("sequential", chunks, KeywordIndex.build(texts))
+    matrix = np.zeros((len(texts), embedder.dimension), dtype=np.float32)
+
+    async def collect(start, vectors):
+        matrix[start:start + len(vectors)] = vectors
+
+    asyncio.run(embed_in_batches(embedder, texts, collect))
+    save_vector_index("sequential", matrix)
+    return len(chunks)
+
+def pipelined(pdf_path: str, embedder) -> int:
+    writer = VectorIndexWriter("pipelined")
+
+    async def write(start, chunks, batch):
+        writer.write(start, batch)
+
+    pipeline = IngestionPipeline("pipelined", page_chunks, embedder, on_vectors=write)
+    result = asyncio.run(pipeline.run(iter_pages(pdf_path)))
+    writer.commit()
+    return result.chunk_count
+
+def measure(fn, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=600)
+    parser.add_argument("--pdf", help="Existing PDF to benchmark instead of a generated one")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per embedding request")
+    parser.add_argument("--seconds-per-token", type=float, default=2e-5)
+    args = parser.parse_args()
+
+    # Keep benchmark output out of the real data directory
+    output_dir = tempfile.mkdtemp()
+    chunk_store.CHUNK_STORE_DIR = output_dir
+    vector_index.CHUNK_STORE_DIR = output_dir
+
+    pdf_path = args.pdf
+    if not pdf_path:
+        pdf_path = os.path.join(output_dir, "bench.pdf")
+        print(f"Generating {args.pages}-page PDF at {pdf_path}...")
+        make_pdf(pdf_path, args.pages)
+
+    embedder = SimulatedRemoteEmbedder(args.latency, args.seconds_per_token)
+    # Warm the extraction pool so process start-up is not counted
+    extract_pages(pdf_path)
+
+    for name, fn in (("sequential", sequential), ("pipelined", pipelined)):
+        chunks, elapsed, peak = measure(fn, pdf_path, embedder)
+        print(f"{name:<11} {elapsed:7.2f} s   peak heap {peak / 1e6:8.2f} MB   chunks {chunks}")
+
+    identical = all(
+        open(os.path.join(output_dir, f"doc_sequential.{suffix}"), 'rb').read()
+        == open(os.path.join(output_dir, f"doc_pipelined.{suffix}"), 'rb').read()
+        for suffix in ("chunks", "vectors.npy", "norms.npy")
+    )
+    print(f"identical output: {identical}")
+
+    shutdown_extraction_pool()
+
+if __name__ == "__main__":
+    main()
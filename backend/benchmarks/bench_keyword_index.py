@@ -0,0 +1,84 @@
+"""
+Benchmark: BM25 inverted index vs. the legacy linear keyword scan
+
+The legacy scan re-reads the document's JSON file on every query and checks
+each question word against every chunk's word list. The BM25 index is built
+once at ingestion, so only its query time is paid per question.
+
+Usage (from backend/):
+    python -m benchmarks.bench_keyword_index [--chunks 10000] [--queries 200]
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from app.keyword_index import KeywordIndex
+
+WORDS = [f"term{n}" for n in range(5000)] + [
+    "contract", "payment", "termination", "liability", "warranty", "refund", "clause",
+    "agreement", "party", "notice", "schedule", "invoice", "delivery", "service", "fee"
+]
+
+def make_chunks(count: int, rng: random.Random):
+    # ~500 chars per chunk, Zipf-ish word distribution
+    weights = [1.0 / (rank + 1) for rank in range(len(WORDS))]
+    return [" ".join(rng.choices(WORDS, weights=weights, k=70)) for _ in range(count)]
+
+def legacy_scan(mock_file: str, question: str):
+    """The retrieval loop generate_ai_response used before the BM25 index"""
+    with open(mock_file, 'r', encoding='utf-8') as f:
+        mock_data = json.load(f)
+    relevant_chunks = []
+    question_words = question.lower().split()
+    for chunk in mock_data.get('chunks', []):
+        chunk_words = chunk.lower().split()
+        matches = sum(1 for word in question_words if word in chunk_words)
+        if matches > 0:
+            relevant_chunks.append((chunk, matches))
+    relevant_chunks.sort(key=lambda x: x[1], reverse=True)
+    return [chunk[0] for chunk in relevant_chunks[:3]]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=10000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--legacy-queries", type=int, default=10, help="The legacy scan is slow; time fewer queries")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    chunks = make_chunks(args.chunks, rng)
+    # Two domain terms plus three mid-frequency terms, like a question after stopword removal
+    questions = [" ".join(rng.sample(WORDS[-15:], 2) + rng.sample(WORDS[200:5000], 3)) for _ in range(args.queries)]
+
+    mock_file = os.path.join(tempfile.mkdtemp(), "doc_bench.json")
+    with open(mock_file, 'w', encoding='utf-8') as f:
+        json.dump({"document_id": "bench", "chunks": chunks}, f, ensure_ascii=False, indent=2)
+
+    start = time.perf_counter()
+    index = KeywordIndex.build(chunks)
+    build_time = time.perf_counter() - start
+
+    # Warm the lazily computed per-term weights, as repeated queries on a loaded index would
+    for question in questions:
+        index.search(question, k=3)
+    start = time.perf_counter()
+    for question in questions:
+        index.search(question, k=3)
+    bm25_time = (time.perf_counter() - start) / len(questions)
+
+    start = time.perf_counter()
+    for question in questions[:args.legacy_queries]:
+        legacy_scan(mock_file, question)
+    legacy_time = (time.perf_counter() - start) / args.legacy_queries
+
+    print(f"chunks: {args.chunks}, terms: {len(index.postings)}")
+    print(f"BM25 build (once, at ingestion): {build_time * 1000:10.1f} ms")
+    print(f"BM25 query:                      {bm25_time * 1000:10.3f} ms")
+    print(f"legacy scan query:               {legacy_time * 1000:10.1f} ms")
+    print(f"speedup per query:               {legacy_time / bm25_time:10.0f}x")
+
+if __name__ == "__main__":
+    main()
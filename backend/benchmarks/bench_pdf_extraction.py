@@ -0,0 +1,73 @@
+"""
+Benchmark: parallel page extraction vs. worker count
+
+Generates a synthetic PDF (or uses one passed on the command line) and times
+app.pdf_extraction.extract_pages with 1..N worker processes.
+
+Usage (from backend/):
+    python -m benchmarks.bench_pdf_extraction [--pages 1500] [--pdf path.pdf] [--repeat 3]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import fitz  # PyMuPDF
+
+from app.pdf_extraction import extract_pages, shutdown_extraction_pool
+
+LOREM = (
+    "Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor "
+    "incididunt ut labore et dolore magna aliqua. Ut enim ad minim veniam, quis nostrud "
+    "exercitation ullamco laboris nisi ut aliquip ex ea commodo consequat. "
+)
+
+def make_pdf(path: str, pages: int):
+    doc = fitz.open()
+    for page_num in range(pages):
+        page = doc.new_page()
+        text = f"Section {page_num + 1}\n" + (LOREM * 12)
+        page.insert_textbox(fitz.Rect(40, 40, 560, 800), text, fontsize=9)
+    doc.save(path)
+    doc.close()
+
+def worker_counts(max_workers: int):
+    counts, n = [], 1
+    while n < max_workers:
+        counts.append(n)
+        n *= 2
+    counts.append(max_workers)
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=1500)
+    parser.add_argument("--pdf", help="Existing PDF to benchmark instead of a generated one")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    pdf_path = args.pdf
+    if not pdf_path:
+        pdf_path = os.path.join(tempfile.mkdtemp(), "bench.pdf")
+        print(f"Generating {args.pages}-page PDF at {pdf_path}...")
+        make_pdf(pdf_path, args.pages)
+
+    baseline = None
+    print(f"{'workers':>8} {'best (s)':>10} {'pages/s':>10} {'speedup':>8}")
+    for workers in worker_counts(args.max_workers):
+        # Warm the pool so process start-up is not counted
+        extract_pages(pdf_path, workers=workers, threshold=0)
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            pages = extract_pages(pdf_path, workers=workers, threshold=0)
+            timings.append(time.perf_counter() - start)
+        best = min(timings)
+        baseline = baseline or best
+        print(f"{workers:>8} {best:>10.3f} {len(pages) / best:>10.0f} {baseline / best:>7.2f}x")
+
+    shutdown_extraction_pool()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Benchmark: span-based RecursiveTextSplitter vs. LangChain's RecursiveCharacterTextSplitter
+
+Times splitting page-sized texts with the production settings (500 / 50).
+That both splitters produce identical chunks is checked by tests/test_text_splitter.py.
+
+Needs LangChain's splitter installed (langchain or langchain-text-splitters).
+
+Usage (from backend/):
+    python -m benchmarks.bench_text_splitter [--pages 2000]
+"""
+import argparse
+import random
+import time
+
+try:
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+except ImportError:
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from app.text_splitter import RecursiveTextSplitter
+
+WORDS = ["the", "contract", "payment", "terms", "section", "liability", "warranty", "notice",
+         "clause", "party", "a", "of", "and", "to", "Überweisung", "契約", "naïve", "x"]
+
+def page_text(rng: random.Random) -> str:
+    """Roughly what PyMuPDF returns for a page of prose: short lines, blank lines between paragraphs"""
+    paragraphs = []
+    for _ in range(rng.randint(3, 8)):
+        lines = [" ".join(rng.choices(WORDS[:14], k=rng.randint(8, 14))) for _ in range(rng.randint(2, 8))]
+        paragraphs.append("\n".join(lines))
+    return "\n\n".join(paragraphs) + "\n"
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    pages = [page_text(rng) for _ in range(args.pages)]
+    reference = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50, length_function=len)
+    splitter = RecursiveTextSplitter(chunk_size=500, chunk_overlap=50)
+
+    start = time.perf_counter()
+    chunks = 0
+    for text in pages:
+        search_from = 0
+        for chunk in reference.split_text(text):
+            # What ingestion had to do to recover offsets from LangChain's strings
+            search_from = text.find(chunk, search_from) + 1
+            chunks += 1
+    reference_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for text in pages:
+        splitter.split_spans(text)
+    span_time = time.perf_counter() - start
+
+    print(f"pages: {args.pages}  chunks: {chunks}  chars: {sum(map(len, pages)) / 1e6:.1f}M")
+    print(f"LangChain + find     {reference_time * 1000:8.1f} ms")
+    print(f"span splitter        {span_time * 1000:8.1f} ms   {reference_time / span_time:5.1f}x")
+
+if __name__ == "__main__":
+    main()
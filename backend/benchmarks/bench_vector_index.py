@@ -0,0 +1,80 @@
+"""
+Benchmark: NumPy memory-mapped vector index vs. a ChromaDB collection
+
+Both answer the same top-3 cosine queries over one document's chunk
+embeddings. ChromaDB is only measured when it is installed.
+
+Usage (from backend/):
+    python -m benchmarks.bench_vector_index [--chunks 2000] [--dimension 1536] [--queries 200]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from app import vector_index
+from app.vector_index import save_vector_index, load_vector_index
+
+def measure(fn, repeat: int):
+    """Returns (mean seconds, peak Python heap bytes) for one call of fn"""
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    elapsed = (time.perf_counter() - start) / repeat
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--dimension", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(7)
+    vectors = rng.standard_normal((args.chunks, args.dimension)).astype(np.float32)
+    queries = rng.standard_normal((args.queries, args.dimension)).astype(np.float32)
+    vector_index.CHUNK_STORE_DIR = tempfile.mkdtemp()
+
+    exact = (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)) @ queries[0]
+    expected = set(np.argsort(exact)[::-1][:3].tolist())
+
+    print(f"chunks: {args.chunks}  dimension: {args.dimension}")
+    for dtype in (np.float32, np.float16):
+        document_id = f"bench_{np.dtype(dtype).name}"
+        path = save_vector_index(document_id, vectors, dtype=dtype)
+        index = load_vector_index(document_id)
+        found = {chunk_index for chunk_index, _ in index.search(queries[0], k=3)}
+        query_iter = iter(range(10 ** 9))
+        elapsed, peak = measure(lambda: index.search(queries[next(query_iter) % args.queries], k=3), args.queries)
+        print(f"numpy {np.dtype(dtype).name:8}  file {os.path.getsize(path) / 1e6:7.2f} MB   "
+              f"query {elapsed * 1000:7.3f} ms   heap {peak / 1e6:6.2f} MB   top-3 exact: {found == expected}")
+
+    try:
+        import chromadb
+    except ImportError:
+        print("chromadb       not installed - skipped")
+        return
+
+    client = chromadb.EphemeralClient()
+    collection = client.create_collection(name=f"bench_{random.randrange(10 ** 6)}", metadata={"hnsw:space": "cosine"})
+    ids = [str(n) for n in range(args.chunks)]
+    for start in range(0, args.chunks, 1000):
+        collection.add(ids=ids[start:start + 1000], embeddings=vectors[start:start + 1000].tolist())
+    query_iter = iter(range(10 ** 9))
+    elapsed, peak = measure(
+        lambda: collection.query(query_embeddings=[queries[next(query_iter) % args.queries].tolist()], n_results=3),
+        args.queries
+    )
+    print(f"chroma          query {elapsed * 1000:7.3f} ms   heap {peak / 1e6:6.2f} MB")
+
+if __name__ == "__main__":
+    main()
@@ -67,6 +67,46 @@ app.include_router(auth_router, prefix="/api/auth", tags=["authentication"])
 app.include_router(pdf_router, prefix="/api", tags=["pdf"])
 app.include_router(chat_router, prefix="/api/chat", tags=["chat"])
 
+from app.ingestion import ingestion_manager
+
+async def emit_ingestion_progress(job):
+    """Forward ingestion job progress to the job's Socket.IO room"""
+    if job.status == "completed":
+        event = 'ingestion_complete'
+    elif job.status == "failed":
+        event = 'ingestion_failed'
+    else:
+        event = 'ingestion_progress'
+    await sio.emit(event, job.to_dict(), room=job.room)
+
+ingestion_manager.add_progress_callback(emit_ingestion_progress)
+
+@app.on_event("startup")
+async def startup_event():
+    """Start background ingestion workers, lazy indexing of large documents and storage collection"""
+    await ingestion_manager.start()
+    from app.lazy_index import lazy_indexer
+    await lazy_indexer.start()
+    from app.storage_gc import storage_collector
+    await storage_collector.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background workers and release pooled outbound connections"""
+    await ingestion_manager.stop()
+    from app.lazy_index import lazy_indexer
+    await lazy_indexer.stop()
+    from app.storage_gc import storage_collector
+    await storage_collector.stop()
+    from app.pdf_extraction import shutdown_extraction_pool
+    shutdown_extraction_pool()
+    from app.openrouter_client import close_openrouter_client
+    await close_openrouter_client()
+    from app.embedding_cache import embedding_cache
+    embedding_cache.close()
+    from app.answer_cache import answer_cache
+    answer_cache.close()
+
 # Health check endpoint
 @app.get("/health")
 async def health_check():
@@ -153,6 +193,8 @@ async def query(sid, data):
         query_text = data.get('query')
         session_id = data.get('session_id')
         user_id = data.get('user_id', 'anonymous')  # Get user_id from client
+        stream = bool(data.get('stream', False))  # Opt-in token streaming via response_chunk events
+        bypass_cache = bool(data.get('bypass_cache', False))  # Skip the answer cache for this question
         
         logger.info(f"📥 Received query from {sid}: {query_text[:50] if query_text else 'None'}... for document {document_id}, session {session_id}")
         
@@ -168,7 +210,7 @@ async def query(sid, data):
             return
         
         # Import the AI response generator and chat history (database-backed)
-        from app.chat import generate_ai_response
+        from app.chat import generate_ai_response, stream_ai_response
         from app.chat_history_db import chat_history_manager, ChatMessage
         import uuid
         
@@ -198,7 +240,18 @@ async def query(sid, data):
         
         # Generate AI response
         logger.info(f"🤖 Generating AI response for document {document_id}...")
-        response_text, sources, search_mode = await generate_ai_response(query_text, document_id)
+        if stream:
+            # Forward tokens as they arrive instead of waiting for the full completion
+            async def emit_chunk(chunk: str):
+                await sio.emit('response_chunk', {
+                    'chunk': chunk,
+                    'document_id': document_id,
+                    'session_id': session_id
+                }, room=sid)
+            
+            response_text, sources, search_mode = await stream_ai_response(query_text, document_id, emit_chunk, bypass_cache)
+        else:
+            response_text, sources, search_mode = await generate_ai_response(query_text, document_id, bypass_cache)
         
         logger.info(f"✅ Generated response for {sid}: {response_text[:100] if response_text else 'Empty'}...")
         
@@ -214,10 +267,11 @@ async def query(sid, data):
         logger.info(f"💾 Saved AI response to session {session_id}")
         
         # Send response back to client with session_id and search mode
-        await sio.emit('response', {
+        await sio.emit('response_complete' if stream else 'response', {
             'response': response_text,
             'document_id': document_id,
             'session_id': session_id,
+            'message_id': ai_message.message_id,
             'sources': sources,
             'searchMode': search_mode
         }, room=sid)
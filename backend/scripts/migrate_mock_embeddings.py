@@ -0,0 +1,59 @@
+"""
+Convert legacy JSON chunk stores (data/mock_embeddings/doc_*.json) to the
+binary chunk-store format, building each document's BM25 postings section.
+
+Usage (from backend/):
+    python -m scripts.migrate_mock_embeddings [--dir data/mock_embeddings] [--delete] [--dry-run]
+"""
+import argparse
+import glob
+import logging
+import os
+import sys
+
+from app import chunk_store
+from app.chunk_store import load_legacy_chunk_store, save_chunk_store, chunk_store_path
+from app.keyword_index import KeywordIndex
+
+logger = logging.getLogger("migrate_mock_embeddings")
+
+def migrate(directory: str, delete: bool = False, dry_run: bool = False) -> int:
+    chunk_store.CHUNK_STORE_DIR = os.path.abspath(directory)
+    legacy_files = sorted(glob.glob(os.path.join(chunk_store.CHUNK_STORE_DIR, "doc_*.json")))
+    failures = 0
+    json_bytes = binary_bytes = 0
+
+    for legacy_file in legacy_files:
+        document_id = os.path.basename(legacy_file)[len("doc_"):-len(".json")]
+        try:
+            store = load_legacy_chunk_store(document_id)
+            if dry_run:
+                logger.info(f"Would convert {document_id} ({len(store)} chunks)")
+                continue
+            index = KeywordIndex.build(store.texts)
+            path = save_chunk_store(document_id, list(store), index)
+            json_bytes += os.path.getsize(legacy_file)
+            binary_bytes += os.path.getsize(path)
+            if delete:
+                os.unlink(legacy_file)
+            logger.info(f"Converted {document_id}: {len(store)} chunks -> {path}")
+        except Exception as e:
+            failures += 1
+            logger.error(f"Failed to convert {legacy_file}: {e}")
+
+    if not dry_run and json_bytes:
+        logger.info(f"Converted {len(legacy_files) - failures} stores: {json_bytes} bytes of JSON -> {binary_bytes} bytes binary (with postings)")
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dir", default=chunk_store.CHUNK_STORE_DIR, help="Chunk store directory")
+    parser.add_argument("--delete", action="store_true", help="Remove each JSON file after it is converted")
+    parser.add_argument("--dry-run", action="store_true", help="List what would be converted")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    sys.exit(1 if migrate(args.dir, delete=args.delete, dry_run=args.dry_run) else 0)
+
+if __name__ == "__main__":
+    main()
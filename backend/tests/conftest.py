@@ -0,0 +1,21 @@
+"""
+Keeps the suite away from the checked-in data directory: the app writes its
+SQLite database and uploads under ./data, so tests run from a scratch
+directory, and index_dir points the chunk store directory at a per-test one.
+"""
+import os
+import tempfile
+
+import pytest
+
+os.chdir(tempfile.mkdtemp(prefix="pdfpixie-tests-"))
+
+@pytest.fixture
+def index_dir(tmp_path, monkeypatch):
+    """Chunk stores and vector indexes of the test go to their own directory"""
+    from app import chunk_store, vector_index, lazy_index, storage_gc, pdf_processing
+    directory = tmp_path / "mock_embeddings"
+    directory.mkdir()
+    for module in (chunk_store, vector_index, lazy_index, storage_gc, pdf_processing):
+        monkeypatch.setattr(module, "CHUNK_STORE_DIR", str(directory))
+    return directory
@@ -0,0 +1,75 @@
+"""
+Binary chunk store: chunks and BM25 postings survive a save/load round trip,
+and legacy JSON stores are converted by the migration script.
+"""
+import json
+import os
+
+from app import chunk_store
+from app.chunk_store import (
+    Chunk, MappedChunkStore, _decode_varints, _encode_varints, load_chunk_store, save_chunk_store
+)
+from app.keyword_index import KeywordIndex, load_keyword_index
+from scripts.migrate_mock_embeddings import migrate
+
+TEXTS = [
+    "The refund window is 30 days from delivery.",
+    "Shipping takes five to seven business days.",
+    "Refund requests need the order number; refund refund refund.",
+    "",
+    "Große Rückerstattung für Bestellungen über 100 €.",
+]
+
+def make_chunks():
+    chunks = [Chunk(f"doc:p{i + 1}:{i}", text, i + 1, 10 * i, 10 * i + len(text)) for i, text in enumerate(TEXTS)]
+    chunks.append(Chunk("doc:legacy", "Chunk without a page", None, None, None))
+    return chunks
+
+def test_varints_round_trip():
+    values = [0, 1, 127, 128, 300, 16383, 16384, 2 ** 32 - 1]
+    encoded = bytearray()
+    _encode_varints(values, encoded)
+    assert _decode_varints(bytes(encoded)) == values
+
+def test_save_and_load_round_trip(index_dir):
+    chunks = make_chunks()
+    built = KeywordIndex.build([chunk.text for chunk in chunks])
+    save_chunk_store("doc", chunks, built)
+
+    store = load_chunk_store("doc")
+    assert isinstance(store, MappedChunkStore) and store.has_postings
+    assert len(store) == len(chunks)
+    for loaded, chunk in zip(store, chunks):
+        assert loaded.to_source() == chunk.to_source()
+        assert loaded.text == chunk.text
+
+    loaded_index = load_keyword_index("doc", store)
+    assert list(loaded_index.doc_lengths) == list(built.doc_lengths)
+    for term, (chunk_indexes, freqs) in built.postings.items():
+        assert loaded_index.postings[term] == (chunk_indexes, freqs)
+    assert len(loaded_index.postings) == len(built.postings)
+    for query in ("refund", "shipping days", "rückerstattung", "missing"):
+        assert loaded_index.search(query, k=3) == built.search(query, k=3)
+    store.close()
+
+def test_store_without_postings_gets_its_keyword_index_on_first_use(index_dir):
+    save_chunk_store("doc", make_chunks())
+    store = load_chunk_store("doc")
+    assert not store.has_postings
+    index = load_keyword_index("doc", store)
+    assert index.search("refund", k=1)[0][0] == 2
+    store.close()
+    assert load_chunk_store("doc").has_postings
+
+def test_migrate_legacy_json_stores(index_dir):
+    legacy_file = os.path.join(chunk_store.CHUNK_STORE_DIR, "doc_old.json")
+    with open(legacy_file, 'w', encoding='utf-8') as f:
+        json.dump({"document_id": "old", "chunks": TEXTS}, f)
+
+    assert migrate(str(index_dir), delete=True) == 0
+    assert not os.path.exists(legacy_file)
+    store = load_chunk_store("old")
+    assert isinstance(store, MappedChunkStore) and store.has_postings
+    assert store.texts == TEXTS
+    assert store.get(0).chunk_id == "old_0" and store.get(0).page is None
+    assert load_keyword_index("old", store).search("refund", k=1)[0][0] == 2
@@ -0,0 +1,84 @@
+"""
+Content registry: uploads of the same bytes share one canonical document,
+content whose processing failed can be uploaded again, and releasing an
+upload that was never queued lets the next upload process it.
+"""
+import uuid
+
+import pytest
+
+from app.content_registry import (
+    ContentRegistry, CONTENT_FAILED, CONTENT_PROCESSING, CONTENT_READY
+)
+from app.database import init_db
+
+@pytest.fixture
+def registry():
+    init_db()
+    return ContentRegistry()
+
+def upload(registry, content_hash, user_id="alice", **kwargs):
+    document_id = str(uuid.uuid4())
+    blob, duplicate = registry.register_upload(
+        content_hash, document_id, user_id, "contract.pdf", 1024, f"uploads/{document_id}.pdf", str(uuid.uuid4()), **kwargs
+    )
+    return document_id, blob, duplicate
+
+def new_hash() -> str:
+    return uuid.uuid4().hex * 2
+
+def test_duplicate_upload_shares_the_canonical_document(registry):
+    content_hash = new_hash()
+    first, blob, duplicate = upload(registry, content_hash)
+    assert not duplicate and blob.canonical_document_id == first and blob.status == CONTENT_PROCESSING
+    registry.mark_ready(content_hash, page_count=3, text_length=100, chunk_count=2)
+
+    second, blob, duplicate = upload(registry, content_hash, user_id="bob")
+    assert duplicate and blob.canonical_document_id == first and blob.status == CONTENT_READY
+    assert registry.resolve(second) == first
+    assert registry.get_document(second, "bob").page_count == 3
+    assert registry.get_document(second, "alice") is None
+
+def test_upload_after_failure_becomes_the_canonical_document(registry):
+    content_hash = new_hash()
+    first, _, _ = upload(registry, content_hash)
+    alias, _, duplicate = upload(registry, content_hash)
+    assert duplicate
+    assert registry.resolve(alias) == first
+    assert registry.resolve(first) == first
+    registry.mark_failed(content_hash)
+
+    retry, blob, duplicate = upload(registry, content_hash)
+    assert not duplicate and blob.canonical_document_id == retry and blob.status == CONTENT_PROCESSING
+    # Resolutions cached before the retry follow the content to its new canonical document
+    assert registry.resolve(alias) == retry
+    assert registry.resolve(first) == retry
+
+def test_release_lets_the_next_upload_process_the_content(registry):
+    content_hash = new_hash()
+    first, _, _ = upload(registry, content_hash)
+    registry.release(first)
+    assert registry.get_document(first, "alice") is None
+    assert registry.resolve(first) == first
+
+    second, blob, duplicate = upload(registry, content_hash)
+    assert not duplicate and blob.canonical_document_id == second
+
+def test_releasing_a_duplicate_keeps_the_content(registry):
+    content_hash = new_hash()
+    first, _, _ = upload(registry, content_hash)
+    alias, _, _ = upload(registry, content_hash)
+    registry.release(alias)
+    assert registry.get_blob(first).status == CONTENT_PROCESSING
+
+def test_failed_store_records_nothing(registry):
+    content_hash = new_hash()
+
+    def store_content(blob, duplicate):
+        raise OSError("disk full")
+
+    with pytest.raises(OSError):
+        upload(registry, content_hash, store_content=store_content)
+    document_id, _, duplicate = upload(registry, content_hash)
+    assert not duplicate
+    assert registry.get_blob(document_id).status != CONTENT_FAILED
@@ -0,0 +1,53 @@
+"""
+GET /documents: the full list by default, keyset pages when limit or cursor is given.
+"""
+import uuid
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.auth import UserInfo
+from app.content_registry import content_registry
+from app.database import init_db
+from app.pdf_processing import DocumentListResponse, list_documents
+
+@pytest.fixture
+def user():
+    init_db()
+    user = UserInfo(user_id=f"user-{uuid.uuid4()}", email="reader@example.com")
+    document_ids = []
+    for n in range(5):
+        document_id = str(uuid.uuid4())
+        content_registry.register_upload(uuid.uuid4().hex * 2, document_id, user.user_id, f"report-{n}.pdf",
+                                         1024, f"uploads/{document_id}.pdf", None)
+        document_ids.append(document_id)
+    # Newest first
+    return user, document_ids[::-1]
+
+def listing(user, limit=None, cursor=None):
+    return asyncio.run(list_documents(limit=limit, cursor=cursor, current_user=user))
+
+def test_lists_every_document_by_default(user):
+    user, document_ids = user
+    documents = listing(user)
+    assert isinstance(documents, list)
+    assert [document.document_id for document in documents] == document_ids
+
+def test_pages_follow_the_cursor(user):
+    user, document_ids = user
+    seen = []
+    page = listing(user, limit=2)
+    while True:
+        assert isinstance(page, DocumentListResponse) and len(page.documents) <= 2
+        seen.extend(document.document_id for document in page.documents)
+        if page.next_cursor is None:
+            break
+        page = listing(user, limit=2, cursor=page.next_cursor)
+    assert seen == document_ids
+
+def test_invalid_cursor_is_rejected(user):
+    user, _ = user
+    with pytest.raises(HTTPException) as error:
+        listing(user, cursor="not a cursor")
+    assert error.value.status_code == 400
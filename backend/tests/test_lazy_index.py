@@ -0,0 +1,79 @@
+"""
+Lazily indexed documents: page ranges map to chunk rows, searches only read
+embedded ranges, and a question's ranges are embedded under their own budget.
+"""
+import time
+import asyncio
+
+import numpy as np
+import pytest
+
+from app import lazy_index
+from app.chunk_store import Chunk, ChunkStore
+from app.embedders import HashingEmbedder
+from app.index_cache import DocumentIndex
+from app.keyword_index import KeywordIndex
+from app.lazy_index import index_ranges_within_budget, lazily_indexed
+from app.vector_index import RANGE_FILLED, create_lazy_vector_index
+
+# Chunk i is on PAGES[i]; ranges of 20 pages: 1-20, 21-40, 41-60, 61-70 (no chunks)
+PAGES = [1, 1, 2, 5, 21, 22, 45]
+
+def make_index():
+    return create_lazy_vector_index("doc", np.asarray(PAGES), page_count=70, range_pages=20)
+
+def test_ranges_for_pages(index_dir):
+    index = make_index()
+    assert index.rows(0) == (0, 4)
+    assert index.rows(1) == (4, 6)
+    assert index.rows(2) == (6, 7)
+    assert index.ranges_for_pages([22, 3, 5, 45, 21, 71]) == [1, 0, 2]
+    # A range without chunks counts as filled
+    assert index.missing([0, 1, 2, 3]) == [0, 1, 2]
+
+def test_search_scores_only_filled_ranges(index_dir):
+    index = make_index()
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(2, 16)).astype(np.float32)
+    assert index.fill(1, vectors)
+    assert not index.fill(1, vectors)
+    # Rows of ranges not embedded yet are never read - NaN there would poison every score
+    index.vectors[0:4] = np.nan
+    index.vectors[6:7] = np.nan
+    hits = index.search(vectors[1], k=5)
+    assert [row for row, _ in hits] == [5, 4]
+    assert hits[0][1] == pytest.approx(1.0, abs=1e-5)
+
+class SlowEmbedder(HashingEmbedder):
+    def __init__(self, delay: float):
+        super().__init__(dimension=16)
+        self.delay = delay
+
+    def embed_documents(self, texts):
+        time.sleep(self.delay)
+        return super().embed_documents(texts)
+
+def make_doc_index():
+    texts = ["refund policy terms", "shipping times", "warranty", "contact", "refund window is 30 days",
+             "returns", "governing law"]
+    chunks = [Chunk(f"c{i}", text, page, 0, len(text)) for i, (text, page) in enumerate(zip(texts, PAGES))]
+    return DocumentIndex("doc", ChunkStore.from_chunks("doc", chunks), KeywordIndex.build(texts), make_index())
+
+def test_question_ranges_are_embedded_within_their_budget(index_dir, monkeypatch):
+    monkeypatch.setattr(lazy_index, "get_embedder", lambda: SlowEmbedder(0.0))
+    doc_index = make_doc_index()
+    assert lazily_indexed(doc_index)
+    assert asyncio.run(index_ranges_within_budget(doc_index, "refund", budget_ms=5000))
+    # Keyword hits for "refund" are on pages 1 and 21
+    assert doc_index.vector_index.ranges[:, RANGE_FILLED].tolist() == [1, 1, 0, 1]
+
+def test_overrun_keeps_embedding_in_the_background(index_dir, monkeypatch):
+    monkeypatch.setattr(lazy_index, "get_embedder", lambda: SlowEmbedder(0.3))
+    doc_index = make_doc_index()
+
+    async def scenario():
+        assert not await index_ranges_within_budget(doc_index, "governing law", budget_ms=20)
+        assert doc_index.vector_index.filled_count == 1
+        await asyncio.sleep(0.6)
+        assert doc_index.vector_index.ranges[2, RANGE_FILLED] == 1
+    asyncio.run(scenario())
@@ -0,0 +1,186 @@
+"""
+Coalescing of identical in-flight OpenRouter requests: callers share one
+upstream call, a caller going away leaves it running for the others, and the
+last caller going away cancels it.
+"""
+import asyncio
+
+from app.openrouter_client import OpenRouterClient
+
+MESSAGES = [{"role": "user", "content": "What is the refund policy?"}]
+
+class FakeUpstream(OpenRouterClient):
+    """
+    Client whose upstream calls wait for release() instead of calling OpenRouter
+    Streams also stop before chunk pause_at until resume()
+    """
+    def __init__(self, chunks=("The ", "refund ", "window ", "is ", "30 days."), pause_at=None):
+        super().__init__("test-key")
+        self.chunks = list(chunks)
+        self.calls = 0
+        self.cancelled = 0
+        self.started = asyncio.Event()
+        self.released = asyncio.Event()
+        self.pause_at = pause_at
+        self.resumed = asyncio.Event()
+
+    def release(self):
+        self.released.set()
+
+    def resume(self):
+        self.resumed.set()
+
+    async def _chat_completion(self, data):
+        self.calls += 1
+        self.started.set()
+        try:
+            await self.released.wait()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return "".join(self.chunks)
+
+    async def _stream_chat_completion(self, data):
+        self.calls += 1
+        self.started.set()
+        try:
+            await self.released.wait()
+            for position, chunk in enumerate(self.chunks):
+                if position == self.pause_at:
+                    await self.resumed.wait()
+                yield chunk
+        except (asyncio.CancelledError, GeneratorExit):
+            self.cancelled += 1
+            raise
+
+async def settle():
+    """Let every runnable task reach its next await"""
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+async def collect(client: OpenRouterClient) -> str:
+    return "".join([chunk async for chunk in client.stream_chat_completion(MESSAGES)])
+
+def test_identical_requests_share_one_call():
+    async def scenario():
+        client = FakeUpstream()
+        waiters = [asyncio.create_task(client.chat_completion(MESSAGES)) for _ in range(5)]
+        await settle()
+        client.release()
+        results = await asyncio.gather(*waiters)
+        assert results == ["The refund window is 30 days."] * 5
+        assert client.calls == 1
+        assert client.coalesced_requests == 4
+        assert not client._completions
+    asyncio.run(scenario())
+
+def test_different_requests_are_not_coalesced():
+    async def scenario():
+        client = FakeUpstream()
+        client.release()
+        await asyncio.gather(client.chat_completion(MESSAGES), client.chat_completion(MESSAGES, temperature=0.0))
+        assert client.calls == 2
+    asyncio.run(scenario())
+
+def test_cancelling_one_waiter_keeps_the_call_for_the_others():
+    async def scenario():
+        client = FakeUpstream()
+        leaving = asyncio.create_task(client.chat_completion(MESSAGES))
+        staying = asyncio.create_task(client.chat_completion(MESSAGES))
+        await client.started.wait()
+        leaving.cancel()
+        await settle()
+        assert leaving.cancelled()
+        client.release()
+        assert await staying == "The refund window is 30 days."
+        assert client.calls == 1
+        assert client.cancelled == 0
+    asyncio.run(scenario())
+
+def test_cancelling_the_last_waiter_cancels_the_call():
+    async def scenario():
+        client = FakeUpstream()
+        waiters = [asyncio.create_task(client.chat_completion(MESSAGES)) for _ in range(2)]
+        await client.started.wait()
+        for waiter in waiters:
+            waiter.cancel()
+        await settle()
+        assert client.cancelled == 1
+        assert not client._completions
+        # The next identical request starts a fresh call instead of joining the cancelled one
+        client.release()
+        assert await client.chat_completion(MESSAGES) == "The refund window is 30 days."
+        assert client.calls == 2
+    asyncio.run(scenario())
+
+def test_stream_is_fanned_out_to_every_waiter():
+    async def scenario():
+        client = FakeUpstream(pause_at=2)
+        early = [asyncio.create_task(collect(client)) for _ in range(2)]
+        await client.started.wait()
+        client.release()
+        await settle()
+        # Joins after two chunks were delivered - still receives the whole answer
+        late = asyncio.create_task(collect(client))
+        await settle()
+        client.resume()
+        results = await asyncio.gather(*early, late)
+        assert results == ["The refund window is 30 days."] * 3
+        assert client.calls == 1
+    asyncio.run(scenario())
+
+def test_stream_waiter_leaving_keeps_the_stream_for_the_others():
+    async def scenario():
+        client = FakeUpstream()
+        leaving = asyncio.create_task(collect(client))
+        staying = asyncio.create_task(collect(client))
+        await client.started.wait()
+        leaving.cancel()
+        await settle()
+        client.release()
+        assert await staying == "The refund window is 30 days."
+        assert client.cancelled == 0
+    asyncio.run(scenario())
+
+def test_stream_waiter_stopping_early_keeps_the_stream_for_the_others():
+    async def scenario():
+        client = FakeUpstream()
+        client.release()
+
+        async def first_chunk():
+            async for chunk in client.stream_chat_completion(MESSAGES):
+                return chunk
+
+        first, full = await asyncio.gather(first_chunk(), collect(client))
+        assert first == "The "
+        assert full == "The refund window is 30 days."
+        assert client.calls == 1
+        assert client.cancelled == 0
+    asyncio.run(scenario())
+
+def test_last_stream_waiter_leaving_cancels_the_stream():
+    async def scenario():
+        client = FakeUpstream()
+        waiters = [asyncio.create_task(collect(client)) for _ in range(2)]
+        await client.started.wait()
+        for waiter in waiters:
+            waiter.cancel()
+        await settle()
+        assert client.cancelled == 1
+        assert not client._streams
+    asyncio.run(scenario())
+
+def test_upstream_error_reaches_every_stream_waiter():
+    async def scenario():
+        client = FakeUpstream()
+
+        async def failing(data):
+            client.calls += 1
+            yield "partial "
+            raise RuntimeError("upstream closed the connection")
+
+        client._stream_chat_completion = failing
+        results = await asyncio.gather(collect(client), collect(client), return_exceptions=True)
+        assert all(isinstance(result, RuntimeError) for result in results)
+        assert client.calls == 1
+    asyncio.run(scenario())
@@ -0,0 +1,44 @@
+"""
+Parallel PDF extraction yields the same pages, in the same order, as serial
+extraction, and small documents never reach the process pool.
+"""
+import fitz  # PyMuPDF
+import pytest
+
+from app import pdf_extraction
+from app.pdf_extraction import extract_pages, iter_pages, page_ranges, shutdown_extraction_pool
+
+PAGES = 23
+
+@pytest.fixture(scope="module")
+def pdf_path(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("pdfs") / "numbered.pdf")
+    doc = fitz.open()
+    for page_num in range(PAGES):
+        page = doc.new_page()
+        page.insert_text((72, 72), f"Page {page_num + 1} of the extraction test")
+        if page_num % 5 == 0:
+            page.insert_textbox(fitz.Rect(72, 100, 540, 700), "Longer page. " * 200, fontsize=9)
+    doc.save(path)
+    doc.close()
+    yield path
+    shutdown_extraction_pool()
+
+def test_page_ranges_cover_every_page_once():
+    ranges = page_ranges(PAGES, workers=2)
+    assert ranges[0][0] == 0 and ranges[-1][1] == PAGES
+    assert all(end == next_start for (_, end), (next_start, _) in zip(ranges, ranges[1:]))
+
+def test_parallel_extraction_matches_serial(pdf_path):
+    serial = extract_pages(pdf_path, workers=1)
+    assert len(serial) == PAGES
+    assert all(f"Page {n + 1} of" in text for n, text in enumerate(serial))
+    assert extract_pages(pdf_path, workers=2, threshold=0) == serial
+
+def test_small_documents_are_extracted_in_process(pdf_path, monkeypatch):
+    def no_pool(workers):
+        raise AssertionError("process pool used below the page threshold")
+
+    monkeypatch.setattr(pdf_extraction, "_get_pool", no_pool)
+    pages = list(iter_pages(pdf_path, workers=4, threshold=PAGES + 1))
+    assert pages == extract_pages(pdf_path, workers=1)
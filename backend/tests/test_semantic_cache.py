@@ -0,0 +1,79 @@
+"""
+Semantic answer cache: paraphrases share an answer, questions asking something
+different about the same words do not, and documents forget questions by policy.
+"""
+import pytest
+
+from app import semantic_cache as semantic_cache_module
+from app.answer_cache import CachedAnswer
+from app.embedders import HashingEmbedder
+from app.semantic_cache import SemanticAnswerCache, question_form
+
+@pytest.fixture(autouse=True)
+def fixed_documents(monkeypatch):
+    monkeypatch.setattr(semantic_cache_module.content_registry, "resolve", lambda document_id: document_id)
+    monkeypatch.setattr(semantic_cache_module, "document_version", lambda document_id: "v1")
+
+class ParaphraseEmbedder(HashingEmbedder):
+    """Hashing embedder standing in for a semantic one"""
+    paraphrases = True
+
+def answer(text: str) -> CachedAnswer:
+    return CachedAnswer(text, [], "keyword")
+
+def test_disabled_by_default_and_for_word_based_embedders():
+    assert not SemanticAnswerCache().enabled
+    cache = SemanticAnswerCache(enabled=True)
+    assert not cache.supports(HashingEmbedder())
+    assert not cache.supports(None)
+    assert cache.supports(ParaphraseEmbedder())
+
+def test_question_form():
+    assert question_form("When was the contract signed?") == "when"
+    assert question_form("Who signed it, and why?") == "who why"
+    assert question_form("Summarize the contract") == ""
+
+def test_paraphrase_hits():
+    embedder = ParaphraseEmbedder()
+    cache = SemanticAnswerCache(enabled=True, threshold=0.9)
+    question = "When was the contract signed?"
+    cache.put("doc", question, embedder.embed_query(question), answer("March 3rd"))
+    paraphrase = "when was the contract signed"
+    assert cache.get("doc", paraphrase, embedder.embed_query(paraphrase)).response == "March 3rd"
+    assert cache.get("other", paraphrase, embedder.embed_query(paraphrase)) is None
+
+def test_wh_variants_do_not_hit_each_other():
+    embedder = ParaphraseEmbedder()
+    cache = SemanticAnswerCache(enabled=True, threshold=0.9)
+    questions = {
+        "When was the contract signed?": "March 3rd",
+        "Where was the contract signed?": "In Berlin",
+        "Why was the contract signed?": "To settle the dispute",
+        "Who signed the contract?": "Both directors",
+    }
+    for question, text in questions.items():
+        # The hashing embedder drops interrogatives, so these vectors are identical
+        cache.put("doc", question, embedder.embed_query(question), answer(text))
+    assert cache.stats()["questions"] == len(questions)
+    for question, text in questions.items():
+        assert cache.get("doc", question, embedder.embed_query(question)).response == text
+
+def test_full_document_evicts_least_recently_used():
+    embedder = ParaphraseEmbedder()
+    cache = SemanticAnswerCache(enabled=True, threshold=0.9, per_document=2)
+    first, second, third = "What is the refund window?", "What is the notice period?", "What is the governing law?"
+    cache.put("doc", first, embedder.embed_query(first), answer("30 days"))
+    cache.put("doc", second, embedder.embed_query(second), answer("2 months"))
+    assert cache.get("doc", first, embedder.embed_query(first)) is not None
+    cache.put("doc", third, embedder.embed_query(third), answer("Germany"))
+    assert cache.get("doc", second, embedder.embed_query(second)) is None
+    assert cache.get("doc", first, embedder.embed_query(first)).response == "30 days"
+    assert cache.stats()["evictions"] == 1
+
+def test_invalidate_forgets_the_document():
+    embedder = ParaphraseEmbedder()
+    cache = SemanticAnswerCache(enabled=True)
+    question = "What is the refund window?"
+    cache.put("doc", question, embedder.embed_query(question), answer("30 days"))
+    cache.invalidate("doc")
+    assert cache.get("doc", question, embedder.embed_query(question)) is None
@@ -0,0 +1,88 @@
+"""
+Storage collector: deleted documents are purged without taking content another
+document still uses, and the sweep only removes orphans older than its age guard.
+"""
+import os
+import time
+import uuid
+
+import pytest
+
+from app.content_registry import content_registry
+from app.database import init_db
+from app.storage_gc import StorageCollector
+from app.upload_stream import UPLOAD_DIR, content_path, content_storage_key
+
+HOUR = 3600
+
+@pytest.fixture
+def collector(index_dir):
+    init_db()
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    return StorageCollector(batch_size=50, sweep_interval=0, orphan_min_age=HOUR)
+
+def touch(path, age: float = 0.0) -> str:
+    with open(path, 'wb') as f:
+        f.write(b"%PDF-1.4")
+    modified = time.time() - age
+    os.utime(path, (modified, modified))
+    return path
+
+def index_file(index_dir, document_id: str, suffix: str = "chunks", age: float = 0.0) -> str:
+    return touch(os.path.join(index_dir, f"doc_{document_id}.{suffix}"), age)
+
+def upload(content_hash: str, user_id: str) -> str:
+    document_id = str(uuid.uuid4())
+    content_registry.register_upload(content_hash, document_id, user_id, "shared.pdf", 8,
+                                     content_storage_key(content_hash), None)
+    return document_id
+
+def test_shared_content_survives_until_its_last_document_is_purged(collector, index_dir):
+    content_hash = uuid.uuid4().hex * 2
+    first = upload(content_hash, "alice")
+    second = upload(content_hash, "bob")
+    content_registry.mark_ready(content_hash, page_count=1, text_length=8, chunk_count=1)
+    stored_pdf = touch(content_path(content_hash))
+    chunk_file = index_file(index_dir, first)
+
+    assert content_registry.tombstone_document(first, "alice")
+    assert collector.collect_batch() == 1
+    assert collector.contents_removed == 0
+    assert os.path.exists(stored_pdf) and os.path.exists(chunk_file)
+    assert content_registry.resolve(second) == first
+
+    assert content_registry.tombstone_document(second, "bob")
+    assert collector.collect_batch() == 1
+    assert collector.contents_removed == 1
+    assert not os.path.exists(stored_pdf) and not os.path.exists(chunk_file)
+    assert collector.collect_batch() == 0
+
+def test_sweep_only_removes_old_orphans(collector, index_dir):
+    live = upload(uuid.uuid4().hex * 2, "alice")
+    unknown = str(uuid.uuid4())
+    fresh_orphan = index_file(index_dir, unknown, "chunks")
+    old_orphan = index_file(index_dir, unknown, "vectors.npy", age=2 * HOUR)
+    live_store = index_file(index_dir, live, "chunks", age=2 * HOUR)
+    abandoned_write = index_file(index_dir, live, "chunks.tmp", age=2 * HOUR)
+    fresh_part = touch(os.path.join(UPLOAD_DIR, f".upload-{uuid.uuid4().hex}.part"))
+    old_part = touch(os.path.join(UPLOAD_DIR, f".upload-{uuid.uuid4().hex}.part"), age=2 * HOUR)
+    old_content = touch(content_path(uuid.uuid4().hex * 2), age=2 * HOUR)
+
+    collector.sweep()
+    assert os.path.exists(fresh_orphan) and os.path.exists(fresh_part)
+    assert os.path.exists(live_store)
+    assert not os.path.exists(old_orphan)
+    assert not os.path.exists(abandoned_write)
+    assert not os.path.exists(old_part)
+    assert not os.path.exists(old_content)
+    assert collector.orphans_removed == 4
+
+def test_documents_stored_before_the_registry_are_live(collector, index_dir):
+    document_id = str(uuid.uuid4())
+    # documents/{user_id}/{document_id}.pdf, flattened locally; user ids may contain "_"
+    touch(os.path.join(UPLOAD_DIR, f"documents_legacy_user_{document_id}.pdf"))
+    legacy_store = index_file(index_dir, document_id, "json", age=2 * HOUR)
+
+    assert document_id in collector._live_document_ids()
+    collector.sweep()
+    assert os.path.exists(legacy_store)
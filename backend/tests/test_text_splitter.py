@@ -0,0 +1,64 @@
+"""
+RecursiveTextSplitter must produce exactly the chunks of LangChain's
+RecursiveCharacterTextSplitter, which it replaced in ingestion: chunk
+boundaries decide chunk ids, stored offsets and retrieval results.
+"""
+import random
+
+import pytest
+
+try:
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+except ImportError:
+    text_splitter = pytest.importorskip("langchain.text_splitter", reason="needs LangChain's splitter as the reference")
+    RecursiveCharacterTextSplitter = text_splitter.RecursiveCharacterTextSplitter
+
+from app.text_splitter import RecursiveTextSplitter
+
+SETTINGS = [(500, 50), (100, 20), (50, 0), (20, 19), (10, 3), (1000, 200), (1, 0), (3, 1)]
+SEPARATOR_SETS = [None, ["\n\n", "\n", " "], ["\n", ". ", " ", ""], ["x"]]
+CASES_PER_SETTING = 60
+
+WORDS = ["the", "contract", "payment", "terms", "section", "liability", "warranty", "notice",
+         "clause", "party", "a", "of", "and", "to", "Überweisung", "契約", "naïve", "x"]
+BREAKS = [" ", " ", " ", " ", "  ", "\n", "\n\n", "\n\n\n", "\t", " \n ", "\r\n", " ", "　", ". "]
+
+def random_text(rng: random.Random, max_tokens: int) -> str:
+    """Paragraphs, line breaks, runs of whitespace, unicode spaces and words longer than a chunk"""
+    parts = []
+    for _ in range(rng.randint(0, max_tokens)):
+        if rng.random() < 0.01:
+            # A "word" longer than any chunk, e.g. a URL or a table flattened without spaces
+            parts.append("".join(rng.choices("abcdefghij0123456789/-_", k=rng.randint(50, 1500))))
+        else:
+            parts.append(rng.choice(WORDS))
+        parts.append(rng.choice(BREAKS))
+    text = "".join(parts)
+    if rng.random() < 0.1:
+        text = rng.choice(BREAKS) * rng.randint(1, 5) + text
+    return text
+
+@pytest.mark.parametrize("separators", SEPARATOR_SETS)
+@pytest.mark.parametrize("chunk_size,chunk_overlap", SETTINGS)
+def test_matches_langchain_splitter(chunk_size, chunk_overlap, separators):
+    rng = random.Random(f"{chunk_size}/{chunk_overlap}/{separators}")
+    reference = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+                                               separators=separators)
+    splitter = RecursiveTextSplitter(chunk_size, chunk_overlap, *([separators] if separators else []))
+    for _ in range(CASES_PER_SETTING):
+        text = random_text(rng, rng.choice([5, 50, 400]))
+        assert splitter.split_text(text) == reference.split_text(text), repr(text[:200])
+
+def test_spans_slice_back_to_chunks():
+    rng = random.Random(7)
+    splitter = RecursiveTextSplitter(100, 20)
+    for _ in range(200):
+        text = random_text(rng, 200)
+        spans = splitter.split_spans(text)
+        assert [text[start:end] for start, end in spans] == splitter.split_text(text)
+        assert all(0 <= start < end <= len(text) for start, end in spans)
+
+@pytest.mark.parametrize("chunk_size,chunk_overlap", [(0, 0), (-1, 0), (10, -1)])
+def test_rejects_invalid_settings(chunk_size, chunk_overlap):
+    with pytest.raises(ValueError):
+        RecursiveTextSplitter(chunk_size, chunk_overlap)
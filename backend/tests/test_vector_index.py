@@ -0,0 +1,43 @@
+"""
+NumPy vector index: float16 indexes rank like float32 ones, and blocked
+scoring of float16 matrices matches scoring them whole.
+"""
+import numpy as np
+import pytest
+
+from app import vector_index
+from app.vector_index import load_vector_index, save_vector_index
+
+@pytest.fixture
+def vectors():
+    rng = np.random.default_rng(3)
+    return rng.standard_normal((500, 64)).astype(np.float32), rng.standard_normal((20, 64)).astype(np.float32)
+
+def test_float16_and_float32_indexes_return_the_same_top_k(index_dir, vectors):
+    matrix, queries = vectors
+    save_vector_index("f32", matrix, dtype=np.float32)
+    save_vector_index("f16", matrix, dtype=np.float16)
+    full, half = load_vector_index("f32"), load_vector_index("f16")
+    assert half.vectors.dtype == np.float16
+    for query in queries:
+        expected, found = full.search(query, k=5), half.search(query, k=5)
+        assert [row for row, _ in found] == [row for row, _ in expected]
+        assert [score for _, score in found] == pytest.approx([score for _, score in expected], abs=1e-3)
+
+def test_blocked_float16_scores_match_whole_matrix_scores(index_dir, vectors, monkeypatch):
+    matrix, queries = vectors
+    save_vector_index("f16", matrix, dtype=np.float16)
+    index = load_vector_index("f16")
+    whole = index.scores(queries[0])
+    # 7 rows of 64 float32 values per block - the last block is partial
+    monkeypatch.setattr(vector_index, "VECTOR_SEARCH_BLOCK_BYTES", 7 * 64 * 4)
+    np.testing.assert_allclose(index.scores(queries[0]), whole, rtol=1e-5)
+    np.testing.assert_allclose(index.scores(queries[0], 10, 33), whole[10:33], rtol=1e-5)
+
+def test_zero_vectors_score_zero(index_dir):
+    matrix = np.zeros((3, 8), dtype=np.float32)
+    matrix[1, 0] = 1.0
+    save_vector_index("sparse", matrix)
+    index = load_vector_index("sparse")
+    assert index.search(np.eye(8, dtype=np.float32)[0], k=3)[0] == (1, pytest.approx(1.0))
+    assert index.scores(np.eye(8, dtype=np.float32)[1]).tolist() == [0.0, 0.0, 0.0]